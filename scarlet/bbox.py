@@ -252,3 +252,326 @@ class Box:
 
     def __eq__(self, other):
         return self.shape == other.shape and self.origin == other.origin
+
+
+class BoxArray:
+    """Bounding boxes of many objects
+
+    Array-backed counterpart of `Box` to intersect, join, clip, and slice many
+    boxes of the same dimensionality at once. Operations with a `Box` apply it
+    to every box, e.g. `boxes & frame` clips all boxes to the model frame;
+    operations with another `BoxArray` of the same length work box by box.
+    Indexing returns a `Box` for integers and a `BoxArray` otherwise.
+
+    Parameters
+    ----------
+    shape: array-like
+        (N, D) sizes of the boxes
+    origin: array-like
+        (N, D) minimum corner coordinates of the boxes
+    """
+
+    def __init__(self, shape, origin=None):
+        self.shape = np.asarray(shape, dtype=int)
+        assert self.shape.ndim == 2
+        if origin is None:
+            origin = np.zeros_like(self.shape)
+        self.origin = np.asarray(origin, dtype=int)
+        assert self.origin.shape == self.shape.shape
+
+    @staticmethod
+    def from_boxes(boxes, D=None):
+        """Initialize from a list of `Box`
+
+        Parameters
+        ----------
+        boxes: list of `Box`
+            Boxes of the same dimensionality
+        D: int
+            Dimensionality, needed if `boxes` is empty
+
+        Returns
+        -------
+        boxes: `BoxArray`
+        """
+        if not len(boxes):
+            return BoxArray(np.zeros((0, D or 0), dtype=int))
+        return BoxArray([box.shape for box in boxes], [box.origin for box in boxes])
+
+    @staticmethod
+    def from_bounds(start, stop):
+        """Initialize from the start and stop coordinates of every box
+
+        Parameters
+        ----------
+        start, stop: array-like
+            (N, D) minimum and maximum coordinates, boxes with `stop < start`
+            are empty
+
+        Returns
+        -------
+        boxes: `BoxArray`
+        """
+        start, stop = np.asarray(start, dtype=int), np.asarray(stop, dtype=int)
+        return BoxArray(np.maximum(stop - start, 0), start)
+
+    def __len__(self):
+        return len(self.shape)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return Box(self.shape[index].tolist(), origin=self.origin[index].tolist())
+        return BoxArray(self.shape[index], self.origin[index])
+
+    def __iter__(self):
+        for shape, origin in zip(self.shape.tolist(), self.origin.tolist()):
+            yield Box(shape, origin=origin)
+
+    @property
+    def D(self):
+        """Dimensionality of the boxes
+        """
+        return self.shape.shape[1]
+
+    @property
+    def start(self):
+        """(N, D) array of start coordinates
+        """
+        return self.origin
+
+    @property
+    def stop(self):
+        """(N, D) array of stop coordinates
+        """
+        return self.origin + self.shape
+
+    @property
+    def size(self):
+        """Number of elements in every box
+        """
+        return np.prod(self.shape, axis=1)
+
+    @staticmethod
+    def _get_bounds(other):
+        if isinstance(other, BoxArray):
+            return other.start, other.stop
+        return np.array(other.start, dtype=int), np.array(other.stop, dtype=int)
+
+    def __and__(self, other):
+        """Intersection of the boxes with a `Box` or box by box with a `BoxArray`
+
+        Boxes without overlap have zero size, see `Box.__and__`.
+        """
+        start, stop = self._get_bounds(other)
+        assert start.shape[-1] == self.D
+        return BoxArray.from_bounds(
+            np.maximum(self.start, start), np.minimum(self.stop, stop)
+        )
+
+    def __or__(self, other):
+        """Smallest boxes that contain the boxes and a `Box` or a `BoxArray`
+        """
+        start, stop = self._get_bounds(other)
+        assert start.shape[-1] == self.D
+        return BoxArray.from_bounds(
+            np.minimum(self.start, start), np.maximum(self.stop, stop)
+        )
+
+    def __iadd__(self, offset):
+        self.origin = self.origin + np.asarray(offset, dtype=int)
+        return self
+
+    def __isub__(self, offset):
+        self.origin = self.origin - np.asarray(offset, dtype=int)
+        return self
+
+    def __eq__(self, other):
+        """Whether every box is equal to a `Box` or to the boxes of a `BoxArray`
+        """
+        start, stop = self._get_bounds(other)
+        return ((self.start == start) & (self.stop == stop)).all(axis=-1)
+
+    def __repr__(self):
+        return "<BoxArray of {} boxes with {} dimensions>".format(len(self), self.D)
+
+    def contains(self, p):
+        """Whether the boxes contain the coordinate `p`
+
+        Parameters
+        ----------
+        p: array-like
+            Coordinate for all boxes, or (N, D) coordinates for every box
+
+        Returns
+        -------
+        contained: array
+            Boolean for every box
+        """
+        p = np.asarray(p)
+        assert p.shape[-1] == self.D
+        return ((p >= self.start) & (p < self.stop)).all(axis=-1)
+
+    def overlaps(self, other):
+        """Whether the boxes have a non-empty overlap with `other`
+
+        Parameters
+        ----------
+        other: `Box` or `BoxArray`
+
+        Returns
+        -------
+        overlapping: array
+            Boolean for every box
+        """
+        return (self & other).size > 0
+
+    def slices_for(self, im_or_shape):
+        """Slices for `im_or_shape` to be limited to every bounding box
+
+        Parameters
+        ----------
+        im_or_shape: array or tuple
+            Array or shape of the array to be sliced
+
+        Returns
+        -------
+        slices: list
+            Tuple of slices for every box, see `Box.slices_for`
+        """
+        if hasattr(im_or_shape, "shape"):
+            shape = im_or_shape.shape
+        else:
+            shape = im_or_shape
+        assert len(shape) == self.D
+
+        overlap = self & Box(shape)
+        start, stop = overlap.start.tolist(), overlap.stop.tolist()
+        return [tuple(map(slice, a, b)) for a, b in zip(start, stop)]
+
+
+class BoxIndex:
+    """Spatial index of the boxes of many objects
+
+    The index is a uniform grid in the last two (spatial) dimensions. Every box
+    is registered in the grid cells it covers, so that a query only compares
+    the boxes in the cells of the query region instead of all boxes.
+    For cells comparable to the typical box, a query takes constant time
+    per box found.
+
+    Parameters
+    ----------
+    cell_size: int
+        Height and width of the grid cells
+    """
+
+    def __init__(self, cell_size=32):
+        self.cell_size = max(int(cell_size), 1)
+        self._bounds = {}
+        self._cells = {}
+
+    def __len__(self):
+        return len(self._bounds)
+
+    def __contains__(self, key):
+        return key in self._bounds
+
+    def _get_cells(self, start, stop):
+        n = self.cell_size
+        return [
+            (y, x)
+            for y in range(start[-2] // n, -(-stop[-2] // n))
+            for x in range(start[-1] // n, -(-stop[-1] // n))
+        ]
+
+    def insert(self, key, box):
+        """Add or move the box of `key`
+
+        Parameters
+        ----------
+        key: hashable
+            Identifier of the box, e.g. the object it belongs to
+        box: `Box`
+            Bounding box of `key`
+        """
+        if key in self._bounds:
+            self.remove(key)
+        bounds = (box.start, box.stop)
+        self._bounds[key] = bounds
+        for cell in self._get_cells(*bounds):
+            self._cells.setdefault(cell, {})[key] = None
+
+    def remove(self, key):
+        """Remove the box of `key` from the index
+        """
+        bounds = self._bounds.pop(key)
+        for cell in self._get_cells(*bounds):
+            members = self._cells[cell]
+            del members[key]
+            if not members:
+                del self._cells[cell]
+
+    @staticmethod
+    def _overlap(bounds, other):
+        return all(max(a, c) < min(b, d) for a, b, c, d in zip(*bounds, *other))
+
+    def query(self, box):
+        """Keys of all boxes that overlap with `box`
+
+        Parameters
+        ----------
+        box: `Box`
+            Query region
+
+        Returns
+        -------
+        keys: list
+            Keys in no particular order
+        """
+        bounds = (box.start, box.stop)
+        found = {}
+        for cell in self._get_cells(*bounds):
+            for key in self._cells.get(cell, ()):
+                if key not in found:
+                    found[key] = self._overlap(bounds, self._bounds[key])
+        return [key for key, overlaps in found.items() if overlaps]
+
+    def get_pairs(self):
+        """All pairs of keys whose boxes overlap
+
+        Returns
+        -------
+        pairs: list
+            Tuples of two different keys, every pair is listed once
+        """
+        keys = list(self._bounds)
+        position = {key: k for k, key in enumerate(keys)}
+        start = np.array([self._bounds[key][0] for key in keys], dtype=int)
+        stop = np.array([self._bounds[key][1] for key in keys], dtype=int)
+
+        # candidates are all pairs that share a cell: members are grouped by
+        # cell, so pairs are members at distance d with the same cell
+        cell, member = [], []
+        for k, members in enumerate(self._cells.values()):
+            cell += [k] * len(members)
+            member += [position[key] for key in members]
+        cell, member = np.array(cell, dtype=int), np.array(member, dtype=int)
+        max_members = max([len(members) for members in self._cells.values()] + [0])
+        first, second, cells = [], [], []
+        for d in range(1, max_members):
+            same = cell[:-d] == cell[d:]
+            first.append(member[:-d][same])
+            second.append(member[d:][same])
+            cells.append(cell[:-d][same])
+        if not len(first):
+            return []
+        first, second = np.concatenate(first), np.concatenate(second)
+        cells = np.array(list(self._cells), dtype=int)[np.concatenate(cells)]
+
+        lower = np.maximum(start[first], start[second])
+        upper = np.minimum(stop[first], stop[second])
+        # count every pair only in the cell of the lower corner of their overlap
+        select = (lower < upper).all(axis=1)
+        select &= (lower[:, -2:] // self.cell_size == cells).all(axis=1)
+        first = map(keys.__getitem__, first[select].tolist())
+        second = map(keys.__getitem__, second[select].tolist())
+        return list(zip(first, second))
@@ -1,10 +1,63 @@
-import numpy.ma as ma
 import autograd.numpy as np
-from autograd import grad
+from autograd import grad, value_and_grad
+from autograd.extend import primitive, defvjp_argnums
 import proxmin
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
+import time
 
-from .component import ComponentTree
+from .bbox import Box
+from .component import ComponentTree, FactorizedComponent
+from .constraint import PositivityConstraint
+from .observation import LowResObservation
+from . import optimizer
+from .multiresolution import downsample_blend, upsample_blend
+from .parameter import ParameterBuffer
+from .source import build_detection_coadd, find_peaks
+
+
+@primitive
+def _parallel_loss(
+    model, *footprints, observations, use_footprints, boxes, background, executor, gradients
+):
+    """Total loss for all `observations`, evaluated concurrently
+
+    Every observation computes its loss and the gradients with respect to
+    `model` (the full model) or `footprints` (the component models in `boxes`)
+    in a thread of `executor`. The gradients are summed in the order of
+    `observations` and stored in `gradients` by argument position for the
+    backward pass.
+    """
+
+    def loss(observation, use):
+        if use:
+            return value_and_grad(
+                lambda models: observation.get_loss(
+                    list(zip(models, boxes)), background=background
+                )
+            )(list(footprints))
+        return value_and_grad(
+            lambda model: observation.get_loss(model, background=background)
+        )(model)
+
+    results = list(executor.map(loss, observations, use_footprints))
+    total_loss = 0
+    for (value, gradient), use in zip(results, use_footprints):
+        total_loss = total_loss + value
+        if use:
+            for k, g in enumerate(gradient):
+                gradients[k + 1] = gradients.get(k + 1, 0) + g
+        else:
+            gradients[0] = gradients.get(0, 0) + gradient
+    return total_loss
+
+
+def _parallel_loss_vjp(argnums, ans, args, kwargs):
+    gradients = kwargs["gradients"]
+    return lambda g: tuple(g * gradients[argnum] for argnum in argnums)
+
+
+defvjp_argnums(_parallel_loss, _parallel_loss_vjp)
 
 
 class Blend(ComponentTree):
@@ -18,6 +71,15 @@ class Blend(ComponentTree):
     ----------
     mse: list
         Array of mean squared errors in each iteration
+    stop_reason: str
+        Why the last fit stopped: "converged", "max_iter", "time_budget", or
+        "pixel_budget"
+    diagnostics: dict
+        State of the last fit when it stopped: the number of `iterations` at
+        full resolution, its duration in `seconds`, the number of
+        `pixel_iterations` at all resolutions, the relative change of the loss
+        in the last iteration `rel_change`, and the convergence criterion
+        `e_rel`
     """
 
     def __init__(self, sources, observations):
@@ -40,8 +102,61 @@ class Blend(ComponentTree):
             observations = (observations,)
         self.observations = observations
         self.loss = []
+        self._executor = None
+        self._linear_seds = []
+        self._budget = None
+        self.stop_reason = None
+        self.diagnostics = {}
+        # boxes of the components added or removed since the last fit,
+        # `None` if all components are new
+        self._changed_boxes = None
+
+    def __iadd__(self, c):
+        ComponentTree.__iadd__(self, c)
+        if getattr(self, "_changed_boxes", None) is not None:
+            self._changed_boxes += self._get_boxes(c)
+        return self
+
+    def __isub__(self, c):
+        boxes = self._get_boxes(c)
+        ComponentTree.__isub__(self, c)
+        if getattr(self, "_changed_boxes", None) is not None:
+            self._changed_boxes += boxes
+        return self
+
+    def _get_boxes(self, c):
+        components = c.components if isinstance(c, ComponentTree) else (c,)
+        return [self.frame if c_.bbox is None else c_.bbox for c_ in components]
 
-    def fit(self, max_iter=200, e_rel=1e-3, **alg_kwargs):
+    def _get_changed_components(self):
+        """Components that overlap with those added or removed since the last fit
+
+        Returns
+        -------
+        components: list
+            All components if the blend has not been fit yet
+        """
+        if getattr(self, "_changed_boxes", None) is None:
+            return list(self.components)
+        changed = {}
+        for box in self._changed_boxes:
+            for c in self.components_in(box):
+                changed[id(c)] = c
+        return list(changed.values())
+
+    def fit(
+        self,
+        max_iter=200,
+        e_rel=1e-3,
+        n_threads=1,
+        exact_seds=False,
+        multiresolution=None,
+        time_budget=None,
+        pixel_budget=None,
+        moment_dtype=np.float64,
+        local=False,
+        **alg_kwargs
+    ):
         """Fit the model for each source to the data
 
         Parameters
@@ -50,12 +165,192 @@ class Blend(ComponentTree):
             Maximum number of iterations if the algorithm doesn't converge
         e_rel: float
             Relative error for convergence of the loss function
+        n_threads: int
+            Number of threads to evaluate the loss of multiple observations
+            concurrently. This only helps if their rendering releases the GIL,
+            e.g. in FFTs or matrix products.
+        exact_seds: bool
+            Whether to solve for the SEDs of all
+            `~scarlet.component.FactorizedComponent`s exactly in every
+            iteration, alternating with gradient steps for all other
+            parameters. See `update_seds` for details.
+        multiresolution: list of int
+            Binning factors, e.g. `(4, 2)`, of coarser versions of the model
+            frame and the observations. The blend is first fit at each of them,
+            from the coarsest to the finest, and every fit warm-starts the
+            next one, before the fit at full resolution.
+            See `~scarlet.multiresolution.downsample_blend` for details.
+        time_budget: float
+            Maximum duration of the fit in seconds
+        pixel_budget: int
+            Maximum number of pixel-iterations of the fit. Every iteration
+            costs the number of pixels in the bounding boxes of all free
+            components.
+        moment_dtype: dtype
+            Type in which the optimizer moments `m`, `v`, and `vhat` of the
+            parameters are stored after the fit, for warm starts and
+            `~scarlet.Parameter.std`. They are accumulated in double precision
+            during the fit. `None` drops them, e.g. if the blend is only kept
+            for measurements.
+        local: bool
+            Whether to only fit the components that overlap with the
+            components added or removed since the last fit, and to hold all
+            others fixed. Cannot be combined with `multiresolution`.
         alg_kwargs: dict
-            Keywords for the `proxmin.adaprox` optimizer
+            Keywords for the optimizer, selected by `scheme`:
+            `~scarlet.optimizer.fista` for "fista", which estimates the step
+            sizes from the loss, `~scarlet.optimizer.adaprox` for "adam",
+            "amsgrad" (default), and "padam", which use the `step` of the
+            parameters, or `proxmin.adaprox` for the other schemes of that
+            method.
+
+        When `time_budget` or `pixel_budget` are exhausted, the fit stops
+        like a converged fit, with the parameters of the lowest loss so far,
+        and sets `stop_reason`. The budgets are shared by all resolutions
+        of a `multiresolution` fit.
+
+        Fits warm-start from the optimizer moments of the last fit, except for
+        the components that overlap with components added or removed since
+        then, which start from fresh moments.
+
+        The fit stores all free parameters in one contiguous buffer and
+        replaces the parameters of the components with views of it. A
+        `~scarlet.Parameter` that was created before the first fit, or before
+        the free parameters changed, keeps its old values and is not updated
+        by the fit. Access the fitted values with `parameters` of the blend or
+        its components instead.
         """
+        changed = self._get_changed_components()
+        if getattr(self, "_changed_boxes", None) is not None:
+            for c in changed:
+                for p in c.parameters:
+                    for moment in (p.m, p.v, p.vhat):
+                        if moment is not None:
+                            moment[...] = 0
+
+        # parameters of unchanged components are held fixed for local fits,
+        # unless they are shared with a changed component
+        frozen = []
+        if local and getattr(self, "_changed_boxes", None) is not None:
+            if multiresolution:
+                raise ValueError("Local fits cannot use multiresolution")
+            fitted = {id(p) for c in changed for p in c.parameters}
+            frozen = {id(p): p for p in self.parameters if id(p) not in fitted}
+            frozen = list(frozen.values())
+        for p in frozen:
+            p.fixed = True
+        try:
+            return self._fit_levels(
+                max_iter=max_iter,
+                e_rel=e_rel,
+                n_threads=n_threads,
+                exact_seds=exact_seds,
+                multiresolution=multiresolution,
+                time_budget=time_budget,
+                pixel_budget=pixel_budget,
+                moment_dtype=moment_dtype,
+                **alg_kwargs
+            )
+        finally:
+            for p in frozen:
+                p.fixed = False
+
+    def _fit_levels(
+        self,
+        max_iter,
+        e_rel,
+        n_threads,
+        exact_seds,
+        multiresolution,
+        time_budget,
+        pixel_budget,
+        moment_dtype,
+        **alg_kwargs
+    ):
+        start = time.monotonic()
+        pixel_iterations = 0
+        for factor in sorted(multiresolution or (), reverse=True):
+            binned, pairs = downsample_blend(self, factor)
+            if not len(binned.parameters):
+                # e.g. only point sources, which are fixed at coarse levels
+                continue
+            # coarse levels only warm-start the next level,
+            # so they get fewer iterations and a looser tolerance
+            binned.fit(
+                max_iter=max(max_iter // factor, 1),
+                e_rel=e_rel * factor ** 2,
+                n_threads=n_threads,
+                exact_seds=exact_seds,
+                time_budget=None
+                if time_budget is None
+                else time_budget - (time.monotonic() - start),
+                pixel_budget=None
+                if pixel_budget is None
+                else pixel_budget - pixel_iterations,
+                **alg_kwargs
+            )
+            pixel_iterations += binned.diagnostics["pixel_iterations"]
+            upsample_blend(pairs, factor)
+
+        self._budget = {
+            "start": start,
+            "deadline": None if time_budget is None else start + time_budget,
+            "pixel_budget": pixel_budget,
+            "pixel_iterations": pixel_iterations,
+        }
+
+        # exactly solved SEDs are held fixed for the optimizer
+        seds = self._get_linear_seds() if exact_seds else []
+        for sed in seds:
+            sed.fixed = True
+        self._linear_seds = seds
+        try:
+            if n_threads > 1 and len(self.observations) > 1:
+                with ThreadPoolExecutor(max_workers=n_threads) as executor:
+                    self._executor = executor
+                    try:
+                        return self._fit(
+                            max_iter=max_iter,
+                            e_rel=e_rel,
+                            moment_dtype=moment_dtype,
+                            **alg_kwargs
+                        )
+                    finally:
+                        self._executor = None
+            return self._fit(
+                max_iter=max_iter, e_rel=e_rel, moment_dtype=moment_dtype, **alg_kwargs
+            )
+        finally:
+            for sed in seds:
+                sed.fixed = False
+            self._linear_seds = []
+            self._budget = None
+
+    def _fit(self, max_iter=200, e_rel=1e-3, moment_dtype=np.float64, **alg_kwargs):
 
         # dynamically call parameters to allow for addition / fixing
-        X = self.parameters
+        self.check_parameters()
+        if not len(self.parameters):
+            # nothing to fit, e.g. a local fit without changes
+            self.stop_reason = "converged"
+            budget = self._budget or {"start": time.monotonic(), "pixel_iterations": 0}
+            self.diagnostics = {
+                "iterations": 0,
+                "seconds": time.monotonic() - budget["start"],
+                "pixel_iterations": budget["pixel_iterations"],
+                "rel_change": None,
+                "e_rel": e_rel,
+            }
+            self._changed_boxes = []
+            return self
+        buffer = self._get_parameter_buffer()
+        buffer.set_moment_dtype(np.float64)
+        # footprint indices and kernels are reused within a fit, drop the ones
+        # of earlier fits, whose boxes may have changed since
+        for obs in self.observations:
+            if getattr(obs, "_footprint_index", None) is not None:
+                obs._reset_footprints()
+        X = buffer.parameters
         n_params = len(X)
 
         # compute the backward gradient tree
@@ -69,45 +364,163 @@ class Blend(ComponentTree):
         )
         _prox = tuple(x.constraint for x in X)
 
+        # cost of every iteration for the pixel budget
+        budget = self._budget
+        if budget is None:
+            budget = self._budget = {
+                "start": time.monotonic(),
+                "deadline": None,
+                "pixel_budget": None,
+                "pixel_iterations": 0,
+            }
+        budget["pixels"] = sum(
+            int(np.prod((self.frame if c.bbox is None else c.bbox).shape))
+            for c in self.components
+            if len(c.parameters)
+        )
+        self.stop_reason = "max_iter"
+        n_loss = len(self.loss)
+
         # good defaults for adaprox
         scheme = alg_kwargs.pop("scheme", "amsgrad")
+
+        # fista evaluates the loss at extrapolated parameters, which can violate
+        # the constraints, and ends at its last feasible parameters instead
+        budget["best"] = None
+        budget["keep_best"] = scheme.lower() != "fista"
         prox_max_iter = alg_kwargs.pop("prox_max_iter", 10)
         eps = alg_kwargs.pop("eps", 1e-8)
         callback = partial(
             self._callback, e_rel=e_rel, callback=alg_kwargs.pop("callback", None)
         )
 
-        # do we have a current state of the optimizer to warm start?
-        M = tuple(x.m if x.m is not None else np.zeros(x.shape) for x in X)
-        V = tuple(x.v if x.v is not None else np.zeros(x.shape) for x in X)
-        Vhat = tuple(x.vhat if x.vhat is not None else np.zeros(x.shape) for x in X)
-
-        proxmin.adaprox(
-            X,
-            _grad,
-            _step,
-            prox=_prox,
-            max_iter=max_iter,
-            e_rel=e_rel,
-            check_convergence=False,
-            scheme=scheme,
-            prox_max_iter=prox_max_iter,
-            callback=callback,
-            M=M,
-            V=V,
-            Vhat=Vhat,
-            **alg_kwargs
-        )
+        if scheme.lower() == "fista":
+            # step sizes are estimated from the loss, not taken from the parameters
+            optimizer.fista(
+                buffer,
+                _grad,
+                loss=lambda: self.loss[-1],
+                max_iter=max_iter,
+                lipschitz_grad=self._get_probe(_grad),
+                callback=callback,
+                **alg_kwargs
+            )
+        elif scheme.lower() in optimizer._phi_psi:
+            # vectorized over the contiguous buffer
+            optimizer.adaprox(
+                buffer,
+                _grad,
+                scheme=scheme,
+                eps=eps,
+                max_iter=max_iter,
+                e_rel=e_rel,
+                prox_max_iter=prox_max_iter,
+                callback=callback,
+                **alg_kwargs
+            )
+        else:
+            # moments are views into the buffer,
+            # which holds the current state of the optimizer for warm starts
+            M = tuple(x.m for x in X)
+            V = tuple(x.v for x in X)
+            Vhat = tuple(x.vhat for x in X)
 
-        # set convergence and standard deviation from optimizer
-        for p, m, v, vhat in zip(X, M, V, Vhat):
-            p.m = m
-            p.v = v
-            p.vhat = vhat
-            p.std = 1 / np.sqrt(ma.masked_equal(v, 0))  # this is rough estimate!
+            proxmin.adaprox(
+                X,
+                _grad,
+                _step,
+                prox=_prox,
+                max_iter=max_iter,
+                e_rel=e_rel,
+                check_convergence=False,
+                scheme=scheme,
+                eps=eps,
+                prox_max_iter=prox_max_iter,
+                callback=callback,
+                M=M,
+                V=V,
+                Vhat=Vhat,
+                **alg_kwargs
+            )
 
+        if self.stop_reason in ("time_budget", "pixel_budget"):
+            # the last evaluation can be worse than an earlier one
+            best = budget["best"]
+            if best is not None and best[0] < self.loss[-1]:
+                self._set_state(best[1])
+
+        iterations = len(self.loss) - n_loss
+        rel_change = None
+        if iterations > 1:
+            rel_change = abs(self.loss[-2] - self.loss[-1]) / np.abs(self.loss[-1])
+        self.diagnostics = {
+            "iterations": iterations,
+            "seconds": time.monotonic() - budget["start"],
+            "pixel_iterations": budget["pixel_iterations"]
+            + iterations * budget["pixels"],
+            "rel_change": rel_change,
+            "e_rel": e_rel,
+        }
+
+        # std is computed from v when needed
+        buffer.set_moment_dtype(moment_dtype)
+        self._changed_boxes = []
         return self
 
+    def _get_state(self):
+        """Copy of the free parameters and of the exactly solved SEDs
+        """
+        data = self._parameter_buffer.data
+        return {
+            "data": {dtype: d.copy() for dtype, d in data.items()},
+            "seds": [np.array(sed) for sed in self._linear_seds],
+        }
+
+    def _set_state(self, state):
+        """Restore the parameters from `_get_state`
+        """
+        self._parameter_buffer.set_state({"data": state["data"]})
+        # the SEDs that were solved for these morphologies
+        for sed, value in zip(self._linear_seds, state["seds"]):
+            sed[:] = value
+
+    def _get_probe(self, func):
+        """Wrap `func` such that its calls of `_loss` are not recorded in `loss`
+        """
+
+        def probe(*X):
+            n = len(self.loss)
+            try:
+                return func(*X)
+            finally:
+                del self.loss[n:]
+
+        return probe
+
+    def _get_parameter_buffer(self):
+        """Contiguous buffer of all free parameters
+
+        The buffer is rebuilt whenever the list of free parameters changes.
+        Its views replace the parameters in all components, so parameters
+        held elsewhere are no longer updated, see `fit`.
+
+        Returns
+        -------
+        buffer: `~scarlet.parameter.ParameterBuffer`
+        """
+        X = self.parameters
+        buffer = getattr(self, "_parameter_buffer", None)
+        if (
+            buffer is None
+            or len(buffer.parameters) != len(X)
+            or any(p is not x for p, x in zip(buffer.parameters, X))
+        ):
+            buffer = ParameterBuffer(X)
+            for c in self.components:
+                c._parameters = tuple(buffer.get_view(p) for p in c._parameters)
+            self._parameter_buffer = buffer
+        return buffer
+
     def _loss(self, *parameters):
         """Loss function for autograd
 
@@ -116,23 +529,463 @@ class Blend(ComponentTree):
         function and update the gradient for each
         parameter
         """
-        model = self.get_model(*parameters)
+        # fully fixed components are not rendered here, but once in _get_fixed_model
+        free = []
+        i = 0
+        for c in self.components:
+            j = len(c.parameters)
+            if j:
+                free.append((c, parameters[i : i + j]))
+                i += j
+        fixed_model = self._get_fixed_model()
+
+        # sparse scenes are rendered component by component,
+        # otherwise as one model in the full frame
+        boxes = [
+            c.bbox if c.bbox is not None and c._supports_bbox else self.frame
+            for c, _ in free
+        ]
+        use_footprints = [
+            observation._use_footprints(boxes) for observation in self.observations
+        ]
+        model, footprints = None, None
+        if any(use_footprints):
+            footprints = [self._get_footprint(c, p) for c, p in free]
+        if not all(use_footprints):
+            model = np.zeros(self.frame.shape)
+            for c, p in free:
+                model = model + c.get_model(*p)
+
         # Caculate the total loss function from all of the observations
-        total_loss = 0
-        for observation in self.observations:
-            total_loss = total_loss + observation.get_loss(model)
+        if getattr(self, "_executor", None) is not None:
+            footprints = footprints or []
+            total_loss = _parallel_loss(
+                model,
+                *(m for m, _ in footprints),
+                observations=self.observations,
+                use_footprints=use_footprints,
+                boxes=[box for _, box in footprints],
+                background=fixed_model,
+                executor=self._executor,
+                gradients={},
+            )
+        else:
+            total_loss = 0
+            for observation, use in zip(self.observations, use_footprints):
+                total_loss = total_loss + observation.get_loss(
+                    footprints if use else model, background=fixed_model
+                )
         self.loss.append(total_loss._value)
         return total_loss
 
+    def _get_footprint(self, component, parameters):
+        """Model of `component` in its bounding box and the box itself
+        """
+        if component.bbox is not None and component._supports_bbox:
+            return component._render_bbox(*parameters), component.bbox
+        return component.get_model(*parameters), self.frame
+
+    def _get_fixed_model(self):
+        """Model of all components whose parameters are all fixed
+
+        The model is memoized until the set of fixed components or any of
+        their parameters change, so that observations can cache its rendering.
+        Changes are applied to a copy of the previous model, component by
+        component, unless most of the fixed components changed.
+
+        Returns
+        -------
+        model: array or None
+            (Bands, Height, Width) data cube, `None` if no component is fixed
+        """
+        fixed = [c for c in self.components if not len(c.parameters)]
+        if not len(fixed):
+            self._fixed_model = None
+            return None
+
+        state = getattr(self, "_fixed_model", None)
+        entries, footprints = self._diff_footprints(
+            {} if state is None else state[0], fixed
+        )
+        if state is not None and not len(footprints):
+            return state[1]
+        if state is None or len(footprints) >= len(fixed):
+            model = np.zeros(self.frame.shape)
+            footprints = [footprint for _, footprint in entries.values()]
+        else:
+            # observations cache the rendering by identity: use a new array
+            model = state[1].copy()
+        self._add_footprints(model, footprints)
+        self._fixed_model = (entries, model)
+        return model
+
+    def _get_current_footprint(self, c):
+        """Current model of `c` in its bounding box, or in the frame, and the box
+        """
+        if c.bbox is not None and c._supports_bbox:
+            return np.array(c._cached_bbox_model()), c.bbox
+        return np.array(c.get_model()), self.frame
+
+    def _diff_footprints(self, entries, components):
+        """Footprints that update a model of the components in `entries`
+
+        Parameters
+        ----------
+        entries: dict
+            Key and footprint of every modeled component by its `id`,
+            as returned by this method
+        components: list
+            Components of the updated model
+
+        Returns
+        -------
+        entries: dict
+            Key and footprint of every component in `components`
+        footprints: list of (array, `~scarlet.Box`)
+            Models to add to the previous model, with negative models of the
+            components that changed or are not in `components` anymore
+        """
+        counts = {}
+        for c in components:
+            counts[id(c)] = counts.get(id(c), 0) + 1
+
+        entries = dict(entries)
+        updated, footprints = {}, []
+        for c in components:
+            if id(c) in updated:
+                continue
+            n = counts[id(c)]
+            key = (n, c._frame_version) + tuple(
+                p.version for p in c._parameters
+            )
+            entry = entries.pop(id(c), None)
+            if entry is not None:
+                if entry[0] == key:
+                    updated[id(c)] = entry
+                    continue
+                footprints.append((-entry[1][0], entry[1][1]))
+            model, box = self._get_current_footprint(c)
+            if n > 1:
+                model = n * model
+            footprints.append((model, box))
+            updated[id(c)] = (key, (model, box))
+        for _, (model, box) in entries.values():
+            footprints.append((-model, box))
+        return updated, footprints
+
+    def _add_footprints(self, model, footprints):
+        """Add every footprint to `model` in the model frame, in place
+        """
+        for cube, box in footprints:
+            overlap = box & self.frame
+            if any(s <= 0 for s in overlap.shape):
+                continue
+            inner = Box(overlap.shape, origin=overlap.origin)
+            inner -= box.origin
+            overlap -= self.frame.origin
+            model[overlap.slices_for(model.shape)] += cube[inner.slices_for(cube.shape)]
+
+    def _render_model(self, observation, model):
+        """Rendered `model` in the observed region, as compared to the data
+        """
+        if isinstance(observation, LowResObservation):
+            return observation._render(model)
+        return observation.render(model)
+
+    def get_residuals(self):
+        """Residuals of the current model in every observation
+
+        The rendered model of every observation is kept between calls and only
+        updated by the components that were added, removed, or changed since
+        the last call, e.g. by a `fit` with `local=True`, so that iterative
+        detection in the residuals costs in proportion to the changes.
+
+        Returns
+        -------
+        residuals: list of arrays
+            Observed images minus the rendered model, in the region of every
+            observation that overlaps with the model frame
+        """
+        observations = tuple(self.observations)
+        components = self.components
+        state = getattr(self, "_rendered", None)
+        if state is not None and (
+            len(state[0]) != len(observations)
+            or any(o is not o_ for o, o_ in zip(state[0], observations))
+        ):
+            state = None
+
+        entries, footprints = self._diff_footprints(
+            {} if state is None else state[1], components
+        )
+        if state is None or len(footprints) > len(components):
+            model = np.zeros(self.frame.shape)
+            self._add_footprints(
+                model, [footprint for _, footprint in entries.values()]
+            )
+            rendered = [self._render_model(o, model) for o in observations]
+        elif not len(footprints):
+            rendered = state[2]
+        else:
+            boxes = [box for _, box in footprints]
+            rendered = []
+            for o, rendered_ in zip(observations, state[2]):
+                if not isinstance(o, LowResObservation) and o._use_footprints(
+                    boxes
+                ):
+                    update = o.render(footprints)
+                else:
+                    model = np.zeros(self.frame.shape)
+                    self._add_footprints(model, footprints)
+                    update = self._render_model(o, model)
+                rendered.append(rendered_ + update)
+        self._rendered = (observations, entries, rendered)
+        return [o.images[o._data_slices] - r for o, r in zip(observations, rendered)]
+
+    def find_residual_peaks(self, thresh=5, obs_idx=0, sed=None):
+        """Find peaks in the residuals of the current model, e.g. of new sources
+
+        The residuals of the observation are coadded with the weighting of
+        `~scarlet.source.build_detection_coadd`, and every local maximum of
+        the coadd above `thresh` times its noise level is a peak.
+
+        Parameters
+        ----------
+        thresh: float
+            Minimum significance of a peak, in units of the background RMS of
+            the coadd, which is estimated from the weights of the observation
+        obs_idx: int
+            Index of the observation to use for detection
+        sed: array
+            SED to weight the channels of the coadd, flat by default.
+            Channels without positive weights are left out.
+
+        Returns
+        -------
+        sky_coords: list of tuple
+            Positions of the peaks, sorted by decreasing significance, to
+            initialize sources, e.g. `~scarlet.source.ExtendedSource`
+
+        Raises
+        ------
+        `ValueError` when no channel has positive weights and SED
+        """
+        observation = self.observations[obs_idx]
+        residuals = self.get_residuals()[obs_idx]
+        weights = np.broadcast_to(observation.weights, observation.images.shape)
+        # channels without positive weights are left out of the coadd
+        valid = (weights > 0).any(axis=(1, 2))
+        bg_rms = np.array(
+            [
+                1 / np.sqrt(w[w > 0].mean()) if v else np.inf
+                for w, v in zip(weights, valid)
+            ]
+        )
+        if sed is None:
+            sed = np.ones(len(bg_rms))
+        sed = np.where(valid, sed, 0)
+        if not np.any(sed > 0):
+            raise ValueError(
+                "Observation {} has no channel with positive weights and SED".format(
+                    obs_idx
+                )
+            )
+        detect, bg_cutoff = build_detection_coadd(
+            sed, bg_rms, observation, images=residuals
+        )
+        mask = (weights[observation._data_slices] > 0).any(axis=0)
+        peaks = find_peaks(detect, thresh * bg_cutoff, mask=mask)
+
+        # residuals are in the region of the images that overlaps with the frame
+        y0, x0 = (s.start for s in observation._data_slices[-2:])
+        return [
+            observation.frame.get_sky_coord((y + y0, x + x0)) for y, x in peaks
+        ]
+
+    def _get_linear_seds(self):
+        """SED parameters of the components that `update_seds` can solve for
+
+        These are the free SEDs of `~scarlet.component.FactorizedComponent`s
+        without prior, and without constraint other than positivity.
+        """
+        seds = {}
+        for c in self.components:
+            if not isinstance(c, FactorizedComponent):
+                continue
+            sed = c._parameters[0]
+            if sed.fixed or sed.prior is not None:
+                continue
+            if sed.constraint is not None and not isinstance(
+                sed.constraint, PositivityConstraint
+            ):
+                continue
+            seds[id(sed)] = sed
+        return list(seds.values())
+
+    def update_seds(self, seds=None):
+        """Set SEDs to their best fit for the current morphologies
+
+        For fixed morphologies, the SEDs of all
+        `~scarlet.component.FactorizedComponent`s minimize a linear weighted
+        least-squares problem, which is solved jointly for all components
+        with a Cholesky decomposition of the normal matrix in every channel.
+        The components are rendered with unit SEDs in every observation, so
+        that the solution accounts for the PSFs and the weights of the data.
+        If an SED with `PositivityConstraint` would become negative,
+        the channel is solved with non-negative least squares instead
+        (for all components in that channel).
+
+        Parameters
+        ----------
+        seds: list of `~scarlet.Parameter`
+            SEDs to solve for, all other parameters are kept fixed.
+            Defaults to all SEDs of factorized components without prior,
+            and without constraint other than positivity.
+        """
+        import scipy.linalg
+        import scipy.optimize
+        import scipy.sparse
+
+        for observation in self.observations:
+            if isinstance(observation, LowResObservation):
+                raise ValueError("Exact SEDs are not supported for LowResObservation")
+
+        if seds is None:
+            seds = self._get_linear_seds()
+        if not len(seds):
+            return
+        columns = {id(sed): k for k, sed in enumerate(seds)}
+        K = len(seds)
+
+        # components with one of the SEDs, and all others
+        linear = [
+            c
+            for c in self.components
+            if isinstance(c, FactorizedComponent) and id(c._parameters[0]) in columns
+        ]
+        others = [c for c in self.components if c not in linear]
+        background = np.zeros(self.frame.shape, dtype=self.frame.dtype)
+        for c in others:
+            background = background + c.get_model()
+
+        # first channel of every SED
+        boxes = {id(c): self.frame if c.bbox is None else c.bbox for c in linear}
+        origins = {
+            columns[id(c._parameters[0])]: boxes[id(c)].origin[0] for c in linear
+        }
+
+        # normal equations for every channel of the model frame
+        C = self.frame.shape[0]
+        normal = np.zeros((C, K, K))
+        rhs = np.zeros((C, K))
+        for observation in self.observations:
+            images = observation.images[observation._data_slices]
+            weights = observation.weights[observation._data_slices]
+            residual = images - observation.render(background)
+            size = images.size
+
+            # every component rendered with unit SED
+            values, index, cols = [], [], []
+            for c in linear:
+                box = boxes[id(c)]
+                morph = c._get_morph()
+                cube = np.ones(box.shape[0])[:, None, None] * morph[None, :, :]
+                if observation._use_footprints([box]):
+                    footprint = observation._convolve_footprint(cube, box)
+                    if footprint is None:
+                        continue
+                    value, idx = footprint
+                else:
+                    value = observation.render(c._pad_cube(cube)).flatten()
+                    idx = np.arange(size)
+                inside = idx < size
+                values.append(value[inside])
+                index.append(idx[inside])
+                cols.append(np.full(inside.sum(), columns[id(c._parameters[0])]))
+            if not len(values):
+                continue
+            # duplicate entries, e.g. from shared SEDs, are summed
+            values = np.concatenate(values).astype(np.float64)
+            basis = scipy.sparse.csr_matrix(
+                (values, (np.concatenate(index), np.concatenate(cols))),
+                shape=(size, K),
+            )
+
+            channels = range(*observation.slices[0].indices(C))
+            pixels = size // len(channels)
+            weights = weights.flatten().astype(np.float64)
+            residual = residual.flatten().astype(np.float64)
+            for k, channel in enumerate(channels):
+                block = slice(k * pixels, (k + 1) * pixels)
+                A = basis[block]
+                WA = A.multiply(weights[block][:, None]).tocsr()
+                normal[channel] += (A.T @ WA).toarray()
+                rhs[channel] += WA.T @ residual[block]
+
+        # solve for every channel, only with components that contribute
+        positive = np.array(
+            [isinstance(sed.constraint, PositivityConstraint) for sed in seds]
+        )
+        solution = [np.array(sed._data, dtype=np.float64) for sed in seds]
+        for channel in range(C):
+            active = np.flatnonzero(np.diag(normal[channel]) > 0)
+            if not len(active):
+                continue
+            N = normal[channel][np.ix_(active, active)]
+            b = rhs[channel][active]
+            try:
+                L = scipy.linalg.cholesky(N, lower=True)
+            except scipy.linalg.LinAlgError:
+                continue
+            x = scipy.linalg.cho_solve((L, True), b)
+            if np.any(positive[active] & (x < 0)):
+                # ||L^T x - L^-1 b||^2 is the same least-squares problem
+                y = scipy.linalg.solve_triangular(L, b, lower=True)
+                x = scipy.optimize.nnls(L.T, y)[0]
+            for k, value in zip(active, x):
+                solution[k][channel - origins[k]] = value
+
+        for sed, value in zip(seds, solution):
+            sed[:] = value
+
     def _callback(self, *parameters, it=None, e_rel=1e-3, callback=None):
 
+        if len(self._linear_seds):
+            self.update_seds(self._linear_seds)
+
         # raise ArithmeticError if some of the parameters have become inf/nan
-        self.check_parameters()
+        # fixed parameters have been checked before the fit,
+        # the free ones are in the buffer
+        if not self._parameter_buffer.is_finite():
+            self.check_parameters()
 
         if it > 1 and abs(self.loss[-2] - self.loss[-1]) < e_rel * np.abs(
             self.loss[-1]
         ):
+            self.stop_reason = "converged"
             raise StopIteration("scarlet.Blend.fit() converged")
 
+        budget = self._budget
+        if budget["deadline"] is not None or budget["pixel_budget"] is not None:
+            if budget["keep_best"]:
+                # keep the parameters of the lowest loss so far:
+                # the last loss is that of the parameters before the last update
+                best = budget["best"]
+                if it > 0 and (best is None or self.loss[-1] < best[0]):
+                    budget["best"] = (self.loss[-1], budget["pending"])
+                budget["pending"] = self._get_state()
+
+            deadline = budget["deadline"]
+            if deadline is not None and time.monotonic() >= deadline:
+                self.stop_reason = "time_budget"
+                raise StopIteration("scarlet.Blend.fit() ran out of time")
+            pixel_iterations = budget["pixel_iterations"] + (it + 1) * budget["pixels"]
+            if (
+                budget["pixel_budget"] is not None
+                and pixel_iterations > budget["pixel_budget"]
+            ):
+                self.stop_reason = "pixel_budget"
+                raise StopIteration("scarlet.Blend.fit() ran out of pixel-iterations")
+
         if callback is not None:
             callback(*parameters, it=it)
@@ -2,8 +2,54 @@ from abc import ABC, abstractmethod
 from .parameter import *
 from . import fft
 from . import interpolation
-from .bbox import Box
+from .bbox import Box, BoxArray, BoxIndex
 import autograd.numpy as np
+from autograd.numpy.numpy_boxes import ArrayBox
+
+
+def _get_padding(boxes, frame):
+    """Padding of `boxes` into `frame` and the slices of the padded boxes
+
+    Parameters
+    ----------
+    boxes: `~scarlet.BoxArray`
+        Bounding boxes of the components
+    frame: `~scarlet.Frame`
+        Model frame
+
+    Returns
+    -------
+    pad_width: list
+        ((before1, after1), (before2, after2)...) for every box, so that the
+        padded box is a superset of the frame
+    slices: list
+        Slices of every padded box that cover all of the frame
+    """
+    # TODO: full 3D bbox and slicing support
+    before = np.maximum(boxes.start - frame.start, 0)
+    after = np.maximum(frame.stop - boxes.stop, 0)
+    padded = BoxArray.from_bounds(boxes.start - before, boxes.stop + after)
+    overlap = padded & frame
+    overlap -= padded.origin  # now in padded frame
+    pad_width = np.stack((before, after), axis=-1).tolist()
+    start, stop = overlap.start.tolist(), overlap.stop.tolist()
+    return pad_width, [tuple(map(slice, a, b)) for a, b in zip(start, stop)]
+
+
+def _get_box_padding(box, frame):
+    """`_get_padding` of a single `~scarlet.Box`, without array overhead
+    """
+    pad_width, slices = [], []
+    for start, stop, frame_start, frame_stop in zip(
+        box.start, box.stop, frame.start, frame.stop
+    ):
+        before = max(start - frame_start, 0)
+        after = max(frame_stop - stop, 0)
+        pad_width.append([before, after])
+        # the padded box covers the frame, so the overlap is the frame
+        padded_start = start - before
+        slices.append(slice(frame_start - padded_start, frame_stop - padded_start))
+    return pad_width, tuple(slices)
 
 
 class Component(ABC):
@@ -42,12 +88,66 @@ class Component(ABC):
         self._index = None
         self._parent = None
 
+        # memoized model in bbox, keyed by the parameter versions
+        self._model_cache = None
+
     @property
     def shape(self):
         """Shape of the image (Channel, Height, Width)
         """
         return self.bbox.shape
 
+    @property
+    def frame(self):
+        """The spectral and spatial characteristics of this component
+        """
+        return self._frame
+
+    @frame.setter
+    def frame(self, frame):
+        self._frame = frame
+        self._frame_version = next(Parameter._versions)
+
+    @property
+    def bbox(self):
+        """Hyper-spectral bounding box, `None` for the entire frame
+        """
+        return self._bbox
+
+    @bbox.setter
+    def bbox(self, bbox):
+        self._bbox = bbox
+        self._frame_version = next(Parameter._versions)
+        self._update_box()
+
+    @property
+    def _parameters(self):
+        return self._parameter_tuple
+
+    @_parameters.setter
+    def _parameters(self, parameters):
+        self._parameter_tuple = parameters
+        # invalidates the cached lists of free parameters of all trees
+        Component._parameters_version = next(Parameter._versions)
+
+    def _update_box(self):
+        # keep the spatial indices of the trees that hold this component current
+        parent = getattr(self, "_parent", None)
+        while parent is not None:
+            parent._box_changed(self)
+            parent = parent._parent
+
+    def __setstate__(self, state):
+        # older pickles store the bbox and the parameters as attributes
+        if "bbox" in state:
+            state["_bbox"] = state.pop("bbox")
+        if "_parameters" in state:
+            state["_parameter_tuple"] = state.pop("_parameters")
+        if "frame" in state:
+            state["_frame"] = state.pop("frame")
+        self.__dict__.update(state)
+        self._frame_version = next(Parameter._versions)
+
     @property
     def coord(self):
         """The coordinate in a `~scarlet.component.ComponentTree`.
@@ -84,6 +184,60 @@ class Component(ABC):
         """
         pass
 
+    # whether the component implements `_bbox_model` and `_render_bbox`
+    _supports_bbox = False
+
+    def _bbox_model(self):
+        """Model of this component in its `bbox` for the current parameter values
+
+        The model is not padded into the frame. Components implement this
+        method, and set `_supports_bbox`, to make use of `_cached_bbox_model`
+        and `_get_cached_model`.
+        """
+        return None
+
+    def _render_bbox(self, *parameters):
+        """Render the model of this component in its `bbox` for the optimization
+        `parameters`
+
+        Components implement this method, and set `_supports_bbox`, to be
+        rendered during the fit without padding them into the full frame.
+
+        Returns
+        -------
+        model: array
+            (Channels, Height, Width) image of the model in `bbox`,
+            or `None` if none of `parameters` belongs to this component
+        """
+        return None
+
+    def _cached_bbox_model(self):
+        """Memoized `_bbox_model`, valid until any of the parameters is updated
+        """
+        key = tuple(p.version for p in self._parameters)
+        if self._model_cache is None or self._model_cache[0] != key:
+            self._model_cache = (key, self._bbox_model())
+        return self._model_cache[1]
+
+    def _get_cached_model(self):
+        """Get the model for this component from the current parameter values
+
+        Returns
+        -------
+        model: array
+            (Channels, Height, Width) image of the model
+        """
+        model = self._cached_bbox_model()
+        if self.bbox is None:
+            return model.copy()
+        return self._pad_cube(model)
+
+    def _pad_cube(self, cube):
+        if self.bbox is not None:
+            padded = np.pad(cube, self.pad_width, mode="constant", constant_values=0)
+            return padded[self.slices]
+        return cube
+
     def set_frame(self, frame):
         """Sets the frame for this component.
 
@@ -96,38 +250,26 @@ class Component(ABC):
             Frame to adopt for this component
         """
         self.frame = frame
+        if self.bbox is None:
+            self._update_box()
 
         # store padding and slicing structures
         if self.bbox is not None:
             assert isinstance(self.bbox, Box)
-            # TODO: full 3D bbox and slicing support
-            # determine pad from box into full frame
-            # yields superset of frame pixels
-            # pad_width is ((before1, after1), (before2, after2)...)
-            self.pad_width = list(
-                (
-                    max(0, self.bbox.start[d] - self.frame.start[d]),
-                    max(0, self.frame.stop[d] - self.bbox.stop[d]),
-                )
-                for d in range(self.frame.D)
-            )
+            self._set_padding(*_get_box_padding(self.bbox, frame))
 
-            # get slicing of padded box so that the result covers
-            # all of the model frame
-            bounds = []
-            for d in range(self.frame.D):
-                bounds.append(
-                    (
-                        self.bbox.start[d] - self.pad_width[d][0],
-                        self.bbox.stop[d] + self.pad_width[d][1],
-                    )
-                )
-            padded_box = Box.from_bounds(*bounds)
+    def _set_padding(self, pad_width, slices):
+        """Store how the model in `bbox` is padded and sliced into the frame
 
-            model_box = self.frame
-            overlap = model_box & padded_box
-            overlap -= padded_box.origin  # now in padded frame
-            self.slices = overlap.slices_for(padded_box.shape)
+        Parameters
+        ----------
+        pad_width: list
+            ((before1, after1), (before2, after2)...) to pad `bbox` to a
+            superset of the frame, see `_get_padding`
+        slices: tuple
+            Slices of the padded box that cover all of the frame
+        """
+        self.pad_width, self.slices = pad_width, slices
 
     def check_parameters(self):
         """Check that all parameters have finite elements
@@ -137,7 +279,7 @@ class Component(ABC):
         `ArithmeticError` when non-finite elements are present
         """
         for k, p in enumerate(self._parameters):
-            if not np.isfinite(p).all():
+            if not np.isfinite(p._data).all():
                 msg = "Component {} Parameter {} is not finite:\n{}".format(self, k, p)
                 raise ArithmeticError(msg)
 
@@ -161,6 +303,8 @@ class FactorizedComponent(Component):
         Hyper-spectral bounding box
     """
 
+    _supports_bbox = True
+
     def __init__(self, frame, sed, morph, shift=None, bbox=None, **kwargs):
         if shift is None:
             parameters = (sed, morph)
@@ -173,6 +317,9 @@ class FactorizedComponent(Component):
             padding = 10
             self.fft_shape = fft._get_fft_shape(morph, morph, padding=padding)
             self.shifter_y, self.shifter_x = interpolation.mk_shifter(self.fft_shape)
+            # phase ramps of the last evaluated shift
+            # can be shared between components with the same shift parameter
+            self._phase_cache = {"shift": None, "ramps": None}
 
     @property
     def sed(self):
@@ -184,7 +331,7 @@ class FactorizedComponent(Component):
     def morph(self):
         """Numpy view of the component morphology
         """
-        return self._pad_morph(self._shift_morph(self.shift, self._parameters[1]._data))
+        return self._pad_morph(self._get_morph())
 
     @property
     def shift(self):
@@ -206,6 +353,12 @@ class FactorizedComponent(Component):
         model: array
             (Channels, Height, Width) image of the model
         """
+        model = self._render_bbox(*parameters)
+        if model is None:
+            return self._get_cached_model()
+        return self._pad_cube(model)
+
+    def _render_bbox(self, *parameters):
         sed, morph, shift = None, None, None
 
         # if params are set they are not Parameters, but autograd ArrayBoxes
@@ -218,20 +371,31 @@ class FactorizedComponent(Component):
             if len(self._parameters) == 3 and p._value is self._parameters[2]:
                 shift = p
 
+        if sed is None and morph is None and shift is None:
+            return None
+
         if sed is None:
-            sed = self.sed
+            sed = self._parameters[0]._data
 
         if shift is None:
             shift = self.shift
 
         if morph is None:
             # dont' use self._morph because we could have shift as parameter
-            morph = self._pad_morph(self._shift_morph(shift, self._parameters[1]._data))
+            morph = self._shift_morph(shift, self._parameters[1]._data)
         else:
-            morph = self._pad_morph(self._shift_morph(shift, morph))
+            morph = self._shift_morph(shift, morph)
 
         return sed[:, None, None] * morph[None, :, :]
 
+    def _get_morph(self):
+        # morphology in the bounding box, with shift applied
+        return self._shift_morph(self.shift, self._parameters[1]._data)
+
+    def _bbox_model(self):
+        sed = self._parameters[0]._data
+        return sed[:, None, None] * self._get_morph()[None, :, :]
+
     def _pad_sed(self, sed):
         if self.bbox is not None:
             padded = np.pad(sed, self.pad_width[0], mode="constant", constant_values=0)
@@ -247,20 +411,34 @@ class FactorizedComponent(Component):
             return padded[self.slices[1:]]
         return morph
 
-    def _shift_morph(self, shift, morph):
-        if shift is not None:
-            X = fft.Fourier(morph)
-            X_fft = X.fft(self.fft_shape, (0, 1))
-
-            # Apply shift in Fourier
-            result_fft = (
-                X_fft
-                * np.exp(self.shifter_y[:, None] * shift[0])
-                * np.exp(self.shifter_x[None, :] * shift[1])
+    def _get_phase_ramps(self, shift):
+        """Separable 1D phase ramps to apply `shift` in Fourier space
+
+        Ramps of shifts that are not optimized in this pass (i.e. not autograd
+        `ArrayBox`es) are cached and only re-evaluated when the shift changes.
+        """
+        if isinstance(shift, ArrayBox):
+            return np.exp(self.shifter_y * shift[0]), np.exp(self.shifter_x * shift[1])
+
+        cache = self._phase_cache
+        if cache["shift"] is None or not np.array_equal(cache["shift"], shift):
+            cache["shift"] = np.array(shift)
+            cache["ramps"] = (
+                np.exp(self.shifter_y * shift[0]),
+                np.exp(self.shifter_x * shift[1]),
             )
+        return cache["ramps"]
 
-            X = fft.Fourier.from_fft(result_fft, self.fft_shape, X.shape, [0, 1])
-            return np.real(X.image)
+    def _shift_morph(self, shift, morph):
+        if shift is not None:
+            # The shift is a circular convolution on the padded fft_shape,
+            # which commutes with the (i)fftshifts of `fft.Fourier`,
+            # so we can pad at the end and skip re-centering altogether.
+            ramp_y, ramp_x = self._get_phase_ramps(shift)
+            X_fft = np.fft.rfftn(morph, self.fft_shape)
+            result_fft = X_fft * ramp_y[:, None] * ramp_x[None, :]
+            result = np.fft.irfftn(result_fft, self.fft_shape)
+            return result[: morph.shape[0], : morph.shape[1]]
         return morph
 
 
@@ -287,16 +465,20 @@ class FunctionComponent(FactorizedComponent):
     def __init__(self, frame, sed, fparams, func, bbox=None):
         parameters = (sed, fparams)
         super().__init__(frame, *parameters, bbox=bbox, func=func)
+        # last evaluated morphology and the version of fparams it belongs to
+        self._morph = None
 
     @property
     def morph(self):
         """Numpy view of the component morphology
         """
-        try:
-            return self._pad_morph(self._morph)
-        except AttributeError:
-            self._morph = self._func(*self._parameters[1])
-            return self._pad_morph(self._morph)
+        return self._pad_morph(self._get_morph())
+
+    def _get_morph(self):
+        fparams = self._parameters[1]
+        if self._morph is None or self._morph[0] != fparams.version:
+            self._morph = (fparams.version, self._func(*fparams))
+        return self._morph[1]
 
     def _func(self, *parameters):
         return self.kwargs["func"](*parameters)
@@ -313,6 +495,12 @@ class FunctionComponent(FactorizedComponent):
         model: array
             (Channels, Height, Width) image of the model
         """
+        model = self._render_bbox(*parameters)
+        if model is None:
+            return self._get_cached_model()
+        return self._pad_cube(model)
+
+    def _render_bbox(self, *parameters):
         sed, fparams = None, None
 
         # if params are set they are not Parameters, but autograd ArrayBoxes
@@ -323,17 +511,23 @@ class FunctionComponent(FactorizedComponent):
             if p._value is self._parameters[1]:
                 fparams = p
 
+        if sed is None and fparams is None:
+            return None
+
         if sed is None:
-            sed = self.sed
+            sed = self._parameters[0]._data
         if fparams is None:
-            morph = self.morph
+            morph = self._get_morph()
         else:
             morph = self._func(*fparams)
-            self._morph = morph._value
-            morph = self._pad_morph(morph)
+            self._morph = (fparams._value.version, morph._value)
 
         return sed[:, None, None] * morph[None, :, :]
 
+    def _bbox_model(self):
+        sed = self._parameters[0]._data
+        return sed[:, None, None] * self._get_morph()[None, :, :]
+
 
 class CubeComponent(Component):
     """A single component in a blend.
@@ -350,6 +544,8 @@ class CubeComponent(Component):
         Hyper-spectral bounding box
     """
 
+    _supports_bbox = True
+
     def __init__(self, frame, cube, bbox=None):
         parameters = (cube,)
         super().__init__(frame, *parameters, bbox=bbox)
@@ -359,21 +555,19 @@ class CubeComponent(Component):
         return self._pad_cube(self._parameters[0]._data)
 
     def get_model(self, *parameters):
-        cube = None
+        cube = self._render_bbox(*parameters)
+        if cube is None:
+            return self._get_cached_model()
+        return self._pad_cube(cube)
+
+    def _render_bbox(self, *parameters):
         for p in parameters:
             if p._value is self._parameters[0]:
-                cube = self._pad_cube(p)
+                return p
+        return None
 
-        if cube is None:
-            cube = self.cube
-
-        return cube
-
-    def _pad_cube(self, cube):
-        if self.bbox is not None:
-            padded = np.pad(cube, self.pad_width, mode="constant", constant_values=0)
-            return padded[self.slices]
-        return cube
+    def _bbox_model(self):
+        return self._parameters[0]._data
 
 
 class ComponentTree:
@@ -393,7 +587,7 @@ class ComponentTree:
             components = (components,)
 
         # check type and set coords of subordinate nodes in tree
-        self._tree = tuple(components)
+        self._tree = list(components)
         self._index = None
         self._parent = None
         for i, c in enumerate(self._tree):
@@ -405,6 +599,25 @@ class ComponentTree:
             c._index = i
             c._parent = self
 
+        # memoized model, keyed by the parameter versions of all components
+        self._model_cache = None
+        self._reset()
+
+    def _reset(self):
+        # flattened components and everything derived from them are rebuilt
+        # on first use
+        self._component_list = None
+        self._components = None
+        self._parameters_cache = None
+        self._box_index = None
+
+    def _changed(self):
+        # trees that hold this tree need to flatten it again
+        parent = self._parent
+        while parent is not None:
+            parent._reset()
+            parent = parent._parent
+
     @property
     def components(self):
         """Flattened tuple of all components in the tree.
@@ -414,24 +627,61 @@ class ComponentTree:
         times, this method will only return that component at its first
         encountered location
         """
-        try:
-            return self._components
-        except AttributeError:
-            self._components = self._tree_to_components()
-            return self._components
+        if getattr(self, "_components", None) is None:
+            if getattr(self, "_component_list", None) is None:
+                self._tree_to_components()
+            self._components = tuple(self._component_list)
+        return self._components
 
     def _tree_to_components(self):
-        components = []
+        self._component_list = []
+        # number of sources that hold every component
+        self._component_counts = {}
         for c in self._tree:
-            if isinstance(c, ComponentTree):
-                _c = c.components
+            self._add_components(c)
+
+    def _add_components(self, c):
+        """Append the components of `c` that are not in the tree yet
+
+        Returns
+        -------
+        components: list
+            Components that were appended
+        """
+        added = []
+        for _c in c.components if isinstance(c, ComponentTree) else (c,):
+            n = self._component_counts.get(id(_c), 0)
+            self._component_counts[id(_c)] = n + 1
+            if not n:
+                self._component_list.append(_c)
+                added.append(_c)
+        return added
+
+    def _remove_components(self, c):
+        """Remove the components of `c` that are not held by other sources
+
+        Returns
+        -------
+        components: list
+            Components that were removed
+        """
+        removed, shared = [], False
+        for _c in c.components if isinstance(c, ComponentTree) else (c,):
+            n = self._component_counts.pop(id(_c)) - 1
+            if n:
+                self._component_counts[id(_c)] = n
+                shared = True
             else:
-                _c = [c]
-            # check uniqueness
-            for __c in _c:
-                if __c not in components:
-                    components.append(__c)
-        return tuple(components)
+                removed.append(_c)
+        if shared:
+            # shared components move to their next location
+            self._tree_to_components()
+        else:
+            ids = {id(_c) for _c in removed}
+            self._component_list = [
+                _c for _c in self._component_list if id(_c) not in ids
+            ]
+        return removed
 
     @property
     def n_components(self):
@@ -462,7 +712,7 @@ class ComponentTree:
         -------
         The arguments of `__init__`
         """
-        return self._tree
+        return tuple(self._tree)
 
     @property
     def n_sources(self):
@@ -498,10 +748,19 @@ class ComponentTree:
         list of parameters available for optimization
         If `parameter.fixed == True`, the parameter will not returned here.
         """
-        pars = []
-        for c in self.components:
-            pars += c.parameters
-        return pars
+        # valid until the components, their parameters, or any `fixed` change
+        components = self.components
+        versions = (
+            getattr(Component, "_parameters_version", None),
+            Parameter._fixed_version,
+        )
+        cache = getattr(self, "_parameters_cache", None)
+        if cache is None or cache[0] is not components or cache[1] != versions:
+            pars = []
+            for c in components:
+                pars += c.parameters
+            cache = self._parameters_cache = (components, versions, pars)
+        return list(cache[2])
 
     def check_parameters(self):
         """Check that all parameters have finite elements
@@ -524,7 +783,16 @@ class ComponentTree:
         -------
         model: array
             (Bands, Height, Width) data cube
+
+            Without `params` the model is memoized until any of the parameters,
+            frames, or bounding boxes of the components change. The returned
+            array is a copy of the memoized model.
         """
+        if not len(params):
+            key = self._model_key()
+            if self._model_cache is not None and self._model_cache[0] == key:
+                return self._model_cache[1].copy()
+
         model = np.zeros(self.frame.shape)
         if len(params):
             i = 0
@@ -536,9 +804,18 @@ class ComponentTree:
         else:
             for c in self.components:
                 model = model + c.get_model()
+            model.flags.writeable = False
+            self._model_cache = (key, model)
+            return model.copy()
 
         return model
 
+    def _model_key(self):
+        return tuple(
+            (c._frame_version,) + tuple(p.version for p in c._parameters)
+            for c in self.components
+        )
+
     def set_frame(self, frame):
         """Set the frame for all components in the tree
 
@@ -549,9 +826,87 @@ class ComponentTree:
         frame: `~scarlet.Frame`
             Frame to adopt for this component
         """
+        self._box_index = None
+        # components with the default `set_frame` and a bbox are padded at once
+        bulk, others = [], []
         for c in self.components:
+            if type(c).set_frame is Component.set_frame and c.bbox is not None:
+                bulk.append(c)
+            else:
+                others.append(c)
+        if len(bulk):
+            boxes = BoxArray.from_boxes([c.bbox for c in bulk])
+            for c, pad_width, slices in zip(bulk, *_get_padding(boxes, frame)):
+                c.frame = frame
+                c._set_padding(pad_width, slices)
+        for c in others:
             c.set_frame(frame)
 
+    def _get_box_index(self):
+        """Spatial index of the boxes of all components, and their positions
+        """
+        if getattr(self, "_box_index", None) is None:
+            components = self.components
+            boxes = [c.frame if c.bbox is None else c.bbox for c in components]
+            # cells of the typical box size keep the number of cells per box low
+            extent = [max(box.shape[-2:]) for box in boxes]
+            index = BoxIndex(np.median(extent) if len(extent) else 32)
+            for c, box in zip(components, boxes):
+                index.insert(c, box)
+            positions = {c: k for k, c in enumerate(components)}
+            self._box_index = (index, positions)
+        return self._box_index
+
+    def _box_changed(self, c):
+        if getattr(self, "_box_index", None) is not None:
+            index, positions = self._box_index
+            if c in positions:
+                index.insert(c, c.frame if c.bbox is None else c.bbox)
+
+    def components_in(self, box):
+        """Components whose bounding box overlaps with `box`
+
+        The query uses a spatial index of the component boxes, which is kept
+        current when components are added or their `bbox` is replaced.
+        Boxes that are modified in place need to be assigned again, e.g.
+        `c.bbox = c.bbox`.
+
+        Parameters
+        ----------
+        box: `~scarlet.Box`
+            Region in the model frame, with the same dimensions as the frame
+
+        Returns
+        -------
+        components: tuple
+            Components in the order of `self.components`
+        """
+        index, positions = self._get_box_index()
+        return tuple(sorted(index.query(box), key=positions.__getitem__))
+
+    def get_overlap_graph(self):
+        """Adjacency matrix of the components with overlapping bounding boxes
+
+        Returns
+        -------
+        graph: `scipy.sparse.csr_matrix`
+            Symmetric boolean (K, K) matrix for the components in
+            `self.components`, `True` where two different components overlap
+        """
+        import scipy.sparse
+
+        index, positions = self._get_box_index()
+        pairs = index.get_pairs()
+        first, second = ([], []) if not pairs else zip(*pairs)
+        first = list(map(positions.__getitem__, first))
+        second = list(map(positions.__getitem__, second))
+        K = len(positions)
+        return scipy.sparse.csr_matrix(
+            ([True] * (2 * len(pairs)), (first + second, second + first)),
+            shape=(K, K),
+            dtype=bool,
+        )
+
     def __iadd__(self, c):
         """Add another component or tree.
 
@@ -561,14 +916,66 @@ class ComponentTree:
         """
         c_index = self.n_sources
         if isinstance(c, ComponentTree):
-            self._tree = self._tree + c._tree
+            # the sources of `c` become sources of this tree
+            for i, _c in enumerate(c._tree, c_index):
+                _c._index = i
+                _c._parent = self
+            self._tree += c._tree
         elif isinstance(c, Component):
-            self._tree = self._tree + (c,)
+            self._tree.append(c)
         else:
             raise NotImplementedError("argument needs to be Component or ComponentTree")
         c._index = c_index
         c._parent = self
-        self._components = self._tree_to_components()
+
+        # update the flattened components instead of rebuilding them
+        if getattr(self, "_component_list", None) is not None:
+            n_components = len(self._component_list)
+            added = self._add_components(c)
+            self._components = None
+            if self._box_index is not None:
+                index, positions = self._box_index
+                for k, _c in enumerate(added, n_components):
+                    index.insert(_c, _c.frame if _c.bbox is None else _c.bbox)
+                    positions[_c] = k
+        self._changed()
+        return self
+
+    def __isub__(self, c):
+        """Remove a component or tree from the sources of this tree.
+
+        Parameters
+        ----------
+        c: `~scarlet.component.Component` or `~scarlet.component.ComponentTree`
+            One of `self.sources`
+
+        Raises
+        ------
+        `ValueError` if `c` is not a source of this tree
+        """
+        index = c._index
+        if c._parent is not self or index is None or self._tree[index] is not c:
+            index = next((i for i, _c in enumerate(self._tree) if _c is c), None)
+            if index is None:
+                raise ValueError("{} is not a source of this tree".format(c))
+        del self._tree[index]
+        for i in range(index, len(self._tree)):
+            self._tree[i]._index = i
+        # sources can be listed multiple times
+        index = next((i for i, _c in enumerate(self._tree) if _c is c), None)
+        c._index = index
+        c._parent = None if index is None else self
+
+        if getattr(self, "_component_list", None) is not None:
+            removed = self._remove_components(c)
+            self._components = None
+            if self._box_index is not None:
+                box_index, _ = self._box_index
+                for _c in removed:
+                    box_index.remove(_c)
+                positions = {_c: k for k, _c in enumerate(self._component_list)}
+                self._box_index = (box_index, positions)
+        self._changed()
         return self
 
     def __getitem__(self, coord):
@@ -597,5 +1004,11 @@ class ComponentTree:
         return (self._tree,)
 
     def __setstate__(self, state):
-        self._tree = state[0]
-        self._tree_to_components()
+        self._tree = list(state[0])
+        self._index = None
+        self._parent = None
+        for i, c in enumerate(self._tree):
+            c._index = i
+            c._parent = self
+        self._model_cache = None
+        self._reset()
@@ -25,8 +25,13 @@ class Constraint:
 
     For reference, every operator of the `proxmin` package yields a valid
     `Constraint`.
+
+    Constraints that act on every element independently set `elementwise`,
+    which allows optimizers to apply them to many parameters at once.
     """
 
+    elementwise = False
+
     def __init__(self, f=None):
         """Constraint base class
 
@@ -85,6 +90,8 @@ class PositivityConstraint(Constraint):
     """Allow only non-negative elements.
     """
 
+    elementwise = True
+
     def __init__(self):
         super().__init__(proxmin.operators.prox_plus)
 
@@ -112,6 +119,8 @@ class NormalizationConstraint(Constraint):
 
 
 class L0Constraint(Constraint):
+    elementwise = True
+
     def __init__(self, thresh, type="relative"):
         """L0 norm (sparsity) penalty
 
@@ -127,6 +136,8 @@ class L0Constraint(Constraint):
 
 
 class L1Constraint(Constraint):
+    elementwise = True
+
     def __init__(self, thresh, type="relative"):
         """L1 norm (sparsity) penalty
 
@@ -240,6 +251,8 @@ class AllOnConstraint(Constraint):
     """Add to all elements a tiny non-zero value
     """
 
+    elementwise = True
+
     def __init__(self, tiny=1e-6):
         self.tiny = tiny
 
@@ -12,8 +12,10 @@ class Frame(Box):
 
     Attributes
     ----------
-    shape_or_box: tuple
-        shape tuple (Channel, Height, Width) or image/cube with a shape
+    shape_or_box: tuple or `~scarlet.Box`
+        shape tuple (Channel, Height, Width), or box with the shape and the
+        origin of the frame in pixel coordinates. Without `wcs`, these are
+        also the sky coordinates.
     wcs: TBD
         World Coordinates
     psfs: `scarlet.PSF` or its arguments
@@ -29,7 +31,7 @@ class Frame(Box):
     ):
 
         if isinstance(shape_or_box, Box):
-            self = shape_or_box
+            super().__init__(shape_or_box.shape, origin=shape_or_box.origin)
         else:
             super().__init__(shape_or_box)
 
@@ -74,7 +76,8 @@ class Frame(Box):
         """Get the pixel coordinate from a world coordinate
         If there is no WCS associated with the `Scene`,
         meaning the data frame and model frame are the same,
-        then this just returns `sky_coord`.
+        then this just returns `sky_coord` relative to the spatial origin
+        of the frame.
         """
         if self.wcs is not None:
             if self.wcs.naxis == 3:
@@ -87,13 +90,14 @@ class Frame(Box):
                 )
             return tuple(int(c.item()) for c in coord)
 
-        return tuple(int(coord) for coord in sky_coord)
+        return tuple(int(c) - o for c, o in zip(sky_coord, self.origin[-2:]))
 
     def get_sky_coord(self, pixel):
         """Get the world coordinate for a pixel coordinate
         If there is no WCS associated with the `Scene`,
         meaning the data frame and model frame are the same,
-        then this just returns `pixel`.
+        then this just returns `pixel` offset by the spatial origin of the
+        frame.
         """
         if self.wcs is not None:
             if self.wcs.naxis == 3:
@@ -106,4 +110,4 @@ class Frame(Box):
                 )
             return tuple(c.item() for c in coord)
 
-        return tuple(pixel)
+        return tuple(p + o for p, o in zip(pixel, self.origin[-2:]))
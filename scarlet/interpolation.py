@@ -1,4 +1,5 @@
 import numpy as np
+from autograd.extend import primitive, defvjp
 from .cache import Cache
 from . import fft
 
@@ -302,6 +303,38 @@ def get_separable_kernel(dy, dx, kernel=lanczos, **kwargs):
     return kyx, y_window, x_window
 
 
+def get_upsampling_matrix(n, factor, kernel=bilinear, **kwargs):
+    """Interpolation matrix from binned pixels to the original pixels
+
+    Every binned pixel covers `factor` original pixels, so its center
+    is at original coordinate `factor * i + (factor - 1) / 2`.
+    Pixels beyond the edges take the value of the nearest binned pixel.
+
+    Parameters
+    ----------
+    n: int
+        Number of binned pixels
+    factor: int
+        Binning factor
+    kernel: function
+        1D interpolation kernel, e.g. `bilinear` or `lanczos`
+    kwargs: dict
+        Keyword arguments for the kernel
+
+    Returns
+    -------
+    matrix: array
+        (n * factor, n) matrix that maps binned to original pixels
+    """
+    coords = (np.arange(n * factor) - (factor - 1) / 2) / factor
+    matrix = np.zeros((n * factor, n))
+    for i, coord in enumerate(coords):
+        x0 = np.floor(coord)
+        y, window = kernel(coord - x0, **kwargs)
+        np.add.at(matrix[i], np.clip(window + int(x0), 0, n - 1), y)
+    return matrix / matrix.sum(axis=1)[:, None]
+
+
 def mk_shifter(shape, real=False):
     """ Performs shifts in the Fourier domain on Fourier objects
 
@@ -343,7 +376,116 @@ def mk_shifter(shape, real=False):
     return shifters
 
 
-def sinc_interp(images, coord_hr, coord_lr, angle=None, padding=3):
+def get_banded_sinc(x_hr, x_lr, a=3):
+    """Lanczos-truncated sinc kernel between two regular 1D grids
+
+    Every sample at `x_hr` only receives contributions from the `2a+1`
+    samples of `x_lr` closest to it, so the kernel is stored as a band
+    instead of a dense (N_hr x N_lr) matrix.
+
+    Parameters
+    ----------
+    x_hr: array
+        Coordinates of the high resolution samples
+    x_lr: array
+        Coordinates of the (regularly spaced) low resolution samples
+    a: int
+        Lanczos window size parameter, i.e. the support of the kernel
+        in units of the low resolution sampling
+
+    Returns
+    -------
+    weights: array
+        (N_hr, 2a+1) kernel values
+    index: array
+        (N_hr, 2a+1) indices of `x_lr` for every kernel value
+    """
+    h = x_lr[1] - x_lr[0]
+    offsets = np.arange(-a, a + 1)
+    nearest = np.round((x_hr - x_lr[0]) / h).astype("int")
+    index = nearest[:, None] + offsets[None, :]
+    valid = (index >= 0) & (index < len(x_lr))
+    index = np.clip(index, 0, len(x_lr) - 1)
+    dist = (x_lr[index] - x_hr[:, None]) / np.abs(h)
+    weights = np.sinc(dist) * np.sinc(dist / a)
+    weights[~valid | (np.abs(dist) >= a)] = 0
+    return weights, index
+
+
+class FourierShift:
+    """Sub-pixel shifts of a fixed image with phase ramps in Fourier space
+
+    The FFT of `image` is computed only once, so that every new position
+    only requires two 1D phase ramps and an inverse FFT.
+    Calling the instance is an `autograd` primitive with an analytic gradient
+    with respect to the position.
+
+    Parameters
+    ----------
+    image: array
+        2D image, whose reference pixel is at `center`
+    center: tuple
+        Coordinates (y, x) of the reference pixel of `image`
+    margin: int
+        Number of pixels to trim from every side of the shifted image.
+        Including a margin in `image` suppresses the wrap-around of
+        its truncated edges.
+    padding: int
+        Additional padding of the FFT
+    """
+
+    def __init__(self, image, center, margin=0, padding=10):
+        self.center = np.array(center, dtype="float")
+        self.margin = margin
+        self.fft_shape = fft._get_fft_shape(image, image, padding=padding)
+        self.shifter_y, self.shifter_x = mk_shifter(self.fft_shape)
+        self.image_fft = np.fft.rfftn(image, self.fft_shape)
+        self.slices = tuple(slice(margin, s - margin) for s in image.shape)
+
+    def __call__(self, y, x):
+        """Image with its reference pixel shifted to (y, x)
+        """
+        return _fourier_shift(y, x, self)
+
+    def _get_fft(self, y, x):
+        dy, dx = y - self.center[0], x - self.center[1]
+        ramp_y = np.exp(self.shifter_y * dy)
+        ramp_x = np.exp(self.shifter_x * dx)
+        return self.image_fft * ramp_y[:, None] * ramp_x[None, :]
+
+    def image(self, y, x):
+        image = np.fft.irfftn(self._get_fft(y, x), self.fft_shape)
+        return image[self.slices]
+
+    def gradient(self, y, x):
+        """Derivatives of `image` with respect to y and x
+        """
+        # the derivative of the phase ramp only brings down the shifter
+        image_fft = self._get_fft(y, x)
+        image_fft = np.stack(
+            [image_fft * self.shifter_y[:, None], image_fft * self.shifter_x[None, :]]
+        )
+        gradient = np.fft.irfftn(image_fft, self.fft_shape, axes=(1, 2))
+        return gradient[(slice(None),) + self.slices]
+
+
+@primitive
+def _fourier_shift(y, x, shifter):
+    return shifter.image(y, x)
+
+
+def _fourier_shift_vjp(axis):
+    def vjp_maker(ans, y, x, shifter):
+        gradient = shifter.gradient(y, x)[axis]
+        return lambda g: np.sum(g * gradient)
+
+    return vjp_maker
+
+
+defvjp(_fourier_shift, _fourier_shift_vjp(0), _fourier_shift_vjp(1))
+
+
+def sinc_interp(images, coord_hr, coord_lr, angle=None, padding=3, window=None):
     """
     Parameters
     ----------
@@ -357,6 +499,10 @@ def sinc_interp(images, coord_hr, coord_lr, angle=None, padding=3):
         rotation angle between coordinate sets coord_hr and coord_lr
     padding: int
         value of zero padding for fft
+    window: int
+        Support of the Lanczos-truncated sinc kernel in units of the low
+        resolution sampling. If `None`, the dense sinc kernel is used.
+        Only used if `angle` is `None`.
     Returns
     -------
         result:  interpolated  samples at positions coord_hr
@@ -369,6 +515,15 @@ def sinc_interp(images, coord_hr, coord_lr, angle=None, padding=3):
     assert hy != 0
     assert hx != 0
 
+    if angle is None and window is not None:
+        # banded version of the dense products below, batched over channels
+        wy, iy = get_banded_sinc(y_hr, y_lr, a=window)
+        wx, ix = get_banded_sinc(x_hr, x_lr, a=window)
+        images_t = np.swapaxes(images, 1, 2)
+        result = np.einsum("ik,cikj->cij", wy, images_t[:, iy, :])
+        result = np.einsum("jk,cijk->cij", wx, result[:, :, ix])
+        return result
+
     if angle is None:
         result = [
             np.dot(
@@ -0,0 +1,535 @@
+from functools import partial
+import importlib
+import json
+from types import FunctionType
+
+import numpy as np
+
+from .bbox import Box
+from .blend import Blend
+from .component import (
+    Component,
+    ComponentTree,
+    CubeComponent,
+    FactorizedComponent,
+    FunctionComponent,
+)
+from .constraint import Constraint, ConstraintChain
+from .parameter import Parameter
+from .prior import Prior
+from .source import PointSource
+
+#: Version of the file format written by `save_blend`
+FORMAT_VERSION = 2
+
+# attributes that are rebuilt from the frame, bbox, and parameters on load
+_rebuilt = {
+    "frame",
+    "bbox",
+    "kwargs",
+    "pad_width",
+    "slices",
+    "fft_shape",
+    "shifter_y",
+    "shifter_x",
+    "psf",
+}
+
+
+# modules whose classes and functions can be referenced in files
+_modules = (
+    "scarlet.component",
+    "scarlet.source",
+    "scarlet.constraint",
+    "scarlet.prior",
+    "scarlet.operator",
+    "scarlet.parameter",
+    "proxmin.operators",
+)
+
+# kinds of classes that can be stored and loaded, everything else is a function
+_classes = (Component, ComponentTree, Constraint, ConstraintChain, Prior)
+
+_allowed = None
+
+
+def _get_allowed():
+    """Classes and functions that can be stored, by their path
+    """
+    global _allowed
+    if _allowed is None:
+        _allowed = {}
+        for name in _modules:
+            module = importlib.import_module(name)
+            for obj in vars(module).values():
+                if getattr(obj, "__module__", None) != name:
+                    continue
+                if isinstance(obj, type):
+                    if not issubclass(obj, _classes):
+                        continue
+                elif not isinstance(obj, FunctionType):
+                    continue
+                _allowed["{}:{}".format(name, obj.__qualname__)] = obj
+    return _allowed
+
+
+_paths = {}
+
+
+def _get_path(obj):
+    try:
+        return _paths[obj]
+    except (KeyError, TypeError):
+        pass
+    path = "{}:{}".format(
+        getattr(obj, "__module__", None), getattr(obj, "__qualname__", None)
+    )
+    if _get_allowed().get(path) is not obj:
+        raise TypeError("{} cannot be stored".format(obj))
+    _paths[obj] = path
+    return path
+
+
+def _from_path(path, base=None):
+    """Allowed class or function at `path`, a subclass of `base` if given
+    """
+    obj = _get_allowed().get(path)
+    if obj is None or base is not None and not (
+        isinstance(obj, type) and issubclass(obj, base)
+    ):
+        raise ValueError("{} cannot be loaded".format(path))
+    return obj
+
+
+def _encode_function(value):
+    # bound methods are not allowed, they need their instance
+    return ("function", _get_path(value))
+
+
+def _encode_object(value):
+    if not isinstance(value, (Constraint, ConstraintChain, Prior)):
+        raise TypeError("{} cannot be stored".format(value))
+    return ("object", _get_path(type(value)), _encode(vars(value)))
+
+
+# encoders by type, extended by the types of functions and objects encountered
+_encoders = {
+    type(None): lambda value: value,
+    bool: lambda value: value,
+    int: lambda value: value,
+    float: lambda value: value,
+    str: lambda value: value,
+    list: lambda value: ("list",) + tuple(_encode(v) for v in value),
+    tuple: lambda value: ("tuple",) + tuple(_encode(v) for v in value),
+    dict: lambda value: ("dict",) + tuple((k, _encode(v)) for k, v in value.items()),
+    partial: lambda value: (
+        "partial",
+        _encode(value.func),
+        _encode(value.args),
+        _encode(value.keywords),
+    ),
+}
+
+
+def _encode(value):
+    """Hashable and JSON-compatible representation of `value`
+
+    Supports python and numpy scalars, strings, lists, tuples, dicts,
+    numerical arrays, partials, and the functions, classes, constraints and
+    priors with such attributes from the modules in `_modules`.
+    Everything but scalars and strings is encoded as a tuple that starts with
+    the kind of `value`, which JSON stores as a list.
+    """
+    encoder = _encoders.get(type(value))
+    if encoder is not None:
+        return encoder(value)
+
+    if isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray) and value.dtype.kind in "biuf":
+        return ("array", value.dtype.str, value.shape, tuple(value.ravel().tolist()))
+    if isinstance(value, type) or callable(value) and hasattr(value, "__qualname__"):
+        encoder = _encode_function
+    elif hasattr(value, "__dict__"):
+        encoder = _encode_object
+    else:
+        raise TypeError("{} cannot be stored".format(value))
+    _encoders.setdefault(type(value), encoder)
+    return encoder(value)
+
+
+def _decode(value):
+    """Inverse of `_encode` for the JSON representation
+    """
+    if not isinstance(value, list):
+        return value
+    kind, args = value[0], value[1:]
+    if kind == "list":
+        return [_decode(v) for v in args]
+    if kind == "tuple":
+        return tuple(_decode(v) for v in args)
+    if kind == "dict":
+        return {k: _decode(v) for k, v in args}
+    if kind == "array":
+        dtype, shape, values = args
+        return np.array(values, dtype=dtype).reshape(shape)
+    if kind == "partial":
+        func, args, kwargs = (_decode(v) for v in args)
+        return partial(func, *args, **kwargs)
+    if kind == "function":
+        return _from_path(args[0])
+    if kind == "object":
+        cls = _from_path(args[0], (Constraint, ConstraintChain, Prior))
+        obj = cls.__new__(cls)
+        obj.__dict__.update(_decode(args[1]))
+        return obj
+    raise ValueError("Unknown entry {}".format(value))
+
+
+class _Table:
+    """Unique encoded entries and their index
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.index = {}
+
+    def add(self, value):
+        try:
+            return self.index[value]
+        except KeyError:
+            self.index[value] = len(self.entries)
+            self.entries.append(value)
+            return self.index[value]
+
+
+def _get_attributes(obj):
+    """Encoded attributes of `obj` that are not rebuilt on load
+    """
+    attributes = {}
+    for name, value in vars(obj).items():
+        # private attributes are caches or rebuilt
+        if name in _rebuilt or name.startswith("_"):
+            continue
+        attributes[name] = _encode(value)
+    return attributes
+
+
+def save_blend(filename, blend):
+    """Store the sources of `blend` and their parameters in a file
+
+    The file is a `numpy` `.npz` archive with a column for every property of
+    the components and their parameters, and a JSON header for the metadata
+    that is shared by many of them, e.g. the types of components, constraints,
+    and step sizes. It is independent of the frame and the observations;
+    see `load_blend` to rebuild the blend from the file.
+
+    Supported are sources that are `~scarlet.component.CubeComponent`,
+    `~scarlet.component.FactorizedComponent`, `~scarlet.source.PointSource`,
+    or `~scarlet.component.ComponentTree` of those, and their subclasses in
+    `scarlet`, as long as their attributes, constraints, steps, and priors are
+    made of numbers, strings, arrays, containers, and the functions,
+    constraints, and priors of `scarlet` or the operators of
+    `proxmin.operators`. Only those are rebuilt on load, so files cannot refer
+    to arbitrary code. Optimizer moments are not stored.
+
+    Parameters
+    ----------
+    filename: str or file
+        Name of the file, `.npz` is appended if it doesn't have that extension
+    blend: `~scarlet.Blend`
+        Blend to store
+
+    Raises
+    ------
+    `TypeError` when a source or parameter cannot be stored
+    """
+    types = _Table()
+    specs = _Table()
+    names = _Table()
+    dtypes = _Table()
+
+    source_type, source_attributes = [], []
+    component_source, component_type, component_attributes = [], [], []
+    component_parameters, component_parameter_count = [], []
+    has_bbox, bbox_origin, bbox_shape = [], [], []
+    parameters = {}
+    values = []
+
+    for s, source in enumerate(blend.sources):
+        if isinstance(source, ComponentTree):
+            components = source._tree
+            if not all(isinstance(c, Component) for c in components):
+                raise TypeError("Nested trees of sources cannot be stored")
+            source_attributes.append(_get_attributes(source))
+        else:
+            components = (source,)
+            source_attributes.append(None)
+        source_type.append(types.add(_get_path(type(source))))
+
+        for c in components:
+            if isinstance(c, FunctionComponent) and not isinstance(c, PointSource):
+                raise TypeError("Functions of {} cannot be stored".format(c))
+            attributes = _get_attributes(c)
+            if isinstance(c, PointSource):
+                attributes["fourier_shift"] = c._shifted_psf is not None
+            else:
+                attributes["kwargs"] = _encode(c.kwargs)
+            component_attributes.append(attributes)
+            component_source.append(s)
+            component_type.append(types.add(_get_path(type(c))))
+            has_bbox.append(c.bbox is not None)
+            box = c.bbox if c.bbox is not None else blend.frame
+            bbox_origin.append(box.origin)
+            bbox_shape.append(box.shape)
+
+            # shared parameters are stored once
+            for p in c._parameters:
+                if id(p) not in parameters:
+                    parameters[id(p)] = (len(parameters), p)
+                    values.append(p.view(np.ndarray).reshape(-1))
+                component_parameters.append(parameters[id(p)][0])
+            component_parameter_count.append(len(c._parameters))
+
+    P = len(parameters)
+    parameter_shape = []
+    parameter_ndim = np.zeros(P, dtype=int)
+    parameter_dtype = np.zeros(P, dtype=int)
+    parameter_name = np.zeros(P, dtype=int)
+    parameter_fixed = np.zeros(P, dtype=bool)
+    parameter_step = np.full(P, np.nan)
+    parameter_step_spec = np.full(P, -1)
+    parameter_constraint = np.full(P, -1)
+    parameter_prior = np.full(P, -1)
+    for i, p in parameters.values():
+        parameter_ndim[i] = p.ndim
+        parameter_shape += p.shape
+        parameter_dtype[i] = dtypes.add(p.dtype.str)
+        parameter_name[i] = names.add(p.name)
+        parameter_fixed[i] = p.fixed
+        if isinstance(p.step, (int, float, np.number)):
+            parameter_step[i] = p.step
+        else:
+            parameter_step_spec[i] = specs.add(_encode(p.step))
+        if p.constraint is not None:
+            parameter_constraint[i] = specs.add(_encode(p.constraint))
+        if p.prior is not None:
+            parameter_prior[i] = specs.add(_encode(p.prior))
+
+    header = {
+        "format": "scarlet.Blend",
+        "version": FORMAT_VERSION,
+        "types": types.entries,
+        "specs": specs.entries,
+        "names": names.entries,
+        "dtypes": dtypes.entries,
+        "source_attributes": source_attributes,
+        "component_attributes": component_attributes,
+    }
+    sizes = np.array([v.size for v in values], dtype=int)
+    np.savez(
+        filename,
+        header=np.array(json.dumps(header)),
+        source_type=np.array(source_type, dtype=int),
+        component_source=np.array(component_source, dtype=int),
+        component_type=np.array(component_type, dtype=int),
+        component_parameter_offset=np.concatenate(
+            ([0], np.cumsum(component_parameter_count, dtype=int))
+        ),
+        component_parameters=np.array(component_parameters, dtype=int),
+        has_bbox=np.array(has_bbox, dtype=bool),
+        bbox_origin=np.array(bbox_origin, dtype=int).reshape(-1, 3),
+        bbox_shape=np.array(bbox_shape, dtype=int).reshape(-1, 3),
+        parameter_offset=np.concatenate(([0], np.cumsum(sizes))),
+        parameter_shape=np.array(parameter_shape, dtype=int),
+        parameter_ndim=parameter_ndim,
+        parameter_dtype=parameter_dtype,
+        parameter_name=parameter_name,
+        parameter_fixed=parameter_fixed,
+        parameter_step=parameter_step,
+        parameter_step_spec=parameter_step_spec,
+        parameter_constraint=parameter_constraint,
+        parameter_prior=parameter_prior,
+        parameter_values=np.concatenate(values).astype(np.float64)
+        if len(values)
+        else np.zeros(0),
+        loss=np.array(blend.loss, dtype=np.float64),
+    )
+
+
+def _make_component(cls, frame, parameters, bbox, attributes):
+    """Rebuild a component of type `cls` with the constructor of its base class
+    """
+    component = cls.__new__(cls)
+    kwargs = attributes.pop("kwargs", {})
+    fourier_shift = attributes.pop("fourier_shift", False)
+    component.__dict__.update(attributes)
+
+    if issubclass(cls, CubeComponent):
+        CubeComponent.__init__(component, frame, *parameters, bbox=bbox)
+    elif issubclass(cls, PointSource):
+        component.psf = frame.psf
+        component._shifted_psf = None
+        if fourier_shift or component.psf._func is None:
+            # pixel center from the bbox, see `PointSource.__init__`
+            pixel_center = (
+                bbox.origin[1] + frame.psf.shape[1] // 2,
+                bbox.origin[2] + frame.psf.shape[2] // 2,
+            )
+            component._shifted_psf = component._get_shifted_psf(pixel_center, bbox)
+        FunctionComponent.__init__(
+            component, frame, *parameters, component._psf_wrapper, bbox=bbox
+        )
+    elif issubclass(cls, FactorizedComponent) and not issubclass(
+        cls, FunctionComponent
+    ):
+        sed, morph = parameters[:2]
+        shift = parameters[2] if len(parameters) == 3 else None
+        FactorizedComponent.__init__(
+            component, frame, sed, morph, shift=shift, bbox=bbox, **kwargs
+        )
+    else:
+        raise TypeError("Components of type {} cannot be loaded".format(cls))
+    return component
+
+
+def _upgrade_columns(columns):
+    """Convert the columns of format version 1 to the current layout
+
+    Version 1 stored up to 3 parameters per component and up to 3 dimensions
+    per parameter, padded with -1 and 0.
+    """
+    index = [[i for i in row if i >= 0] for row in columns["component_parameters"]]
+    columns["component_parameters"] = [i for row in index for i in row]
+    columns["component_parameter_offset"] = np.concatenate(
+        ([0], np.cumsum([len(row) for row in index], dtype=int))
+    ).tolist()
+    columns["parameter_shape"] = [
+        n
+        for shape, ndim in zip(columns["parameter_shape"], columns["parameter_ndim"])
+        for n in shape[:ndim]
+    ]
+
+
+def load_sources(filename, frame):
+    """Rebuild the sources stored with `save_blend` in `frame`
+
+    Parameters
+    ----------
+    filename: str or file
+        Name of the file
+    frame: `~scarlet.Frame`
+        Model frame of the sources
+
+    Returns
+    -------
+    sources: list
+        Sources of the blend, components or `~scarlet.component.ComponentTree`
+    loss: array
+        Loss of every iteration of the stored blend
+    """
+    with np.load(filename, allow_pickle=False) as data:
+        columns = {name: data[name] for name in data.files}
+    values, loss = columns.pop("parameter_values"), columns.pop("loss")
+    # python lists are much faster to index element-wise
+    columns = {name: column.tolist() for name, column in columns.items()}
+    header = json.loads(str(columns["header"]))
+    if header.get("format") != "scarlet.Blend":
+        raise ValueError("{} does not contain a blend".format(filename))
+    if header["version"] > FORMAT_VERSION:
+        raise ValueError(
+            "{} has format version {}, this version reads up to {}".format(
+                filename, header["version"], FORMAT_VERSION
+            )
+        )
+
+    types = [
+        _from_path(path, (Component, ComponentTree)) for path in header["types"]
+    ]
+    specs = [_decode(spec) for spec in header["specs"]]
+    names, dtypes = header["names"], header["dtypes"]
+
+    if header["version"] < 2:
+        _upgrade_columns(columns)
+
+    offsets = columns["parameter_offset"]
+    shape_offsets = np.concatenate(([0], np.cumsum(columns["parameter_ndim"])))
+    parameters = []
+    for i in range(len(offsets) - 1):
+        shape = tuple(
+            columns["parameter_shape"][shape_offsets[i] : shape_offsets[i + 1]]
+        )
+        dtype = dtypes[columns["parameter_dtype"][i]]
+        array = values[offsets[i] : offsets[i + 1]].astype(dtype)
+        step = columns["parameter_step_spec"][i]
+        constraint = columns["parameter_constraint"][i]
+        prior = columns["parameter_prior"][i]
+        parameters.append(
+            Parameter(
+                array.reshape(shape),
+                name=names[columns["parameter_name"][i]],
+                prior=specs[prior] if prior >= 0 else None,
+                constraint=specs[constraint] if constraint >= 0 else None,
+                step=specs[step] if step >= 0 else columns["parameter_step"][i],
+                fixed=columns["parameter_fixed"][i],
+            )
+        )
+
+    components = {}
+    index_offsets = columns["component_parameter_offset"]
+    for k, s in enumerate(columns["component_source"]):
+        bbox = None
+        if columns["has_bbox"][k]:
+            bbox = Box(columns["bbox_shape"][k], origin=columns["bbox_origin"][k])
+        index = columns["component_parameters"][index_offsets[k] : index_offsets[k + 1]]
+        component = _make_component(
+            types[columns["component_type"][k]],
+            frame,
+            [parameters[i] for i in index],
+            bbox,
+            {k: _decode(v) for k, v in header["component_attributes"][k].items()},
+        )
+        if len(index) == 3:
+            # components with the same shift share its phase ramps
+            for other in components.get(s, []):
+                if other._parameters[2:] == (parameters[index[2]],):
+                    component._phase_cache = other._phase_cache
+                    break
+        components.setdefault(s, []).append(component)
+
+    sources = []
+    for s, cls in enumerate(columns["source_type"]):
+        cls = types[cls]
+        if issubclass(cls, ComponentTree):
+            source = cls.__new__(cls)
+            attributes = header["source_attributes"][s]
+            source.__dict__.update({k: _decode(v) for k, v in attributes.items()})
+            ComponentTree.__init__(source, components[s])
+        else:
+            source = components[s][0]
+        sources.append(source)
+    return sources, loss
+
+
+def load_blend(filename, frame, observations):
+    """Rebuild the blend stored with `save_blend`
+
+    Parameters
+    ----------
+    filename: str or file
+        Name of the file
+    frame: `~scarlet.Frame`
+        Model frame of the sources
+    observations: a `scarlet.Observation` instance or a list thereof
+        Observations of the blend
+
+    Returns
+    -------
+    blend: `~scarlet.Blend`
+    """
+    sources, loss = load_sources(filename, frame)
+    blend = Blend(sources, observations)
+    blend.loss = list(loss)
+    return blend
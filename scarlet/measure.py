@@ -1,8 +1,29 @@
 import numpy as np
-from .component import *
+from .component import Component
+from .blend import Blend
 
 
 def get_model(component):
+    """Get the model of `component` in its own bounding box
+
+    Parameters
+    ----------
+    component: `scarlet.Component` or `scarlet.ComponentTree`
+        Component to analyze
+
+    Returns
+    -------
+    model: array
+        (Channels, Height, Width) image of the model in `component.bbox`
+    """
+    # the memoized model can be a view of the parameters: don't hand it out
+    return np.array(_get_model(component))
+
+
+def _get_model(component):
+    if isinstance(component, Component) and component._supports_bbox:
+        return component._cached_bbox_model()
+
     frame_ = component.frame
     component.set_frame(component.bbox)
     model = component.get_model()
@@ -10,6 +31,79 @@ def get_model(component):
     return model
 
 
+class _Models:
+    """Models of multiple components as one array of concatenated pixels
+
+    Parameters
+    ----------
+    models: list of array
+        (Channels, Height, Width) models with the same number of channels
+    origins: list of tuple
+        Origins of the bounding boxes of the models
+    """
+
+    def __init__(self, models, origins):
+        self.C = models[0].shape[0]
+        # (Channels, pixels of all models), and the first pixel of every model
+        self.data = np.concatenate([m.reshape(self.C, -1) for m in models], axis=1)
+        sizes = np.array([m[0].size for m in models])
+        self.starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        self.sizes = sizes
+        self.origins = np.array(origins)
+
+        # position of every pixel in its model
+        width = np.repeat([m.shape[2] for m in models], sizes)
+        index = np.arange(self.data.shape[1]) - np.repeat(self.starts, sizes)
+        self.y, self.x = index // width, index % width
+        self.index = index
+
+    def sum(self, X):
+        """Sum of `X` over the pixels of every model
+        """
+        return np.add.reduceat(X, self.starts, axis=-1)
+
+    def repeat(self, X):
+        """Value of every model in `X` for each of its pixels
+        """
+        return np.repeat(X, self.sizes, axis=-1)
+
+
+def _max_pixel(models):
+    peak = np.maximum.reduceat(models.data.max(axis=0), models.starts)
+    # first maximum in the (Channels, Height, Width) order of every model
+    channels = np.arange(models.C)[:, None]
+    key = np.where(
+        models.data == models.repeat(peak),
+        channels * models.repeat(models.sizes) + models.index,
+        np.iinfo(np.int64).max,
+    )
+    key = np.minimum.reduceat(key.min(axis=0), models.starts)
+    first = models.starts + key % models.sizes
+    pixel = np.stack([key // models.sizes, models.y[first], models.x[first]], axis=1)
+    return pixel + models.origins
+
+
+def _flux(models):
+    return models.sum(models.data).T
+
+
+def _centroid(models):
+    total = models.data.sum(axis=0)
+    flux = models.sum(total)
+    centroid = np.stack(
+        [
+            np.dot(np.arange(models.C), models.sum(models.data)),
+            models.sum(total * models.y),
+            models.sum(total * models.x),
+        ],
+        axis=1,
+    )
+    return centroid / flux[:, None] + models.origins
+
+
+_measurements = {"max_pixel": _max_pixel, "flux": _flux, "centroid": _centroid}
+
+
 def max_pixel(component):
     """Determine pixel with maximum value
 
@@ -18,10 +112,7 @@ def max_pixel(component):
     component: `scarlet.Component` or `scarlet.ComponentTree`
         Component to analyze
     """
-    model = get_model(component)
-    return tuple(
-        np.unravel_index(np.argmax(model_), model.shape) + component.bbox.origin
-    )
+    return tuple(catalog([component], ("max_pixel",))["max_pixel"][0])
 
 
 def flux(component):
@@ -32,8 +123,7 @@ def flux(component):
     component: `scarlet.Component` or `scarlet.ComponentTree`
         Component to analyze
     """
-    model = get_model(component)
-    return model.sum(axis=(1, 2))
+    return catalog([component], ("flux",))["flux"][0]
 
 
 def centroid(component):
@@ -44,7 +134,40 @@ def centroid(component):
     component: `scarlet.Component` or `scarlet.ComponentTree`
         Component to analyze
     """
-    model = get_model(component)
-    indices = np.indices(model.shape)
-    centroid = np.array([np.sum(ind * model) for ind in indices]) / model.sum()
-    return centroid + component.bbox.origin
+    return catalog([component], ("centroid",))["centroid"][0]
+
+
+def catalog(sources, measurements=("flux", "centroid", "max_pixel")):
+    """Perform several measurements for a list of sources
+
+    Every source is rendered only once in its own bounding box, and all
+    measurements are computed for all sources at once from these models.
+
+    Parameters
+    ----------
+    sources: `scarlet.Blend` or list of `scarlet.Component` or `scarlet.ComponentTree`
+        Sources to analyze. For a `Blend`, its `sources` are analyzed.
+        Their bounding boxes need to have the same number of channels.
+    measurements: list of str
+        Names of the measurements, from `max_pixel`, `flux`, and `centroid`.
+
+    Returns
+    -------
+    table: dict
+        Array of the results for all sources, keyed by measurement name
+    """
+    if isinstance(sources, Blend):
+        sources = sources.sources
+
+    for name in measurements:
+        if name not in _measurements:
+            msg = "Unknown measurement {}, use one of {}"
+            raise ValueError(msg.format(name, list(_measurements.keys())))
+
+    if not len(sources):
+        return {name: np.array([]) for name in measurements}
+    models = _Models(
+        [_get_model(source) for source in sources],
+        [source.bbox.origin for source in sources],
+    )
+    return {name: _measurements[name](models) for name in measurements}
@@ -0,0 +1,306 @@
+import numpy as np
+
+from .bbox import Box
+from .component import FactorizedComponent, FunctionComponent, CubeComponent
+from .frame import Frame
+from .interpolation import get_upsampling_matrix
+from .observation import Observation, LowResObservation
+from .parameter import Parameter
+from .psf import PSF
+
+
+def _get_binned_box(box, factor):
+    """Spatial box of binned pixels that covers `box` and keeps its center
+
+    Binned pixels are aligned with the origin of the frame. The center pixel
+    of `box` falls into the center pixel of the binned box, which is needed by
+    constraints that act around the center, e.g. monotonicity.
+
+    Parameters
+    ----------
+    box: `~scarlet.Box`
+        2D box in original pixels
+    factor: int
+        Binning factor
+
+    Returns
+    -------
+    binned_box: `~scarlet.Box`
+        2D box in binned pixels
+    """
+    origin, shape = [], []
+    for o, n in zip(box.origin, box.shape):
+        center = (o + n // 2) // factor
+        lo, hi = o // factor, -(-(o + n) // factor)
+        half = max(center - lo, hi - 1 - center)
+        origin.append(center - half)
+        shape.append(2 * half + 1)
+    return Box(shape, origin=origin)
+
+
+def _bin(X, box, binned_box, factor):
+    """Sum of `X` in `box` over the binned pixels of `binned_box`
+    """
+    shape = tuple(n * factor for n in binned_box.shape)
+    padded = np.zeros(X.shape[:-2] + shape, dtype=X.dtype)
+    y, x = (o - o_ * factor for o, o_ in zip(box.origin, binned_box.origin))
+    padded[..., y : y + X.shape[-2], x : x + X.shape[-1]] = X
+    ny, nx = binned_box.shape
+    return padded.reshape(X.shape[:-2] + (ny, factor, nx, factor)).sum(axis=(-3, -1))
+
+
+def _upsample(X, box, binned_box, factor):
+    """Interpolate binned `X` in `binned_box` to the original pixels of `box`
+    """
+    matrix_y, matrix_x = (
+        get_upsampling_matrix(n, factor) for n in binned_box.shape
+    )
+    y, x = (o - o_ * factor for o, o_ in zip(box.origin, binned_box.origin))
+    matrix_y = matrix_y[y : y + box.shape[0]]
+    matrix_x = matrix_x[x : x + box.shape[1]]
+    return np.einsum("yi,...ij,xj->...yx", matrix_y, X, matrix_x)
+
+
+def _upsample_morph(component, binned_component, X, factor):
+    """Interpolate `X` from the bbox of `binned_component` to that of `component`
+    """
+    box = component.bbox if component.bbox is not None else component.frame
+    box = Box(box.shape[1:], origin=box.origin[1:])
+    binned_box = binned_component.bbox
+    binned_box = Box(binned_box.shape[1:], origin=binned_box.origin[1:])
+    return _upsample(X._data, box, binned_box, factor)
+
+
+def downsample_psf(psf, factor):
+    """Bin the image of `psf`
+
+    Parameters
+    ----------
+    psf: `~scarlet.PSF`
+        PSF in original pixels
+    factor: int
+        Binning factor
+
+    Returns
+    -------
+    psf: `~scarlet.PSF`
+        PSF image in binned pixels, centered in its image
+
+    The blocks of binned pixels are aligned with the center of the PSF
+    image, so that all PSFs binned by the same factor are centered
+    consistently, and difference kernels between them don't shift.
+    """
+    image = psf.image
+    origin = tuple((factor - 1) // 2 - n // 2 for n in image.shape[1:])
+    box = Box(image.shape[1:], origin=origin)
+    return PSF(_bin(image, box, _get_binned_box(box, factor), factor))
+
+
+def downsample_frame(frame, factor):
+    """Frame with pixels binned by `factor`
+
+    Parameters
+    ----------
+    frame: `~scarlet.Frame`
+        Model frame
+    factor: int
+        Binning factor
+
+    Returns
+    -------
+    frame: `~scarlet.Frame`
+        Binned frame, without WCS
+    """
+    C, Ny, Nx = frame.shape
+    shape = (C, -(-Ny // factor), -(-Nx // factor))
+    psf = None if frame.psf is None else downsample_psf(frame.psf, factor)
+    return Frame(shape, psfs=psf, channels=frame.channels, dtype=frame.dtype)
+
+
+def downsample_observation(observation, frame, factor):
+    """Observation with pixels binned by `factor`
+
+    Binned images are the weighted means of the original pixels, and the
+    binned weights their sums, so that the SEDs of the components don't change
+    under binning.
+
+    Parameters
+    ----------
+    observation: `~scarlet.Observation`
+        Observation, matched to the original model frame
+    frame: `~scarlet.Frame`
+        Binned model frame, see `downsample_frame`
+    factor: int
+        Binning factor
+
+    Returns
+    -------
+    observation: `~scarlet.Observation`
+        Binned observation, matched to `frame`
+    """
+    if type(observation) is not Observation or isinstance(
+        observation, LowResObservation
+    ):
+        raise NotImplementedError("Only instances of Observation can be binned")
+    if any(o != 0 for o in observation.bbox.origin[1:]):
+        raise NotImplementedError(
+            "Binned observations need to be aligned with the model frame"
+        )
+    box = Box(observation.images.shape[1:])
+    binned_box = Box(tuple(-(-n // factor) for n in box.shape))
+    weights = _bin(observation.weights, box, binned_box, factor)
+    images = _bin(observation.weights * observation.images, box, binned_box, factor)
+    valid = weights > 0
+    images[valid] /= weights[valid]
+    images[~valid] = 0
+
+    psf = observation.frame.psf
+    if psf is not None:
+        psf = downsample_psf(psf, factor)
+    binned = Observation(
+        images,
+        psfs=psf,
+        weights=weights,
+        channels=observation.frame.channels,
+        padding=observation._padding,
+    )
+    return binned.match(frame)
+
+
+def _downsample_parameter(parameter, X):
+    """Parameter with values `X` and the metadata of `parameter`
+
+    Priors are dropped as they are specific to the original pixels.
+    """
+    return Parameter(
+        X.astype(parameter.dtype),
+        name=parameter.name,
+        constraint=parameter.constraint,
+        step=parameter.step,
+        fixed=parameter.fixed,
+    )
+
+
+def downsample_blend(blend, factor):
+    """Blend with the pixels of model and observations binned by `factor`
+
+    SEDs keep their values, morphologies and data cubes are averaged over the
+    binned pixels, and shifts are expressed in binned pixels.
+    Components that cannot be binned in this way, e.g.
+    `~scarlet.component.FunctionComponent`, are replaced by their binned
+    model, which is held fixed.
+    Parameters shared by multiple components are also shared by the binned
+    components.
+
+    Parameters
+    ----------
+    blend: `~scarlet.Blend`
+        Blend in the model frame
+    factor: int
+        Binning factor
+
+    Returns
+    -------
+    binned_blend: `~scarlet.Blend`
+        Blend in the binned model frame
+    pairs: list
+        Tuples of original and binned component, for `upsample_blend`
+    """
+    frame = downsample_frame(blend.frame, factor)
+    observations = [
+        downsample_observation(observation, frame, factor)
+        for observation in blend.observations
+    ]
+    area = factor ** 2
+
+    parameters = {}
+    pairs = []
+    for c in blend.components:
+        box = c.bbox if c.bbox is not None else blend.frame
+        spatial = Box(box.shape[1:], origin=box.origin[1:])
+        binned = _get_binned_box(spatial, factor)
+        bbox = Box(
+            (box.shape[0],) + binned.shape, origin=(box.origin[0],) + binned.origin
+        )
+
+        if isinstance(c, FactorizedComponent) and not isinstance(
+            c, FunctionComponent
+        ):
+            sed, morph = c._parameters[:2]
+            shift = c._parameters[2] if len(c._parameters) == 3 else None
+            for p, X in [
+                (sed, sed._data),
+                (morph, _bin(morph._data, spatial, binned, factor) / area),
+                (shift, None if shift is None else shift._data / factor),
+            ]:
+                if p is not None and id(p) not in parameters:
+                    parameters[id(p)] = _downsample_parameter(p, X)
+            binned_c = FactorizedComponent(
+                frame,
+                parameters[id(sed)],
+                parameters[id(morph)],
+                shift=None if shift is None else parameters[id(shift)],
+                bbox=bbox,
+            )
+        elif isinstance(c, CubeComponent):
+            cube = c._parameters[0]
+            if id(cube) not in parameters:
+                X = _bin(cube._data, spatial, binned, factor) / area
+                parameters[id(cube)] = _downsample_parameter(cube, X)
+            binned_c = CubeComponent(frame, parameters[id(cube)], bbox=bbox)
+        else:
+            model = c.get_model()
+            X = _bin(model, Box(model.shape[1:]), Box(frame.shape[1:]), factor) / area
+            binned_c = CubeComponent(frame, Parameter(X, name="cube", fixed=True))
+        pairs.append((c, binned_c))
+
+    binned_blend = type(blend)([c for _, c in pairs], observations)
+    return binned_blend, pairs
+
+
+def upsample_blend(pairs, factor):
+    """Update the original components from their binned counterparts
+
+    Morphologies and data cubes are interpolated with bilinear kernels,
+    which preserve positivity and monotonicity.
+    Every free parameter is updated in place, fixed parameters are left
+    unchanged.
+
+    Parameters
+    ----------
+    pairs: list
+        Result of `downsample_blend`, after fitting the binned blend
+    factor: int
+        Binning factor
+    """
+    done = set()
+    for c, binned_c in pairs:
+        if isinstance(c, FactorizedComponent) and not isinstance(
+            c, FunctionComponent
+        ):
+            sed, morph = c._parameters[:2]
+            binned_sed, binned_morph = binned_c._parameters[:2]
+            X = _upsample_morph(c, binned_c, binned_morph, factor)
+            # interpolation lowers the peak of the morphology:
+            # keep the peak and the model by moving the difference to the SED
+            scale = 1
+            if X.max() > 0 and binned_morph.max() > 0:
+                scale = binned_morph.max() / X.max()
+            updates = [(sed, binned_sed._data / scale), (morph, X * scale)]
+            if len(c._parameters) == 3:
+                shift = c._parameters[2]
+                updates.append((shift, binned_c._parameters[2]._data * factor))
+        elif isinstance(c, CubeComponent):
+            cube = c._parameters[0]
+            updates = [
+                (cube, _upsample_morph(c, binned_c, binned_c._parameters[0], factor))
+            ]
+        else:
+            # binned models of the other components are fixed
+            updates = []
+
+        for p, X in updates:
+            if p.fixed or id(p) in done:
+                continue
+            p[:] = X
+            done.add(id(p))
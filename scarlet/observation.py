@@ -1,10 +1,56 @@
+import copy
+import mmap
+from concurrent.futures import ThreadPoolExecutor
+
 import autograd.numpy as np
+from autograd.extend import primitive, defvjp
 
 from .frame import Frame
 from . import interpolation
 from . import fft
 from . import resampling
 from .bbox import Box
+from .psf import GridPSF, GaussianPSF
+
+
+@primitive
+def _scatter_add(values, index, size):
+    """Sum `values` into a flat array of `size` elements at the positions `index`
+
+    Positions `index == size` are dropped.
+    """
+    return np.bincount(index, weights=values, minlength=size + 1)[:size].astype(
+        values.dtype
+    )
+
+
+defvjp(
+    _scatter_add,
+    lambda ans, values, index, size: lambda g: np.append(g, 0)[index],
+)
+
+
+@primitive
+def _gather(x, index):
+    """Elements `x[index]` for an `index` that selects every element at most once
+
+    Slices and arrays of unique indices qualify, so that the gradient can
+    assign instead of accumulate, which is much faster than in
+    `autograd.numpy`.
+    """
+    return x[index]
+
+
+def _gather_vjp(ans, x, index):
+    def vjp(g):
+        result = np.zeros(x.shape, dtype=g.dtype)
+        result[index] = g
+        return result
+
+    return vjp
+
+
+defvjp(_gather, _gather_vjp)
 
 
 class Observation:
@@ -67,6 +113,10 @@ class Observation:
 
         self._padding = padding
 
+    # smallest fraction of zero-weight pixels to evaluate the likelihood
+    # only on the valid pixels
+    min_masked = 0.5
+
     def match(self, model_frame):
         """Match the frame of `Blend` to the frame of this observation.
 
@@ -96,6 +146,17 @@ class Observation:
             origin = (cmin, *yx0)
         self.bbox = Box(shape, origin=origin)
         self.slices = self.bbox.slices_for(model_frame.shape)
+        self._likelihood_data = None
+        # start and shape of the region of model_frame that is rendered
+        bounds = [s.indices(n)[:2] for s, n in zip(self.slices, model_frame.shape)]
+        self._render_box = Box.from_bounds(*bounds)
+        self._render_shape = self._render_box.shape
+        # region of `images` that is compared to the rendered model
+        data_box = Box(self._render_shape, origin=self._render_box.origin)
+        data_box -= self.bbox.origin
+        self._data_slices = data_box.slices_for(shape)
+        self._model_bands = model_frame.shape[0]
+        self._reset_footprints()
 
         # check dtype consistency
         if self.frame.dtype != model_frame.dtype:
@@ -106,28 +167,238 @@ class Observation:
 
         # constrcut diff kernels
         self._diff_kernels = None
+        self._psf_weights = None
         if self.frame.psf is not model_frame.psf:
             assert self.frame.psf is not None and model_frame.psf is not None
-            psf = fft.Fourier(self.frame.psf.update_dtype(model_frame.dtype).image)
-            model_psf = fft.Fourier(
-                model_frame.psf.update_dtype(model_frame.dtype).image
-            )
-            self._diff_kernels = fft.match_psfs(psf, model_psf)
+            if isinstance(self.frame.psf, GridPSF):
+                # spatially varying PSF: one kernel per grid node. The full
+                # frame weighs them with the interpolation weights of each
+                # model pixel, footprints use the kernel at their center.
+                self._diff_kernels = self.frame.psf.update_dtype(
+                    model_frame.dtype
+                ).get_diff_kernels(model_frame.psf.update_dtype(model_frame.dtype))
+                y, x = (
+                    np.arange(s.start, s.stop) - o
+                    for s, o in zip(self.slices[1:], self.bbox.origin[1:])
+                )
+                weights_y, weights_x = self.frame.psf.get_weights(y, x)
+                # only grid nodes with non-zero weights contribute
+                dtype = model_frame.dtype
+                self._psf_weights = [
+                    (i, j, np.outer(weights_y[i], weights_x[j]).astype(dtype))
+                    for i in np.flatnonzero(weights_y.any(axis=1))
+                    for j in np.flatnonzero(weights_x.any(axis=1))
+                ]
+            else:
+                psf = self.frame.psf.update_dtype(model_frame.dtype)
+                model_psf = model_frame.psf.update_dtype(model_frame.dtype)
+                # closed-form kernels are compact, which also shrinks
+                # the FFTs in `_convolve`
+                kernel = None
+                if isinstance(psf, GaussianPSF):
+                    kernel = psf.get_diff_kernel(model_psf)
+                if kernel is not None:
+                    self._diff_kernels = fft.Fourier(kernel.astype(model_frame.dtype))
+                else:
+                    self._diff_kernels = fft.match_psfs(
+                        fft.Fourier(psf.image), fft.Fourier(model_psf.image)
+                    )
 
         return self
 
-    def _convolve(self, model):
+    def _convolve(self, model, kernel=None):
         """Convolve the model in a single band
+
+        With a `GridPSF`, the kernels of the grid nodes are interpolated for
+        every pixel of `model`, which is in the rendered region of the frame,
+        unless a single `kernel` is given, e.g. from `_get_footprint_kernel`.
         """
-        return fft.convolve(fft.Fourier(model), self._diff_kernels, axes=(1, 2)).image
+        if kernel is None and self._psf_weights is None:
+            kernel = self._diff_kernels
+        if kernel is not None:
+            return fft.convolve(fft.Fourier(model), kernel, axes=(1, 2)).image
+
+        result = 0
+        for i, j, weights in self._psf_weights:
+            result = (
+                result
+                + fft.convolve(
+                    fft.Fourier(model * weights[None, :, :]),
+                    self._diff_kernels[i][j],
+                    axes=(1, 2),
+                ).image
+            )
+        return result
+
+    def _use_footprints(self, boxes):
+        """Whether components in `boxes` are cheaper to render separately
+
+        Every component is convolved in its box, padded by the radius of the
+        difference kernel, which is preferred if the total area of these
+        footprints is smaller than the rendered area of the frame.
+        With a `GridPSF`, footprints are convolved with the kernel at their
+        center, see `_get_footprint_kernel`, while the full frame interpolates
+        the kernel for every pixel.
+
+        Parameters
+        ----------
+        boxes: list of `~scarlet.Box`
+            Bounding boxes of the components in the model frame
+
+        Returns
+        -------
+        result: bool
+        """
+        if self._diff_kernels is None:
+            return False
+        radius = [s // 2 for s in self._kernel_shape[1:]]
+        area = 0
+        for box in boxes:
+            if box.origin[0] != 0 or box.shape[0] != self._model_bands:
+                return False
+            area += (box.shape[1] + 2 * radius[0]) * (box.shape[2] + 2 * radius[1])
+        return area < self._render_shape[1] * self._render_shape[2]
+
+    @property
+    def _kernel_shape(self):
+        # all kernels of a `GridPSF` have the same shape
+        if self._psf_weights is not None:
+            return self._diff_kernels[0][0].shape
+        return self._diff_kernels.shape
+
+    def _reset_footprints(self):
+        """Drop the cached indices and kernels of footprints
+
+        They are reused within a fit, but boxes may change between fits.
+        """
+        self._footprint_index = {}
+        self._footprint_kernels = {}
+
+    def _get_footprint_kernel(self, box):
+        """Difference kernel for the footprint of a component in `box`
+
+        With a `GridPSF`, this is the kernel interpolated at the center of
+        `box`, which is cached for every center, otherwise the kernel of the
+        whole frame.
+        """
+        if self._psf_weights is None:
+            return self._diff_kernels
+        # center in the pixels of the observation
+        center = tuple(
+            o + (s - 1) / 2 - o_
+            for o, s, o_ in zip(box.origin[1:], box.shape[1:], self.bbox.origin[1:])
+        )
+        try:
+            return self._footprint_kernels[center]
+        except KeyError:
+            pass
+        weights_y, weights_x = self.frame.psf.get_weights([center[0]], [center[1]])
+        kernel = sum(
+            weights_y[i, 0] * weights_x[j, 0] * self._diff_kernels[i][j].image
+            for i in np.flatnonzero(weights_y[:, 0])
+            for j in np.flatnonzero(weights_x[:, 0])
+        )
+        kernel = fft.Fourier(kernel.astype(self.frame.dtype))
+        self._footprint_kernels[center] = kernel
+        return kernel
+
+    def _get_footprint_index(self, box, shape):
+        """Flat indices in the rendered frame for a footprint in `box`
+
+        The footprint has the spatial `shape` and is centered on `box`,
+        which is inside of the rendered frame.
+        Pixels outside of the rendered frame get the index of its size.
+        The indices are cached for every position and shape of the footprint,
+        until the next `~scarlet.Blend.fit`.
+        """
+        key = (box.origin, box.shape, shape)
+        try:
+            return self._footprint_index[key]
+        except KeyError:
+            pass
+        C, H, W = self._render_shape
+        c, y, x = (
+            np.arange(n) + o - (n - s) // 2 - o_
+            for n, o, s, o_ in zip(
+                (box.shape[0], *shape), box.origin, box.shape, self._render_box.origin
+            )
+        )
+        outside = ((y < 0) | (y >= H))[:, None] | ((x < 0) | (x >= W))[None, :]
+        index = (y[:, None] * W + x[None, :])[None, :, :] + c[:, None, None] * H * W
+        index[:, outside] = C * H * W
+        index = index.flatten()
+        self._footprint_index[key] = index
+        return index
+
+    def _convolve_footprint(self, model, box):
+        """Convolve a single component in its own footprint
+
+        Returns `None` if `box` does not overlap with the rendered frame.
+
+        Parameters
+        ----------
+        model: array
+            Model of the component in its bounding box in the model frame
+        box: `~scarlet.Box`
+            Bounding box of the component
+
+        Returns
+        -------
+        values: array
+            Flattened convolved footprint
+        index: array
+            Flat indices of `values` in the rendered frame, see
+            `_get_footprint_index`
+        """
+        # as in the full frame, only the model in the rendered region counts
+        overlap = box & self._render_box
+        if any(s <= 0 for s in overlap.shape):
+            return None
+        kernel = self._get_footprint_kernel(box)
+        radius = [s // 2 for s in kernel.shape[1:]]
+        pad_width = ((0, 0), (radius[0], radius[0]), (radius[1], radius[1]))
+        slices = Box(overlap.shape, origin=overlap.origin)
+        slices -= box.origin
+        model = model[slices.slices_for(box.shape)]
+        model = np.pad(model, pad_width, mode="constant")
+        values = self._convolve(model, kernel).flatten()
+        return values, self._get_footprint_index(overlap, model.shape[1:])
+
+    def _render_footprints(self, footprints):
+        """Convolve every component in its own footprint
+
+        Parameters
+        ----------
+        footprints: list of (array, `~scarlet.Box`)
+            Models of the components in their bounding boxes in the model frame
+
+        Returns
+        -------
+        image_model: array
+            Sum of the rendered `footprints` in the observation frame
+        """
+        values, index = [], []
+        for model, box in footprints:
+            footprint = self._convolve_footprint(model, box)
+            if footprint is not None:
+                values.append(footprint[0])
+                index.append(footprint[1])
+        if not len(values):
+            return np.zeros(self._render_shape, dtype=self.frame.dtype)
+        size = np.prod(self._render_shape)
+        image_model = _scatter_add(
+            np.concatenate(values), np.concatenate(index), size
+        )
+        return image_model.reshape(self._render_shape)
 
     def render(self, model):
         """Convolve a model to the observation frame
 
         Parameters
         ----------
-        model: array
-            The model from `Blend`
+        model: array or list
+            The model from `Blend`, or a list of the models of its components
+            in their bounding boxes, each as tuple (array, `~scarlet.Box`)
 
         Returns
         -------
@@ -135,19 +406,37 @@ class Observation:
             `model` mapped into the observation frame
         """
 
-        image_model = model[self.slices]
+        if isinstance(model, list):
+            return self._render_footprints(model)
+
+        image_model = _gather(model, self.slices)
         if self._diff_kernels is not None:
             image_model = self._convolve(image_model)
 
         return image_model
 
-    def get_loss(self, model):
+    def _render_background(self, background, render):
+        """Rendered `background`, cached as long as the same array is passed
+        """
+        try:
+            if self._background[0] is background:
+                return self._background[1]
+        except AttributeError:
+            pass
+        self._background = (background, render(background))
+        return self._background[1]
+
+    def get_loss(self, model, background=None):
         """Computes the loss/fidelity of a given model wrt to the observation
 
         Parameters
         ----------
-        model: array
-            The model from `Blend`
+        model: array or list
+            The model from `Blend`, see `render`
+        background: array
+            Constant model (e.g. of fixed components) in the frame of `Blend`
+            that is added to `model`. Its rendering is cached for as long as
+            the same array is passed.
 
         Returns
         -------
@@ -157,8 +446,18 @@ class Observation:
         """
 
         model_ = self.render(model)
-        images_ = self.images[self.slices]
-        weights_ = self.weights[self.slices]
+        if background is not None:
+            model_ = model_ + self._render_background(background, self.render)
+        images_, weights_, valid, log_norm = self._get_likelihood_data()
+        if valid is not None:
+            model_ = _gather(model_, valid)
+
+        return log_norm + np.sum(weights_ * (model_ - images_) ** 2) / 2
+
+    def _get_log_norm(self):
+        """Normalization of the likelihood
+        """
+        images_ = self.images[self._data_slices]
 
         # normalization of the single-pixel likelihood:
         # 1 / [(2pi)^1/2 (sigma^2)^1/2]
@@ -172,8 +471,224 @@ class Observation:
             np.prod(images_.shape) / 2 * np.log(2 * np.pi)
             + np.sum(log_sigma) / 2
         )
+        return log_norm
 
-        return log_norm + np.sum(weights_ * (model_ - images_) ** 2) / 2
+    def _get_likelihood_data(self):
+        """Data and normalization of the likelihood in the observed region
+
+        They are computed once after `match`. If at least a fraction
+        `min_masked` of the pixels has zero weight, only the valid pixels are
+        kept, and the model is compared to them through their indices.
+
+        Returns
+        -------
+        images: array
+            Observed images (or the valid pixels thereof)
+        weights: array
+            Weights (or the weights of the valid pixels)
+        valid: tuple
+            Indices of the valid pixels, `None` if all pixels are used
+        log_norm: float
+            Normalization of the likelihood
+        """
+        if self._likelihood_data is None:
+            images_ = self.images[self._data_slices]
+            weights_ = self.weights[self._data_slices]
+            valid = None
+            cuts = weights_ > 0
+            if 1 - cuts.mean() >= self.min_masked:
+                valid = np.nonzero(cuts)
+                images_ = images_[valid]
+                weights_ = weights_[valid]
+            self._likelihood_data = (images_, weights_, valid, self._get_log_norm())
+        return self._likelihood_data
+
+
+class TiledObservation:
+    """Observation of a large frame that is processed in cutouts
+
+    The data are not loaded into memory. Instead, `cutout` and `cutouts`
+    read the data in a bounding box and return a regular `Observation`
+    for it, e.g. for every blend in the frame.
+
+    Attributes
+    ----------
+    images: array-like
+        3D data cube (channels, Ny, Nx) of the image in each band.
+        Can be any array that supports slicing, e.g. a `numpy.memmap`
+        or an on-disk dataset from `h5py` or `zarr`.
+    frame: a `scarlet.Frame` instance
+        The spectral and spatial characteristics of the full frame
+    weights: array-like
+        Weight for each pixel in `images` with the same type of storage,
+        or `None` for uniform weights.
+    padding: int
+        Padding of the FFTs of the cutout `Observation`s
+    """
+
+    def __init__(
+        self, images, psfs=None, weights=None, wcs=None, channels=None, padding=10
+    ):
+        """Create a TiledObservation
+
+        Parameters
+        ---------
+        images: array-like
+            3D data cube (Channel, Height, Width) of the image in each band.
+        psfs: `scarlet.PSF` or its arguments
+            PSF in each channel. A `scarlet.GridPSF` shares its
+            difference kernels with all cutouts.
+        weights: array-like
+            Weight for each pixel in `images`.
+        wcs: TBD
+            World Coordinate System associated with the images.
+        channels: list of hashable elements
+            Names/identifiers of spectral channels
+        padding: int
+            Number of pixels to pad each side with, in addition to
+            half the width of the PSF, for FFTs.
+        """
+        self.frame = Frame(
+            images.shape, wcs=wcs, psfs=psfs, channels=channels, dtype=images.dtype
+        )
+        self.images = images
+        self.weights = weights
+        if weights is not None:
+            assert (
+                weights.shape == images.shape
+            ), "Weights needs to have same shape as images"
+        self._padding = padding
+
+    def cutout(self, bbox):
+        """Observation of the data in `bbox`
+
+        Parameters
+        ----------
+        bbox: `~scarlet.Box`
+            Spatial (Height, Width) or full (Channel, Height, Width) bounding box
+            in the pixel coordinates of `images`. All channels are used.
+
+        Returns
+        -------
+        observation: `~scarlet.Observation`
+            Observation with images and weights loaded into memory.
+            Its PSF is trimmed to the size of the cutout (or, for a
+            `scarlet.GridPSF`, evaluated at the position of the cutout),
+            and its WCS is offset by the origin of `bbox`.
+            Without WCS, the origin of its frame is the origin of `bbox`,
+            so that it matches a model frame in the pixel coordinates of
+            the full frame.
+        """
+        bbox = self._get_box(bbox)
+        images, weights = self._load(bbox)
+        return self._make_observation(bbox, images, weights)
+
+    def cutouts(self, bboxes):
+        """Iterate over the observations in `bboxes`
+
+        The data of the next cutout is loaded in a background thread while the
+        current one is processed. Pages of memory-mapped data are released
+        after every cutout.
+
+        Parameters
+        ----------
+        bboxes: list of `~scarlet.Box`
+            Bounding boxes of the cutouts, see `cutout`
+
+        Returns
+        -------
+        observations: generator of `~scarlet.Observation`
+        """
+        bboxes = [self._get_box(bbox) for bbox in bboxes]
+        if not len(bboxes):
+            return
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(self._load, bboxes[0])
+            for k, bbox in enumerate(bboxes):
+                images, weights = future.result()
+                if k + 1 < len(bboxes):
+                    future = executor.submit(self._load, bboxes[k + 1])
+                yield self._make_observation(bbox, images, weights)
+                self._release()
+
+    def _get_box(self, bbox):
+        if bbox.D == 2:
+            bbox = Box((self.frame.C, *bbox.shape), origin=(0, *bbox.origin))
+        # cutouts are limited to the frame
+        return bbox & Box(self.frame.shape)
+
+    def _load(self, bbox):
+        """Read images and weights in `bbox` into memory
+        """
+        slices = bbox.slices_for(self.frame.shape)
+        images = np.array(self.images[slices])
+        weights = None
+        if self.weights is not None:
+            weights = np.array(self.weights[slices])
+        return images, weights
+
+    def _release(self):
+        """Drop the pages of memory-mapped data from memory
+
+        They are read from disk again when needed.
+        """
+        if not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        for data in (self.images, self.weights):
+            mm = getattr(data, "_mmap", None)
+            if mm is not None:
+                mm.madvise(mmap.MADV_DONTNEED)
+
+    def _make_observation(self, bbox, images, weights):
+        psf = self.frame.psf
+        if isinstance(psf, GridPSF):
+            psf = psf.cutout(bbox.origin[1:])
+        elif psf is not None:
+            psf = _trim_psf(psf, images.shape[1:])
+
+        wcs = self.frame.wcs
+        if wcs is not None:
+            wcs = wcs.slice(bbox.slices_for(self.frame.shape)[-wcs.naxis :])
+
+        observation = Observation(
+            images,
+            psfs=psf,
+            weights=weights,
+            wcs=wcs,
+            channels=self.frame.channels,
+            padding=self._padding,
+        )
+        if wcs is None:
+            frame = observation.frame
+            observation.frame = Frame(
+                bbox, psfs=frame.psf, channels=frame.channels, dtype=frame.dtype
+            )
+        return observation
+
+
+def _trim_psf(psf, shape):
+    """PSF that is not larger than the frame with spatial `shape`
+
+    If `psf` already fits, it is returned unchanged.
+    """
+    # odd sizes keep the PSF centered
+    size = [min(n, s - 1 + s % 2) for n, s in zip(psf.shape[-2:], shape)]
+    if tuple(size) == tuple(psf.shape[-2:]):
+        return psf
+
+    psf_ = copy.copy(psf)
+    psf_.shape = (*psf.shape[:-2], *size)
+    if psf._func is not None:
+        psf_._image = None
+    else:
+        image = psf.image
+        slices = tuple(
+            slice(n // 2 - s // 2, n // 2 - s // 2 + s)
+            for n, s in zip(image.shape[1:], size)
+        )
+        psf_._image = image[(slice(None), *slices)].copy()
+        psf_.normalize()
+    return psf_
 
 
 class LowResObservation(Observation):
@@ -185,8 +700,19 @@ class LowResObservation(Observation):
         weights=None,
         channels=None,
         padding=3,
+        sinc_window=None,
     ):
+        """Create an Observation at a different resolution than the model
 
+        See `~scarlet.Observation` for a description of the other parameters.
+
+        Parameters
+        ----------
+        sinc_window: int
+            Support (in low resolution pixels) of the Lanczos-truncated sinc
+            kernel used to resample the PSF. If `None`, the dense sinc
+            kernel is used.
+        """
         assert wcs is not None, "WCS is necessary for LowResObservation"
         assert psfs is not None, "PSF is necessary for LowResObservation"
 
@@ -198,6 +724,7 @@ class LowResObservation(Observation):
             channels=channels,
             padding=padding,
         )
+        self.sinc_window = sinc_window
 
     def match_psfs(self, psf_hr, wcs_hr, angle):
         """psf matching between different dataset
@@ -260,7 +787,11 @@ class LowResObservation(Observation):
             pcoordlr_lr[1].min() : pcoordlr_lr[1].max() + 1,
         ]
         psf_match_lr = interpolation.sinc_interp(
-            psf_valid, coordover_hr, pcoordlr_hr, angle=angle
+            psf_valid,
+            coordover_hr,
+            pcoordlr_hr,
+            angle=angle,
+            window=self.sinc_window,
         )
 
         psf_hr /= np.sum(psf_hr)
@@ -440,6 +971,8 @@ class LowResObservation(Observation):
             (np.min(coord_lr[1]).astype(int), np.max(coord_lr[1]).astype(int) + 1),
         )
         self.slices = self.bbox.slices_for(model_frame.shape)
+        self._data_slices = self.slices
+        self._likelihood_data = None
         # Coordinates for all model frame pixels
         self.frame_coord = (
             np.array(range(model_frame.Ny)),
@@ -578,6 +1111,11 @@ class LowResObservation(Observation):
                 model_image.append((self._resconv_op[c].T @ model_conv[c].T).T)
             return np.array(model_image, dtype=self.frame.dtype)
 
+    def _use_footprints(self, boxes):
+        """Components are always resampled together in the full frame
+        """
+        return False
+
     def render(self, model):
         """Resample and convolve a model in the observation frame for display only!
         Parameters
@@ -593,12 +1131,15 @@ class LowResObservation(Observation):
         image_model[self.slices] = self._render(model)
         return image_model
 
-    def get_loss(self, model):
+    def get_loss(self, model, background=None):
         """Computes the loss/fidelity of a given model wrt to the observation
         Parameters
         ----------
         model: array
             A model from `Blend`
+        background: array
+            Constant model in the frame of `Blend` that is added to `model`.
+            See `Observation.get_loss` for details.
         Returns
         -------
         loss: float
@@ -606,8 +1147,17 @@ class LowResObservation(Observation):
         """
 
         model_ = self._render(model)
-        images_ = self.images[self.slices]
-        weights_ = self.weights[self.slices]
+        if background is not None:
+            model_ = model_ + self._render_background(background, self._render)
+        images_, weights_, valid, log_norm = self._get_likelihood_data()
+        if valid is not None:
+            model_ = _gather(model_, valid)
+
+        return log_norm + 0.5 * np.sum(weights_ * (model_ - images_) ** 2)
+
+    def _get_log_norm(self):
+        images_ = self.images[self._data_slices]
+        weights_ = self.weights[self._data_slices]
 
         # properly normalized likelihood
         log_sigma = np.zeros(weights_.shape, dtype=weights_.dtype)
@@ -617,5 +1167,4 @@ class LowResObservation(Observation):
             np.prod(images_.shape) / 2 * np.log(2 * np.pi)
             + np.sum(log_sigma) / 2
         )
-
-        return log_norm + 0.5 * np.sum(weights_ * (model_ - images_) ** 2)
+        return log_norm
@@ -0,0 +1,644 @@
+from functools import partial
+import logging
+
+import numpy as np
+
+from .constraint import ConstraintChain
+from .parameter import relative_step
+
+logger = logging.getLogger("scarlet.optimizer")
+
+
+def _adam_phi_psi(it, G, M, V, Vhat, b1, b2, eps, p):
+    # moving averages
+    M[:] = (1 - b1[it]) * G + b1[it] * M
+    V[:] = (1 - b2) * (G ** 2) + b2 * V
+
+    # bias correction
+    t = it + 1
+    Phi = M / (1 - b1[it] ** t)
+    Psi = np.sqrt(V / (1 - b2 ** t)) + eps
+    return Phi, Psi
+
+
+def _amsgrad_phi_psi(it, G, M, V, Vhat, b1, b2, eps, p):
+    # moving averages
+    M[:] = (1 - b1[it]) * G + b1[it] * M
+    V[:] = (1 - b2) * (G ** 2) + b2 * V
+
+    Phi = M
+    np.maximum(Vhat, V, out=Vhat)
+    # sanitize zero-gradient elements
+    Psi = np.sqrt(np.maximum(Vhat, eps)) if eps > 0 else np.sqrt(Vhat)
+    return Phi, Psi
+
+
+def _padam_phi_psi(it, G, M, V, Vhat, b1, b2, eps, p):
+    # moving averages
+    M[:] = (1 - b1[it]) * G + b1[it] * M
+    V[:] = (1 - b2) * (G ** 2) + b2 * V
+
+    Phi = M
+    np.maximum(Vhat, V, out=Vhat)
+    # sanitize zero-gradient elements
+    Psi = np.maximum(Vhat, eps) ** p if eps > 0 else Vhat ** p
+    return Phi, Psi
+
+
+_phi_psi = {
+    "adam": _adam_phi_psi,
+    "amsgrad": _amsgrad_phi_psi,
+    "padam": _padam_phi_psi,
+}
+
+
+def _batch_key(constraint):
+    """Hashable key of elementwise constraints that act identically
+
+    Returns `None` if `constraint` needs to be applied to each parameter
+    separately.
+    """
+    if isinstance(constraint, ConstraintChain):
+        keys = tuple(_batch_key(c) for c in constraint.constraints)
+        if any(key is None for key in keys):
+            return None
+        return (ConstraintChain, constraint.repeat, keys)
+
+    if not getattr(constraint, "elementwise", False):
+        return None
+
+    state = []
+    for name, value in sorted(vars(constraint).items()):
+        if isinstance(value, partial):
+            value = (value.func, value.args, tuple(sorted(value.keywords.items())))
+        state.append((name, value))
+    key = (type(constraint), tuple(state))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _relative_step_factor(step, parameter):
+    """Factor of `relative_step`, if `step` can be computed from segment means
+    """
+    if parameter.ndim != 1:
+        return None
+    if step is relative_step:
+        return 0.1
+    if (
+        isinstance(step, partial)
+        and step.func is relative_step
+        and not step.args
+        and set(step.keywords) <= {"factor"}
+    ):
+        return step.keywords.get("factor", 0.1)
+    return None
+
+
+class _Segments:
+    """Layout of a subset of the parameters of one flat buffer
+
+    Parameters
+    ----------
+    slices: list of slice
+        Location of every parameter in the buffer
+    """
+
+    def __init__(self, slices):
+        self.slices = slices
+        self.sizes = np.array([s.stop - s.start for s in slices], dtype=int)
+        # location of the parameter elements in the buffer
+        if len(slices):
+            self.index = np.concatenate([np.arange(s.start, s.stop) for s in slices])
+        else:
+            self.index = np.zeros(0, dtype=int)
+        # start of every parameter in `index`
+        self.starts = np.concatenate(([0], np.cumsum(self.sizes)[:-1])).astype(int)
+        # offset of every parameter in `index`
+        self.local = [slice(a, a + n) for a, n in zip(self.starts, self.sizes)]
+
+    def reduce(self, ufunc, x):
+        """Reduce `x[self.index]` for every parameter with `ufunc`
+        """
+        return ufunc.reduceat(x, self.starts)
+
+    def expand(self, x):
+        """Repeat the per-parameter values `x` for every element
+        """
+        return np.repeat(x, self.sizes)
+
+
+class _Group:
+    """Parameters of one dtype in a `~scarlet.parameter.ParameterBuffer`
+
+    Holds the static information needed for a vectorized update:
+    which step sizes can be computed jointly, and which constraints can be
+    applied jointly.
+    """
+
+    def __init__(self, buffer, dtype, entries):
+        self.dtype = dtype
+        self.data = buffer.data[dtype]
+        self.m = buffer.m[dtype]
+        self.v = buffer.v[dtype]
+        self.vhat = buffer.vhat[dtype]
+        self.views = [view for view, _ in entries]
+        self.slices = [slice_ for _, slice_ in entries]
+
+        # step sizes: constants are set once, relative steps are segment means,
+        # everything else is called for every parameter
+        self.alpha = np.zeros(self.data.size)
+        self.scalar_alpha = np.ones(len(entries), dtype=bool)
+        relative, self.relative_factors, self.step_calls = [], [], []
+        for k, (view, slice_) in enumerate(entries):
+            factor = _relative_step_factor(view.step, view)
+            if factor is not None:
+                relative.append(slice_)
+                self.relative_factors.append(factor)
+            elif hasattr(view.step, "__call__"):
+                self.step_calls.append(k)
+            else:
+                self.alpha[slice_] = view.step
+                self.scalar_alpha[k] = np.ndim(view.step) == 0
+        self.relative = _Segments(relative)
+        self.relative_factors = np.array(self.relative_factors)
+
+        # constraints: parameters with elementwise constraints of the same kind
+        # are batched, the others are called one by one
+        constrained = [
+            k
+            for k, (view, slice_) in enumerate(entries)
+            if view.constraint is not None and slice_.stop > slice_.start
+        ]
+        self.prox = _Segments([self.slices[k] for k in constrained])
+        self.prox_entries = constrained
+        batches = {}
+        self.prox_calls = []
+        for i, k in enumerate(constrained):
+            constraint = self.views[k].constraint
+            key = _batch_key(constraint)
+            if key is None:
+                self.prox_calls.append((i, k, constraint))
+            else:
+                batches.setdefault(key, (constraint, []))[1].append(i)
+        self.prox_batches = [
+            (
+                constraint,
+                np.concatenate(
+                    [
+                        np.arange(self.prox.local[i].start, self.prox.local[i].stop)
+                        for i in members
+                    ]
+                ),
+            )
+            for constraint, members in batches.values()
+        ]
+
+    def update_steps(self, it):
+        if self.relative.index.size:
+            x = self.data[self.relative.index]
+            means = (self.relative.reduce(np.add, x) / self.relative.sizes).astype(
+                self.dtype
+            )
+            alpha = self.relative_factors * means.astype(np.float64)
+            self.alpha[self.relative.index] = self.relative.expand(alpha)
+        for k in self.step_calls:
+            view, slice_ = self.views[k], self.slices[k]
+            step = view.step(view, it=it)
+            self.scalar_alpha[k] = np.ndim(step) == 0
+            self.alpha[slice_] = np.broadcast_to(step, view.shape).ravel()
+
+    def apply_prox(self, Psi, e_rel, prox_max_iter):
+        if not self.prox.index.size:
+            return 0
+
+        index = self.prox.index
+        X = self.data[index]
+        alpha = self.alpha[index]
+        psi = Psi[index]
+        gamma = alpha / self.prox.expand(self.prox.reduce(np.maximum, psi))
+        ratio = gamma / alpha * psi
+
+        z = X.copy()
+        active = np.ones(len(self.prox_entries), dtype=bool)
+        for tau in range(1, prox_max_iter + 1):
+            y = z - ratio * (z - X)
+            z_ = y.copy()
+            for constraint, batch in self.prox_batches:
+                z_[batch] = constraint(y[batch], gamma[batch])
+            for i, k, constraint in self.prox_calls:
+                if not active[i]:
+                    continue
+                local, shape = self.prox.local[i], self.views[k].shape
+                if self.scalar_alpha[k]:
+                    step = gamma[local.start]
+                else:
+                    step = gamma[local].reshape(shape)
+                z_[local] = np.ravel(constraint(y[local].reshape(shape), step))
+
+            converged = self.prox.reduce(np.add, (z_ - z) ** 2) <= (
+                e_rel ** 2 * self.prox.reduce(np.add, z ** 2)
+            )
+            update = self.prox.expand(active)
+            z[update] = z_[update]
+            active &= ~converged
+            if not active.any():
+                break
+
+        self.data[index] = z
+        return tau
+
+
+def _get_groups(buffer):
+    """`_Group` for every dtype in `buffer`, and the location of every parameter
+
+    Locations are listed for every entry of `buffer.parameters`, including
+    duplicates, as `(dtype, slice)`.
+    """
+    entries = {}
+    for view, dtype, slice_ in buffer._entries:
+        entries.setdefault(dtype, []).append((view, slice_))
+    groups = {dtype: _Group(buffer, dtype, e) for dtype, e in entries.items()}
+    location = {id(view): (dtype, slice_) for view, dtype, slice_ in buffer._entries}
+    locations = [location[id(x)] for x in buffer.parameters]
+    return groups, locations
+
+
+def _get_gradient(groups, locations, grad, X):
+    """Gradients of all parameters, packed into flat arrays for every dtype
+    """
+    G = {dtype: np.zeros_like(group.data) for dtype, group in groups.items()}
+    for (dtype, slice_), g in zip(locations, grad(*X)):
+        G[dtype][slice_] += np.ravel(g)
+    return G
+
+
+def _update_views(groups):
+    for group in groups.values():
+        for view in group.views:
+            view._update()
+
+
+def adaprox(
+    buffer,
+    grad,
+    scheme="amsgrad",
+    b1=0.9,
+    b2=0.999,
+    eps=1e-8,
+    p=0.25,
+    e_rel=1e-6,
+    max_iter=1000,
+    prox_max_iter=1000,
+    callback=None,
+):
+    """Adaptive proximal gradient method for contiguous parameters
+
+    Implements the Adam (Kingma & Ba 2015), AMSGrad (Reddi, Kale & Kumar 2018),
+    and PAdam (Chen & Gu 2018) schemes of `proxmin.adaprox`, with the same
+    proximal sub-iterations to satisfy feasibility and optimality.
+    Instead of looping over the parameters, moments, step sizes, and gradient
+    updates are computed on the flat buffers of a
+    `~scarlet.parameter.ParameterBuffer`. Step sizes of the form
+    `relative_step` on 1D parameters are evaluated as segment means, and
+    elementwise constraints of the same kind are applied to all their
+    parameters at once.
+
+    The parameter values and moments are updated in place, so the optimizer
+    state is retained in `buffer` for warm starts.
+    If the same parameter is listed multiple times in `buffer.parameters`,
+    its gradients are summed and it is updated once.
+
+    Parameters
+    ----------
+    buffer: `~scarlet.parameter.ParameterBuffer`
+        Parameters to optimize, with their `step` and `constraint`
+    grad: callable
+        Gradient of the loss function
+        Signature: grad(*buffer.parameters) -> tuple of arrays
+    scheme: str
+        One of ["adam", "amsgrad", "padam"]
+    b1: float or array
+        First moment momentum decay, or one value for every iteration
+    b2: float
+        Second moment momentum decay
+    eps: float
+        Softening of the second moment
+    p: float
+        Power of the second moment (only for `scheme == "padam"`)
+    e_rel: float
+        Relative error for convergence of the proximal sub-iterations
+    max_iter: int
+        Maximum number of iterations
+    prox_max_iter: int
+        Maximum number of proximal sub-iterations
+    callback: callable
+        Called at the beginning of every iteration, can raise `StopIteration`
+        to end the optimization
+        Signature: callback(*buffer.parameters, it=None)
+
+    Returns
+    -------
+    it: int
+        Number of completed iterations
+    """
+    scheme = scheme.lower()
+    if scheme not in _phi_psi:
+        raise ValueError(
+            "Unknown scheme {}, use one of {}".format(scheme, list(_phi_psi.keys()))
+        )
+    if not hasattr(b1, "__iter__"):
+        b1 = np.array((b1,) * max_iter)
+    assert len(b1) == max_iter
+    assert (b1 >= 0).all() and (b1 < 1).all()
+    assert b2 >= 0 and b2 < 1
+    assert eps >= 0
+    assert p > 0 and p <= 0.5
+
+    X = buffer.parameters
+    groups, locations = _get_groups(buffer)
+
+    sub_iter = 0
+    for it in range(max_iter):
+        try:
+            if callback is not None:
+                callback(*X, it=it)
+            G = _get_gradient(groups, locations, grad, X)
+
+            for dtype, group in groups.items():
+                group.update_steps(it)
+                Phi, Psi = _phi_psi[scheme](
+                    it, G[dtype], group.m, group.v, group.vhat, b1, b2, eps, p
+                )
+                group.data -= group.alpha * Phi / Psi
+                sub_iter += group.apply_prox(Psi, e_rel, prox_max_iter)
+
+            _update_views(groups)
+
+        except StopIteration:
+            break
+    else:
+        it = max_iter
+
+    logger.info("Completed {0} iterations and {1} sub-iterations".format(it, sub_iter))
+    return it
+
+
+class _Lipschitz:
+    """Power-iteration estimates of the Lipschitz constant of every parameter
+
+    Hessian-vector products are approximated by finite differences of the
+    gradient, so that every parameter, including its prior, is covered.
+    The estimates are made in two stages:
+
+    1. All parameters are perturbed at once in directions of unit length for
+       every parameter. The norm of the gradient change of each parameter
+       gives its Lipschitz constant `L`, including the coupling to all
+       overlapping parameters.
+    2. The spectral norm `rho` of the Hessian, preconditioned by `L`, is
+       estimated on all parameters jointly and corrects `L` for the
+       interactions the first stage cannot capture.
+
+    The directions of both stages are kept to warm-start later estimates.
+    """
+
+    def __init__(self, groups, locations, grad, X, seed=0):
+        self.groups = groups
+        self.locations = locations
+        self.grad = grad
+        self.X = X
+        # all parameters of non-zero size
+        self.blocks = {
+            dtype: _Segments([s for s in group.slices if s.stop > s.start])
+            for dtype, group in groups.items()
+        }
+        rng = np.random.RandomState(seed)
+        self.v = {
+            dtype: rng.normal(size=group.data.size) for dtype, group in groups.items()
+        }
+        self.u = {dtype: v.copy() for dtype, v in self.v.items()}
+        self.L = {dtype: np.ones(group.data.size) for dtype, group in groups.items()}
+
+    def _normalize(self, v):
+        """Scale `v` to unit length for every parameter, return the norms
+        """
+        norms = {}
+        for dtype, blocks in self.blocks.items():
+            if not blocks.index.size:
+                norms[dtype] = np.zeros(0)
+                continue
+            x = v[dtype][blocks.index]
+            norms[dtype] = np.sqrt(blocks.reduce(np.add, x ** 2))
+            scale = 1 / np.maximum(norms[dtype], np.finfo(np.float64).tiny)
+            v[dtype][blocks.index] = x * blocks.expand(scale)
+        return norms
+
+    def _hvp(self, x0, g0, v):
+        """Finite-difference approximation of the Hessian at `x0` times `v`
+        """
+        norm_x = np.sqrt(sum((x.astype(np.float64) ** 2).sum() for x in x0.values()))
+        norm_v = np.sqrt(sum((v_ ** 2).sum() for v_ in v.values()))
+        step = 1e-3 * max(norm_x, 1) / max(norm_v, np.finfo(np.float64).tiny)
+
+        for dtype, group in self.groups.items():
+            group.data[:] = x0[dtype] + step * v[dtype]
+        _update_views(self.groups)
+        try:
+            g = _get_gradient(self.groups, self.locations, self.grad, self.X)
+        finally:
+            for dtype, group in self.groups.items():
+                group.data[:] = x0[dtype]
+            _update_views(self.groups)
+        return {dtype: (g[dtype] - g0[dtype]) / step for dtype in g}
+
+    def update(self, n_iter):
+        """Update the estimates with `n_iter` power iterations per stage
+
+        Returns
+        -------
+        L: dict
+            Lipschitz constant of the parameter of every element, by dtype
+        """
+        x0 = {dtype: group.data.copy() for dtype, group in self.groups.items()}
+        g0 = _get_gradient(self.groups, self.locations, self.grad, self.X)
+        g0 = {dtype: g.astype(np.float64) for dtype, g in g0.items()}
+
+        # stage 1: per-parameter estimates
+        self._normalize(self.v)
+        for i in range(n_iter):
+            self.v = self._hvp(x0, g0, self.v)
+            norms = self._normalize(self.v)
+        L = {
+            dtype: blocks.expand(norms[dtype]) if blocks.index.size else np.zeros(0)
+            for dtype, blocks in self.blocks.items()
+        }
+        # parameters that don't affect the loss get the smallest finite L
+        top = max([norm.max() for norm in L.values() if norm.size] + [0])
+        floor = 1e-6 * top if top > 0 else 1
+        for dtype, blocks in self.blocks.items():
+            self.L[dtype][:] = floor
+            self.L[dtype][blocks.index] = np.maximum(L[dtype], floor)
+
+        # stage 2: joint correction of the preconditioned Hessian
+        scale = {dtype: 1 / np.sqrt(L) for dtype, L in self.L.items()}
+        rho = 1
+        for i in range(n_iter):
+            norm_u = np.sqrt(sum((u ** 2).sum() for u in self.u.values()))
+            u = {dtype: self.u[dtype] / norm_u for dtype in self.u}
+            w = self._hvp(x0, g0, {dtype: scale[dtype] * u[dtype] for dtype in u})
+            self.u = {dtype: scale[dtype] * w[dtype] for dtype in w}
+            rho = np.sqrt(sum((u ** 2).sum() for u in self.u.values()))
+        if rho > 0:
+            for L in self.L.values():
+                L *= rho
+        return self.L
+
+
+def fista(
+    buffer,
+    grad,
+    loss=None,
+    max_iter=1000,
+    restart=True,
+    lipschitz_iter=5,
+    lipschitz_every=20,
+    lipschitz_grad=None,
+    callback=None,
+):
+    """Accelerated proximal gradient method with estimated step sizes
+
+    Implements FISTA (Beck & Teboulle 2009) with the gradient-based adaptive
+    restart of O'Donoghue & Candes (2015), on the flat buffers of a
+    `~scarlet.parameter.ParameterBuffer`.
+    Instead of the `step` of the parameters, every parameter is updated with
+    step size `1/L`, where `L` is a power-iteration estimate of its Lipschitz
+    constant, see `_Lipschitz`. Because the loss is not convex in the
+    factorized parameters, the estimates are updated every `lipschitz_every`
+    iterations with one power iteration. If `loss` is given, the estimates
+    are also checked in every iteration: if the loss exceeds the quadratic
+    bound from the previous gradient evaluation, all `L` are increased and
+    the step from the previous evaluation is repeated without momentum.
+
+    The constraints of the parameters are applied as proximal operators with
+    the same step size. The extrapolated parameters, at which the gradient is
+    evaluated, can violate the constraints. The parameters in `buffer` are
+    those of the last proximal update when the optimization ends.
+
+    Parameters
+    ----------
+    buffer: `~scarlet.parameter.ParameterBuffer`
+        Parameters to optimize, with their `constraint`
+    grad: callable
+        Gradient of the loss function
+        Signature: grad(*buffer.parameters) -> tuple of arrays
+    loss: callable
+        Value of the loss function at the last evaluation of `grad`
+        Signature: loss() -> float
+    max_iter: int
+        Maximum number of iterations
+    restart: bool
+        Whether to reset the momentum when it points uphill
+    lipschitz_iter: int
+        Number of power iterations for the initial Lipschitz estimates
+    lipschitz_every: int
+        Number of iterations between updates of the Lipschitz estimates
+    lipschitz_grad: callable
+        Gradient for the Lipschitz estimates, e.g. without side effects
+        of `grad`. Defaults to `grad`.
+    callback: callable
+        Called at the beginning of every iteration, can raise `StopIteration`
+        to end the optimization
+        Signature: callback(*buffer.parameters, it=None)
+
+    Returns
+    -------
+    it: int
+        Number of completed iterations
+    """
+    X = buffer.parameters
+    groups, locations = _get_groups(buffer)
+    lipschitz = _Lipschitz(
+        groups, locations, grad if lipschitz_grad is None else lipschitz_grad, X
+    )
+    for group in groups.values():
+        group.scalar_alpha[:] = True
+
+    # x: last proximal update, the buffer holds the extrapolation y
+    x = {dtype: group.data.copy() for dtype, group in groups.items()}
+    # y, gradient, and loss of the last accepted evaluation
+    last = None
+    t = 1
+    n_restart, n_reject = 0, 0
+    try:
+        for it in range(max_iter):
+            try:
+                if callback is not None:
+                    callback(*X, it=it)
+                if it % lipschitz_every == 0:
+                    L = {
+                        dtype: L.copy()
+                        for dtype, L in lipschitz.update(
+                            lipschitz_iter if it == 0 else 1
+                        ).items()
+                    }
+                y = {dtype: group.data.copy() for dtype, group in groups.items()}
+                G = _get_gradient(groups, locations, grad, X)
+                f = None if loss is None else loss()
+
+                # safeguard: quadratic bound from the last evaluation
+                reject = False
+                if f is not None and last is not None:
+                    y_, G_, f_ = last
+                    d = {dtype: y[dtype] - y_[dtype] for dtype in y}
+                    linear = sum(np.dot(G_[dtype], d[dtype]) for dtype in d)
+                    quadratic = sum((L[dtype] * d[dtype] ** 2).sum() / 2 for dtype in d)
+                    excess = f - f_ - linear
+                    if not np.isfinite(f) or excess > quadratic > 0:
+                        scale = max(2, excess / quadratic) if np.isfinite(f) else 10
+                        for L_ in L.values():
+                            L_ *= scale
+                        y, G, f = y_, G_, f_
+                        reject = True
+                        n_reject += 1
+                last = (y, G, f)
+                for dtype, group in groups.items():
+                    group.alpha[:] = 1 / L[dtype]
+
+                # proximal gradient step from y
+                uphill = 0
+                x_ = {}
+                for dtype, group in groups.items():
+                    group.data[:] = y[dtype] - (group.alpha * G[dtype]).astype(dtype)
+                    group.apply_prox(np.ones(group.data.size), 0, 1)
+                    x_[dtype] = group.data.copy()
+                    uphill += np.dot(y[dtype] - x_[dtype], x_[dtype] - x[dtype])
+
+                # momentum
+                t_ = (1 + np.sqrt(1 + 4 * t ** 2)) / 2
+                beta = (t - 1) / t_
+                if reject or (restart and uphill > 0):
+                    t_, beta = 1, 0
+                    n_restart += 1
+                for dtype, group in groups.items():
+                    group.data[:] = x_[dtype] + beta * (x_[dtype] - x[dtype])
+                x, t = x_, t_
+                _update_views(groups)
+
+            except StopIteration:
+                break
+        else:
+            it = max_iter
+    finally:
+        # end at the last feasible point
+        for dtype, group in groups.items():
+            group.data[:] = x[dtype]
+        _update_views(groups)
+
+    logger.info(
+        "Completed {0} iterations, {1} restarts, and {2} rejected steps".format(
+            it, n_restart, n_reject
+        )
+    )
+    return it
@@ -1,7 +1,9 @@
 import autograd.numpy as np
+import numpy.ma as ma
 from autograd.numpy.numpy_boxes import ArrayBox
 from autograd.core import VSpace
 from functools import partial
+from itertools import count
 from .constraint import Constraint, ConstraintChain
 from .prior import Prior
 
@@ -25,7 +27,8 @@ class Parameter(np.ndarray):
             `step(X, it) -> float`
         where `X` is the parameter value and `it` the iteration counter
     std: array-like
-        Statistical error estimate; set after optimization
+        Statistical error estimate; if not set, it is computed from `v` after
+        optimization
     m: array-like
         First moment of the gradient; only set when optimized
         See Kingma & Ba (2015) and Reddi, Kale & Kumar (2018) for details
@@ -37,8 +40,26 @@ class Parameter(np.ndarray):
         See Kingma & Ba (2015) and Reddi, Kale & Kumar (2018) for details
     fixed: bool
         Whether parameter is held fixed (excluded) during optimization
+
+    Every in-place update through item assignment, augmented assignment,
+    ufuncs with `out` or `ufunc.at`, or `fill` (as done by the optimizer and
+    constraints) assigns a new `version`, which invalidates the models cached
+    from the parameter. Updates of a view of a parameter also change the
+    version of the parameter, and vice versa. Other writes are not tracked and
+    not supported for parameters of rendered components, e.g. through plain
+    arrays like `_data`, `view(np.ndarray)`, or the `sed`, `morph`, and `cube`
+    of components, or through functions like `numpy.copyto`: cached models
+    would not reflect them. Internal writes of this kind, e.g. to the buffers
+    of `ParameterBuffer`, call `_update`.
+
+    Arithmetic with parameters returns plain arrays.
     """
 
+    # versions are unique across all parameters
+    _versions = count()
+    # version of the last change of `fixed` of any parameter
+    _fixed_version = next(_versions)
+
     def __new__(
         cls,
         array,
@@ -63,11 +84,12 @@ class Parameter(np.ndarray):
             )
         obj.constraint = constraint
         obj.step = step
-        obj.std = std
+        obj._std = std
         obj.m = m
         obj.v = v
         obj.vhat = vhat
-        obj.fixed = fixed
+        obj._fixed = fixed
+        obj._version = next(Parameter._versions)
         return obj
 
     def __array_finalize__(self, obj):
@@ -77,11 +99,12 @@ class Parameter(np.ndarray):
         self.prior = getattr(obj, "prior", None)
         self.constraint = getattr(obj, "constraint", None)
         self.step = getattr(obj, "step", 0)
-        self.std = getattr(obj, "std", None)
+        self._std = getattr(obj, "_std", None)
         self.m = getattr(obj, "m", None)
         self.v = getattr(obj, "v", None)
         self.vhat = getattr(obj, "vhat", None)
-        self.fixed = getattr(obj, "fixed", False)
+        self._fixed = getattr(obj, "_fixed", False)
+        self._version = next(Parameter._versions)
 
     def __reduce__(self):
         # Get the parent's __reduce__ tuple
@@ -93,14 +116,268 @@ class Parameter(np.ndarray):
 
     def __setstate__(self, state):
         self.__dict__.update(state[-1])  # Update the internal dict from state
+        # std used to be stored eagerly
+        if "std" in self.__dict__:
+            self._std = self.__dict__.pop("std")
+        self.__dict__.setdefault("_std", None)
+        if "fixed" in self.__dict__:
+            self._fixed = self.__dict__.pop("fixed")
         # Call the parent's __setstate__ with the other tuple elements.
         super().__setstate__(state[0:-1])
+        self._version = next(Parameter._versions)
+
+    @property
+    def std(self):
+        """Statistical error estimate
+
+        Unless set explicitly, a rough estimate from the second moment of the
+        gradient `v`, with masked elements where `v` is zero, or `None` if
+        the parameter has not been optimized.
+        """
+        if self._std is not None:
+            return self._std
+        if self.v is None:
+            return None
+        return 1 / np.sqrt(ma.masked_equal(np.asarray(self.v, dtype=np.float64), 0))
+
+    @std.setter
+    def std(self, std):
+        self._std = std
+
+    @property
+    def fixed(self):
+        """Whether parameter is held fixed (excluded) during optimization
+        """
+        return self._fixed
+
+    @fixed.setter
+    def fixed(self, fixed):
+        self._fixed = fixed
+        Parameter._fixed_version = next(Parameter._versions)
+
+    @property
+    def version(self):
+        """Version of the parameter values
+
+        Changes with every in-place update of the parameter, or of any
+        parameter it is a view of.
+        """
+        version = self._version
+        base = self.base
+        while isinstance(base, Parameter):
+            version = max(version, base._version)
+            base = base.base
+        return version
+
+    def _update(self):
+        # parameters this is a view of change as well
+        version = next(Parameter._versions)
+        obj = self
+        while isinstance(obj, Parameter):
+            obj._version = version
+            obj = obj.base
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._update()
+
+    def fill(self, value):
+        super().fill(value)
+        self._update()
+
+    def __array_ufunc__(self, ufunc, method, *inputs, out=None, **kwargs):
+        # computed on plain arrays, results are plain arrays
+        args = tuple(
+            x.view(np.ndarray) if isinstance(x, Parameter) else x for x in inputs
+        )
+        if out is None:
+            result = getattr(ufunc, method)(*args, **kwargs)
+            # `ufunc.at` writes to its first input
+            if method == "at" and isinstance(inputs[0], Parameter):
+                inputs[0]._update()
+            return result
+
+        # parameters that are written to get a new version
+        kwargs["out"] = tuple(
+            x.view(np.ndarray) if isinstance(x, Parameter) else x for x in out
+        )
+        getattr(ufunc, method)(*args, **kwargs)
+        for x in out:
+            if isinstance(x, Parameter):
+                x._update()
+        return out[0] if len(out) == 1 else out
 
     @property
     def _data(self):
         return self.view(np.ndarray)
 
 
+
+
+class ParameterBuffer:
+    """Contiguous storage of a list of parameters and their optimizer moments
+
+    Every parameter is replaced by a `Parameter` view into a flat buffer,
+    one for every dtype, with the same metadata. The first and second moments
+    `m`, `v`, `vhat` of each parameter become views into buffers of the same
+    layout. Updates, checks, and copies of all parameters can then be done
+    as a few operations on the buffers.
+
+    The moments are accumulated in double precision. When they are only kept
+    for warm starts or `Parameter.std`, they can be stored with less
+    precision, or dropped, with `set_moment_dtype`.
+
+    Parameters
+    ----------
+    parameters: list of `~scarlet.Parameter`
+        Parameters to store. The same parameter can be listed multiple times.
+
+    Attributes
+    ----------
+    parameters: list of `~scarlet.Parameter`
+        Views of `parameters`, in the same order
+    data: dict
+        Flat buffer of the parameter values for every dtype
+    m: dict
+        Flat buffer of the first moments for every parameter dtype
+    v: dict
+        Flat buffer of the second moments for every parameter dtype
+    vhat: dict
+        Flat buffer of the maximal second moments for every parameter dtype
+    moment_dtype: dtype
+        Type of the moment buffers, `None` if they have been dropped
+    """
+
+    def __init__(self, parameters):
+        unique = list({id(p): p for p in parameters}.values())
+
+        # layout of the buffers
+        sizes = {}
+        offsets = []
+        for p in unique:
+            offset = sizes.get(p.dtype, 0)
+            offsets.append(offset)
+            sizes[p.dtype] = offset + p.size
+
+        # moments are always accumulated in double precision
+        self.data = {dtype: np.empty(size, dtype=dtype) for dtype, size in sizes.items()}
+        self.m = {dtype: np.zeros(size) for dtype, size in sizes.items()}
+        self.v = {dtype: np.zeros(size) for dtype, size in sizes.items()}
+        self.vhat = {dtype: np.zeros(size) for dtype, size in sizes.items()}
+        self.moment_dtype = np.dtype(np.float64)
+
+        views = {}
+        # (view, dtype, slice) of every stored parameter, in buffer order
+        self._entries = []
+        for p, offset in zip(unique, offsets):
+            slice_ = slice(offset, offset + p.size)
+            self.data[p.dtype][slice_] = p.ravel()
+            view = self.data[p.dtype][slice_].reshape(p.shape).view(Parameter)
+            view.__dict__.update(p.__dict__)
+            for name in ("m", "v", "vhat"):
+                buffer = getattr(self, name)[p.dtype]
+                if getattr(p, name) is not None:
+                    buffer[slice_] = np.ravel(getattr(p, name))
+                setattr(view, name, buffer[slice_].reshape(p.shape))
+            view._update()
+            views[id(p)] = view
+            self._entries.append((view, p.dtype, slice_))
+
+        self._views = views
+        self.parameters = [views[id(p)] for p in parameters]
+
+    def get_view(self, parameter):
+        """View of `parameter` in the buffer, or `parameter` if it's not stored
+        """
+        return self._views.get(id(parameter), parameter)
+
+    def is_finite(self):
+        """Whether all parameter values are finite
+        """
+        return all(np.isfinite(data).all() for data in self.data.values())
+
+    def set_moment_dtype(self, dtype):
+        """Change the type of the moment buffers
+
+        The magnitudes of non-zero moments are clipped to the range of normal
+        numbers of `dtype`, from `np.finfo(dtype).tiny` to `np.finfo(dtype).max`,
+        so that small second moments don't underflow to zero. Compact types
+        lose precision: `np.float16` keeps about 3 significant digits, and
+        clips second moments below 6e-5, which caps `~scarlet.Parameter.std`
+        at about 128. Parameters with smaller gradients need `np.float32`.
+        Dropped moments are restored as zeros.
+
+        Parameters
+        ----------
+        dtype: dtype
+            New type of the moments, e.g. `np.float32` or `np.float16`, or
+            `None` to drop them
+        """
+        dtype = None if dtype is None else np.dtype(dtype)
+        # np.dtype(None) is float64, so None needs to be compared by identity
+        if dtype is None and self.moment_dtype is None:
+            return
+        if None not in (dtype, self.moment_dtype) and dtype == self.moment_dtype:
+            return
+
+        for name in ("m", "v", "vhat"):
+            buffers = getattr(self, name)
+            if dtype is None:
+                buffers = None
+            elif buffers is None:
+                buffers = {
+                    key: np.zeros(data.size, dtype=dtype)
+                    for key, data in self.data.items()
+                }
+            else:
+                info = np.finfo(dtype)
+                buffers = {
+                    key: np.where(
+                        b == 0, 0, np.sign(b) * np.clip(abs(b), info.tiny, info.max)
+                    ).astype(dtype)
+                    for key, b in buffers.items()
+                }
+            setattr(self, name, buffers)
+            for view, key, slice_ in self._entries:
+                if buffers is not None:
+                    setattr(view, name, buffers[key][slice_].reshape(view.shape))
+                else:
+                    setattr(view, name, None)
+        self.moment_dtype = dtype
+
+    def get_state(self):
+        """Copy of the parameters values and moments, e.g. for checkpoints
+
+        Returns
+        -------
+        state: dict
+            Copies of `data`, and of `m`, `v`, and `vhat` unless they have
+            been dropped
+        """
+        return {
+            name: {dtype: b.copy() for dtype, b in getattr(self, name).items()}
+            for name in ("data", "m", "v", "vhat")
+            if getattr(self, name) is not None
+        }
+
+    def set_state(self, state):
+        """Restore parameter values and moments from `state`
+
+        Parameters
+        ----------
+        state: dict
+            Result of `get_state` for this buffer
+        """
+        for name, buffers in state.items():
+            if getattr(self, name) is None:
+                continue
+            for dtype, b in buffers.items():
+                getattr(self, name)[dtype][:] = b
+        # the values changed without `Parameter.__setitem__`
+        for view in self._views.values():
+            view._update()
+
+
 # autograd needs to consider Parameter a class that in can compute gradients for
 # in that regard, it behaves like an ordinary ndarray
 ArrayBox.register(Parameter)
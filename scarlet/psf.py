@@ -1,6 +1,7 @@
 import autograd.numpy as np
 import autograd.scipy as scipy
 from .bbox import Box
+from . import fft
 
 
 def moffat(y, x, alpha=4.7, beta=1.5, bbox=None):
@@ -152,3 +153,246 @@ class PSF:
         if self.image.dtype != dtype:
             self._image = self._image.astype(dtype)
         return self
+
+
+class GaussianPSF(PSF):
+    """Class to represent PSFs that are (mixtures of) circular Gaussians
+
+    The analytic description allows `~scarlet.Observation` to compute the
+    difference kernel to another `GaussianPSF` in closed form,
+    which is compact and exact, instead of dividing the FFTs of the PSF images.
+
+    Parameters
+    ----------
+    sigma: array-like
+        Standard deviation of the Gaussian in every band, shape (Channels,),
+        or of every mixture component, shape (Channels, Components).
+    shape: tuple
+        Shape of the 2D image to generate an PSF image for.
+    weights: array-like
+        Amplitudes of the mixture components with the same shape as `sigma`.
+        Defaults to equal amplitudes.
+    """
+
+    def __init__(self, sigma, shape, weights=None):
+        sigma = np.array(sigma, dtype="float")
+        if sigma.ndim == 1:
+            sigma = sigma[:, None]
+        if weights is None:
+            weights = np.ones(sigma.shape)
+        weights = np.array(weights, dtype="float").reshape(sigma.shape)
+        self.sigma = sigma
+        self.weights = weights / weights.sum(axis=1)[:, None]
+        super().__init__(self._mixture, shape=(len(sigma), *shape[-2:]))
+
+    def _mixture(self, y, x, bbox=None):
+        return np.array(
+            [
+                sum(
+                    w * gaussian(y, x, sigma=s, bbox=bbox)[0] / (2 * np.pi * s ** 2)
+                    for w, s in zip(weights, sigma)
+                )
+                for weights, sigma in zip(self.weights, self.sigma)
+            ]
+        )
+
+    def get_diff_kernel(self, model_psf, truncate=5, min_sigma=1):
+        """Closed-form difference kernel between this PSF and `model_psf`
+
+        The kernel exists if `model_psf` is a single Gaussian in every band,
+        which is narrower than every component of this PSF.
+        It is then the mixture of Gaussians with the differences of the
+        variances, sampled out to `truncate` standard deviations.
+        Kernels narrower than `min_sigma` pixels are poorly sampled and
+        not used.
+
+        Parameters
+        ----------
+        model_psf: `scarlet.PSF`
+            PSF of the model frame
+        truncate: float
+            Size of the kernel in units of the largest standard deviation
+        min_sigma: float
+            Smallest standard deviation of the kernel
+
+        Returns
+        -------
+        kernel: array
+            (Channels, Height, Width) image of the normalized kernel,
+            or `None` if there is no closed-form kernel.
+        """
+        if (
+            not isinstance(model_psf, GaussianPSF)
+            or model_psf.sigma.shape != (len(self.sigma), 1)
+            or np.any(self.sigma <= model_psf.sigma)
+        ):
+            return None
+        sigma = np.sqrt(self.sigma ** 2 - model_psf.sigma ** 2)
+        if np.any(sigma < min_sigma):
+            return None
+        radius = int(np.ceil(truncate * sigma.max()))
+        coords = np.arange(-radius, radius + 1)
+        profiles = np.exp(-coords[None, None, :] ** 2 / (2 * sigma[:, :, None] ** 2))
+        profiles /= profiles.sum(axis=2)[:, :, None]
+        return np.einsum("ck,cky,ckx->cyx", self.weights, profiles, profiles)
+
+
+def _linear_weights(nodes, coords):
+    """Linear interpolation weights of `coords` between `nodes`
+
+    Coordinates outside of the range of `nodes` get the weights of the closest node.
+
+    Returns
+    -------
+    weights: array
+        (len(nodes), len(coords)) array of weights
+    """
+    weights = np.zeros((len(nodes), len(coords)))
+    if len(nodes) == 1:
+        weights[0] = 1
+        return weights
+    coords = np.clip(coords, nodes[0], nodes[-1])
+    k = np.searchsorted(nodes, coords, side="right") - 1
+    k = np.clip(k, 0, len(nodes) - 2)
+    t = (coords - nodes[k]) / (nodes[k + 1] - nodes[k])
+    index = np.arange(len(coords))
+    weights[k, index] = 1 - t
+    weights[k + 1, index] += t
+    return weights
+
+
+class GridPSF(PSF):
+    """Class to represent PSFs that vary over the frame
+
+    The PSF is given at the nodes of a regular grid of pixel positions,
+    and interpolated linearly between them.
+
+    Parameters
+    ----------
+    X: array-like or method
+        If `X` is an array, it holds the PSF images at every grid node with
+        shape (len(y), len(x), Channels, Height, Width).
+        If `X` is a callable method, it describes the PSF field, i.e. it
+        generates the (Channels, Height, Width) PSF image at position (y, x).
+    y: array-like
+        Increasing vertical pixel coordinates of the grid nodes
+    x: array-like
+        Increasing horizontal pixel coordinates of the grid nodes
+    origin: tuple
+        Position of the pixel (0, 0) of the frame in the coordinates of the grid
+    """
+
+    def __init__(self, X, y, x, origin=(0, 0)):
+        self.y = np.array(y, dtype="float")
+        self.x = np.array(x, dtype="float")
+        if hasattr(X, "__call__"):
+            images = np.array([[X(y_, x_) for x_ in self.x] for y_ in self.y])
+        elif hasattr(X, "shape"):
+            images = X.copy()
+        else:
+            msg = "A GridPSF must be initialized with either images or a function"
+            raise ValueError(msg)
+        assert images.ndim == 5 and images.shape[:2] == (len(self.y), len(self.x))
+        self._images = images / images.sum(axis=(-2, -1))[:, :, :, None, None]
+        self.origin = tuple(origin)
+        self._func = None
+        self.shape = images.shape[2:]
+        # difference kernels for each model PSF,
+        # shared by all cutouts of this PSF
+        self._diff_kernels = {}
+
+    @property
+    def image(self):
+        """Image of the PSF at the central grid node
+        """
+        return self._images[len(self.y) // 2, len(self.x) // 2]
+
+    @property
+    def images(self):
+        """Images of the PSF at all grid nodes
+        """
+        return self._images
+
+    def normalize(self):
+        """Normalize to PSF image in every band to unity
+        """
+        sums = self._images.sum(axis=(-2, -1))
+        self._images /= sums[:, :, :, None, None]
+        return self
+
+    def update_dtype(self, dtype):
+        """Update data type of `images` to `dtype`
+        """
+        if self._images.dtype != dtype:
+            self._images = self._images.astype(dtype)
+        return self
+
+    def get_weights(self, y, x):
+        """Interpolation weights of the grid nodes
+
+        Parameters
+        ----------
+        y: array
+            Vertical pixel coordinates in the frame
+        x: array
+            Horizontal pixel coordinates in the frame
+
+        Returns
+        -------
+        weights_y: array
+            (len(self.y), len(y)) weights of every row of grid nodes
+        weights_x: array
+            (len(self.x), len(x)) weights of every column of grid nodes
+        """
+        weights_y = _linear_weights(self.y, np.asarray(y) + self.origin[0])
+        weights_x = _linear_weights(self.x, np.asarray(x) + self.origin[1])
+        return weights_y, weights_x
+
+    def at(self, y, x):
+        """Interpolated PSF image at the frame pixel position (y, x)
+        """
+        weights_y, weights_x = self.get_weights([y], [x])
+        return np.einsum("i,j,ij...->...", weights_y[:, 0], weights_x[:, 0], self._images)
+
+    def cutout(self, origin):
+        """PSF for a cutout of the frame starting at pixel `origin`
+
+        The cutout shares the images and the cached difference kernels.
+
+        Parameters
+        ----------
+        origin: tuple
+            Frame pixel position (y, x) of the pixel (0, 0) of the cutout
+        """
+        psf = GridPSF.__new__(GridPSF)
+        psf.__dict__.update(self.__dict__)
+        psf.origin = tuple(o + o_ for o, o_ in zip(self.origin, origin))
+        return psf
+
+    def get_diff_kernels(self, model_psf):
+        """Difference kernels between the PSF at every grid node and `model_psf`
+
+        The kernels are cached and shared between all cutouts of this PSF.
+
+        Parameters
+        ----------
+        model_psf: `scarlet.PSF`
+            PSF of the model frame
+
+        Returns
+        -------
+        kernels: list of lists of `~scarlet.fft.Fourier`
+            Difference kernels for every grid node
+        """
+        model_image = model_psf.image
+        key = (model_image.shape, model_image.dtype.str, model_image.tobytes())
+        try:
+            return self._diff_kernels[key]
+        except KeyError:
+            model_psf_ = fft.Fourier(model_image)
+            kernels = [
+                [fft.match_psfs(fft.Fourier(image), model_psf_) for image in row]
+                for row in self._images
+            ]
+            self._diff_kernels[key] = kernels
+            return kernels
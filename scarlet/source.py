@@ -2,6 +2,7 @@ from .constraint import *
 from .component import *
 from .bbox import *
 from . import operator
+from . import interpolation
 
 # make sure that import * above doesn't import its own stock numpy
 import autograd.numpy as np
@@ -90,7 +91,7 @@ def get_best_fit_seds(morphs, frame, images):
     return seds
 
 
-def build_detection_coadd(sed, bg_rms, observation):
+def build_detection_coadd(sed, bg_rms, observation, images=None):
     """Build a channel weighted coadd to use for source detection
 
     Parameters
@@ -101,6 +102,8 @@ def build_detection_coadd(sed, bg_rms, observation):
         Background RMS in each channel in observation.
     observation: `~scarlet.observation.Observation`
         Observation to use for the coadd.
+    images: array
+        Images to coadd instead of `observation.images`, e.g. residuals
 
     Returns
     -------
@@ -114,7 +117,9 @@ def build_detection_coadd(sed, bg_rms, observation):
         raise ValueError("bg_rms must be greater than zero in all channels")
 
     positive = [c for c in range(C) if sed[c] > 0]
-    positive_img = [observation.images[c] for c in positive]
+    if images is None:
+        images = observation.images
+    positive_img = [images[c] for c in positive]
     positive_bgrms = np.array([bg_rms[c] for c in positive])
     weights = np.array([sed[c] / bg_rms[c] ** 2 for c in positive])
     jacobian = np.array([sed[c] ** 2 / bg_rms[c] ** 2 for c in positive]).sum()
@@ -125,6 +130,47 @@ def build_detection_coadd(sed, bg_rms, observation):
     return detect, bg_cutoff
 
 
+def find_peaks(detect, min_value, mask=None):
+    """Find the local maxima of `detect` above `min_value`
+
+    A pixel is a peak if it is not smaller than any of its 8 neighbors.
+    Of multiple neighboring pixels with the same value, only the last one in
+    row-major order is a peak.
+
+    Parameters
+    ----------
+    detect: array
+        2D detection image, e.g. from `build_detection_coadd`
+    min_value: float
+        Minimum value of a peak
+    mask: array
+        2D boolean array of the pixels that can be peaks, all if `None`
+
+    Returns
+    -------
+    peaks: list of tuple
+        (y, x) pixel coordinates of the peaks, sorted by decreasing value
+    """
+    Ny, Nx = detect.shape
+    padded = np.pad(detect, 1, mode="constant", constant_values=-np.inf)
+    peak = detect > min_value
+    if mask is not None:
+        peak &= mask
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            if dy == dx == 0:
+                continue
+            neighbor = padded[1 + dy : 1 + dy + Ny, 1 + dx : 1 + dx + Nx]
+            # break ties in favor of the later pixel
+            if (dy, dx) > (0, 0):
+                peak &= detect > neighbor
+            else:
+                peak &= detect >= neighbor
+    y, x = np.nonzero(peak)
+    order = np.argsort(-detect[y, x], kind="stable")
+    return list(zip(y[order].tolist(), x[order].tolist()))
+
+
 def trim_morphology(sky_coord, frame, morph, bg_cutoff, thresh):
     # trim morph to pixels above threshold
     mask = morph > bg_cutoff * thresh
@@ -333,7 +379,7 @@ class PointSource(FunctionComponent):
     and the morphology taken from `frame.psfs`, centered at `sky_coord`.
     """
 
-    def __init__(self, frame, sky_coord, observations):
+    def __init__(self, frame, sky_coord, observations, fourier_shift=False):
         """Source intialized with a single pixel
 
         Parameters
@@ -344,9 +390,17 @@ class PointSource(FunctionComponent):
             Center of the source
         observations: instance or list of `~scarlet.Observation`
             Observation(s) to initialize this source
+        fourier_shift: bool
+            Whether the PSF image is computed once and moved to the current
+            center with `~scarlet.interpolation.FourierShift` instead of being
+            evaluated at every center. This is always the case for PSFs that
+            are given as images. For undersampled PSFs, the shifted image
+            is only approximate.
         """
         C, Ny, Nx = frame.shape
         self.center = np.array(frame.get_pixel(sky_coord), dtype="float")
+        # keep the model PSF even if the source is rendered in another frame
+        self.psf = frame.psf
 
         # initialize SED from sky_coord
         try:
@@ -390,10 +444,28 @@ class PointSource(FunctionComponent):
         right = pixel_center[1] + frame.psf.shape[2] // 2
         bbox = Box.from_bounds((front, back), (bottom, top), (left, right))
 
+        self._shifted_psf = None
+        if fourier_shift or self.psf._func is None:
+            self._shifted_psf = self._get_shifted_psf(pixel_center, bbox)
+
         super().__init__(frame, sed, center, self._psf_wrapper, bbox=bbox)
 
+    def _get_shifted_psf(self, pixel_center, bbox, margin=4):
+        # PSF image at pixel_center, with a margin around bbox to
+        # suppress artifacts from its truncated edges when shifting
+        shape = (bbox.shape[1] + 2 * margin, bbox.shape[2] + 2 * margin)
+        if self.psf._func is not None:
+            origin = (0, bbox.origin[1] - margin, bbox.origin[2] - margin)
+            psf_box = Box((1,) + shape, origin=origin)
+            image = self.psf(*pixel_center, bbox=psf_box)[0]
+        else:
+            image = interpolation.project_image(self.psf.image[0], shape)
+        return interpolation.FourierShift(image, pixel_center, margin=margin)
+
     def _psf_wrapper(self, *parameters):
-        return self.frame.psf.__call__(*parameters, bbox=self.bbox)[0]
+        if self._shifted_psf is not None:
+            return self._shifted_psf(*parameters)
+        return self.psf.__call__(*parameters, bbox=self.bbox)[0]
 
 
 class ExtendedSource(FactorizedComponent):
@@ -600,6 +672,9 @@ class MultiComponentSource(ComponentTree):
                 FactorizedComponent(frame, sed, morph, bbox=bbox, shift=shift)
             )
             components[-1].pixel_center = pixel_center
+            if shift is not None:
+                # all components share the shift, so they can share its phase ramps
+                components[-1]._phase_cache = components[0]._phase_cache
         super().__init__(components)
 
     @property
@@ -1,4 +1,5 @@
 import numpy as np
+from numpy.testing import assert_array_equal
 import scarlet
 
 
@@ -52,3 +53,68 @@ class TestBox(object):
         bbox = scarlet.Box.from_bounds((0, 3), (-2, 3), (-3, 2))
         image = bbox.insert_into(image, sub)
         assert image.shape == (3, 5, 5) and image[1, 1, 1] == 1
+
+    def test_index(self):
+        rng = np.random.RandomState(0)
+        boxes = [
+            scarlet.Box(rng.randint(1, 12, size=2), origin=rng.randint(-5, 60, size=2))
+            for k in range(60)
+        ]
+        index = scarlet.BoxIndex(cell_size=8)
+        for k, box in enumerate(boxes):
+            index.insert(k, box)
+        assert len(index) == 60
+
+        def overlaps(box, other):
+            return all(s > 0 for s in (box & other).shape)
+
+        for query in boxes[:10] + [scarlet.Box((30, 20), origin=(10, -10))]:
+            expected = [k for k, box in enumerate(boxes) if overlaps(box, query)]
+            assert sorted(index.query(query)) == expected
+
+        # every pair once
+        pairs = sorted(tuple(sorted(pair)) for pair in index.get_pairs())
+        expected = [
+            (k, j)
+            for k in range(60)
+            for j in range(k + 1, 60)
+            if overlaps(boxes[k], boxes[j])
+        ]
+        assert pairs == expected
+
+        # moved and removed boxes
+        index.insert(0, scarlet.Box((2, 2), origin=(100, 100)))
+        assert index.query(scarlet.Box((1, 1), origin=(101, 101))) == [0]
+        index.remove(0)
+        assert 0 not in index
+        assert index.query(scarlet.Box((1, 1), origin=(101, 101))) == []
+
+    def test_box_array(self):
+        boxes = [
+            scarlet.Box((3, 4, 5), origin=(0, 1, 2)),
+            scarlet.Box((3, 2, 2), origin=(0, -1, 8)),
+            scarlet.Box((3, 6, 1), origin=(0, 9, 0)),
+        ]
+        array = scarlet.BoxArray.from_boxes(boxes)
+        assert len(array) == 3 and array.D == 3
+        assert list(array) == boxes
+        assert array[1] == boxes[1]
+        assert list(array[1:]) == boxes[1:]
+        assert_array_equal(array.size, [60, 12, 18])
+
+        # operations with a Box apply to every box
+        frame = scarlet.Box((3, 10, 10))
+        assert list(array & frame) == [box & frame for box in boxes]
+        assert list(array | frame) == [box | frame for box in boxes]
+        region = scarlet.Box((3, 4, 10))
+        assert_array_equal(array.overlaps(region), [True, True, False])
+        slices = [box.slices_for(frame.shape) for box in boxes]
+        assert array.slices_for(frame.shape) == slices
+        assert_array_equal(array.contains((1, 0, 8)), [False, True, False])
+        assert_array_equal(array == boxes[2], [False, False, True])
+
+        # and box by box with another BoxArray
+        other = scarlet.BoxArray.from_boxes(boxes[::-1])
+        assert list(array & other) == [a & b for a, b in zip(boxes, boxes[::-1])]
+        array -= (0, 1, 1)
+        assert array[0] == scarlet.Box((3, 4, 5), origin=(0, 0, 1))
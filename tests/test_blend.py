@@ -0,0 +1,247 @@
+import numpy as np
+from numpy.testing import assert_almost_equal
+import pytest
+
+import scarlet
+
+
+class TestBlend:
+    def get_blend(self, n_observations=2):
+        shape = (2, 45, 45)
+        model_psf = scarlet.GaussianPSF([0.9] * 2, (11, 11))
+        frame = scarlet.Frame(shape, psfs=model_psf)
+
+        # two point sources
+        truth = np.zeros(shape)
+        positions = [(18, 19), (25, 26)]
+        for k, (y, x) in enumerate(positions):
+            truth[:, y, x] = 10 * (k + 1)
+
+        observations = []
+        for sigma in [(1.5, 2.0), (4.0, 3.5), (1.2, 1.6)][:n_observations]:
+            psf = scarlet.GaussianPSF(sigma, (21, 21))
+            kernel = scarlet.fft.Fourier(psf.get_diff_kernel(model_psf))
+            images = scarlet.fft.convolve(
+                scarlet.fft.Fourier(truth), kernel, axes=(1, 2)
+            ).image
+            observations.append(scarlet.Observation(images, psfs=psf).match(frame))
+
+        sources = [
+            scarlet.PointSource(frame, position, observations)
+            for position in positions
+        ]
+        return scarlet.Blend(sources, observations)
+
+    def test_parallel_loss(self):
+        serial = self.get_blend().fit(10, e_rel=0)
+        # observations with the full model and with footprints
+        boxes = [c.bbox for c in serial.components]
+        assert [obs._use_footprints(boxes) for obs in serial.observations] == [True, False]
+
+        parallel = self.get_blend().fit(10, e_rel=0, n_threads=2)
+        assert parallel._executor is None
+        assert_almost_equal(parallel.loss, serial.loss)
+        for p, p_ in zip(parallel.parameters, serial.parameters):
+            assert_almost_equal(p, p_)
+
+    def test_parameter_buffer(self):
+        blend = self.get_blend(n_observations=1)
+        X = blend.parameters
+        blend.fit(3, e_rel=0)
+        buffer = blend._parameter_buffer
+        # components now hold views into the buffer
+        assert all(p is q for p, q in zip(blend.parameters, buffer.parameters))
+        assert all(p.base is not None for p in blend.parameters)
+        for p, x in zip(blend.parameters, X):
+            assert p.name == x.name
+        # warm start uses the same buffer
+        blend.fit(3, e_rel=0)
+        assert blend._parameter_buffer is buffer
+        assert np.any(blend.parameters[0].m != 0)
+
+    def test_update_seds(self):
+        blend = self.get_blend()
+
+        def loss():
+            model = np.zeros(blend.frame.shape)
+            for c in blend.components:
+                model = model + c.get_model()
+            return sum(obs.get_loss(model) for obs in blend.observations)
+
+        blend.update_seds()
+        seds = [c._parameters[0] for c in blend.components]
+        assert all(not sed.fixed for sed in seds)
+        assert all((sed > 0).all() for sed in seds)
+
+        # best fit for the current morphologies in every channel
+        best = loss()
+        for sed in seds:
+            for c in range(blend.frame.shape[0]):
+                for factor in [0.99, 1.01]:
+                    sed[c] *= factor
+                    assert loss() > best
+                    sed[c] /= factor
+
+    def test_exact_seds(self):
+        blend = self.get_blend(n_observations=1).fit(20, e_rel=0, exact_seds=True)
+        reference = self.get_blend(n_observations=1).fit(20, e_rel=0)
+        assert blend.loss[-1] < reference.loss[-1]
+        # SEDs are optimized again afterwards
+        assert all(not c._parameters[0].fixed for c in blend.components)
+        assert len(blend._linear_seds) == 0
+
+    def test_fista(self):
+        blend = self.get_blend(n_observations=1).fit(20, e_rel=0, scheme="fista")
+        reference = self.get_blend(n_observations=1).fit(20, e_rel=0)
+        # loss evaluations for the step sizes are not recorded
+        assert len(blend.loss) == len(reference.loss)
+        assert blend.loss[-1] < reference.loss[-1]
+        assert all(np.isfinite(p).all() for p in blend.parameters)
+
+    def test_budgets(self):
+        blend = self.get_blend(n_observations=1).fit(20, e_rel=0)
+        assert blend.stop_reason == "max_iter"
+        assert blend.diagnostics["iterations"] == 20
+        pixels = blend.diagnostics["pixel_iterations"] // 20
+        assert pixels == sum(np.prod(c.bbox.shape) for c in blend.components)
+
+        budget = 5.5 * pixels
+        blend = self.get_blend(n_observations=1).fit(20, e_rel=0, pixel_budget=budget)
+        assert blend.stop_reason == "pixel_budget"
+        assert blend.diagnostics["iterations"] == 5
+        assert blend.diagnostics["pixel_iterations"] <= budget
+        assert blend.diagnostics["rel_change"] > 0
+
+        blend = self.get_blend(n_observations=1).fit(20, e_rel=0, time_budget=0)
+        assert blend.stop_reason == "time_budget"
+        assert blend.diagnostics["iterations"] == 0
+
+        # point sources are fixed at coarse levels, which are skipped
+        blend = self.get_blend(n_observations=1).fit(
+            20, e_rel=0, pixel_budget=budget, multiresolution=(2,)
+        )
+        assert blend.stop_reason == "pixel_budget"
+        assert blend.diagnostics["iterations"] == 5
+
+        # fista ends at its last feasible parameters, not at the best evaluation
+        blend = self.get_blend(n_observations=1).fit(
+            20, e_rel=0, pixel_budget=budget, scheme="fista"
+        )
+        reference = self.get_blend(n_observations=1).fit(5, e_rel=0, scheme="fista")
+        for p, p_ in zip(blend.parameters, reference.parameters):
+            assert_almost_equal(p, p_)
+
+        # restored states include the exactly solved SEDs
+        blend = self.get_blend(n_observations=1)
+        states = []
+
+        def callback(*X, it):
+            if it == 1:
+                states.append(blend._get_state())
+            elif it == 3:
+                blend._set_state(states[0])
+                for sed, value in zip(blend._linear_seds, states[0]["seds"]):
+                    assert_almost_equal(sed, value)
+                states.append(it)
+
+        blend.fit(5, e_rel=0, exact_seds=True, callback=callback)
+        assert len(states) == 2 and len(states[0]["seds"]) == 2
+
+    def test_moment_dtype(self):
+        blend = self.get_blend(n_observations=1).fit(5, e_rel=0, moment_dtype="float32")
+        sed = blend.parameters[0]
+        assert sed.v.dtype == np.float32 and sed.std.dtype == np.float64
+        assert blend._parameter_buffer.moment_dtype == np.float32
+
+        # warm starts accumulate in double precision again
+        blend.fit(5, e_rel=0, moment_dtype=None)
+        assert all(p.m is None and p.std is None for p in blend.parameters)
+        blend.fit(5, e_rel=0)
+        assert sed.v.dtype == np.float64 and np.any(sed.v > 0)
+
+    def test_incremental(self):
+        blend = self.get_blend().fit(5, e_rel=0)
+
+        def residuals():
+            model = np.zeros(blend.frame.shape)
+            for c in blend.components:
+                model = model + c.get_model()
+            return [
+                obs.images[obs.slices] - obs.render(model)
+                for obs in blend.observations
+            ]
+
+        for r, r_ in zip(blend.get_residuals(), residuals()):
+            assert_almost_equal(r, r_)
+
+        # a new source far from the others
+        old = [np.array(p) for p in blend.parameters]
+        moments = [np.array(p.m) for p in blend.parameters]
+        new = scarlet.PointSource(blend.frame, (38, 6), blend.observations)
+        blend += new
+        assert blend._get_changed_components() == [new]
+        for r, r_ in zip(blend.get_residuals(), residuals()):
+            assert_almost_equal(r, r_)
+
+        blend.fit(5, e_rel=0, local=True)
+        assert all(not p.fixed for p in blend.parameters)
+        for p, x, m in zip(blend.parameters, old, moments):
+            assert_almost_equal(p, x)
+            assert_almost_equal(p.m, m)
+        assert np.any(new.parameters[0].m != 0)
+        for r, r_ in zip(blend.get_residuals(), residuals()):
+            assert_almost_equal(r, r_)
+
+        # removal changes the neighbours of the removed source
+        blend -= blend.sources[0]
+        assert blend._get_changed_components() == [blend.sources[0]]
+        for p in new.parameters:
+            p.fixed = True
+        assert_almost_equal(blend._get_fixed_model(), new.get_model())
+        # footprint indices of earlier fits are dropped
+        obs = blend.observations[0]
+        obs._footprint_index["removed"] = None
+        blend.fit(1, e_rel=0)
+        assert "removed" not in obs._footprint_index
+        assert len(obs._footprint_index)
+        for r, r_ in zip(blend.get_residuals(), residuals()):
+            assert_almost_equal(r, r_)
+        for p in new._parameters:
+            p.fixed = False
+        assert blend._get_fixed_model() is None
+
+    def test_find_residual_peaks(self):
+        blend = self.get_blend(n_observations=1)
+        observation = blend.observations[0]
+        # a source that is not in the model, and masked pixels
+        observation.images[:, 35, 10] += 1000
+        observation.images[:, 5, 40] += 1000
+        observation.weights = np.ones(observation.images.shape)
+        observation.weights[:, 5, 40] = 0
+        blend.fit(20)
+
+        peaks = blend.find_residual_peaks(thresh=50)
+        assert peaks[0] == (35, 10) and (5, 40) not in peaks
+
+        # channels without weights are left out of the coadd
+        observation.weights[1] = 0
+        assert blend.find_residual_peaks(thresh=50)[0] == (35, 10)
+        observation.weights[0] = 0
+        with pytest.raises(ValueError):
+            blend.find_residual_peaks(thresh=50)
+
+        # ties between neighbors give one peak
+        detect = np.zeros((5, 6))
+        detect[2, 2:4] = 1
+        assert scarlet.source.find_peaks(detect, 0) == [(2, 3)]
+
+    def test_local_without_changes(self):
+        blend = self.get_blend(n_observations=1).fit(5, e_rel=0)
+        X = [np.array(p) for p in blend.parameters]
+        loss = list(blend.loss)
+        blend.fit(5, e_rel=0, local=True)
+        assert blend.stop_reason == "converged"
+        assert blend.diagnostics["iterations"] == 0 and blend.loss == loss
+        for p, x in zip(blend.parameters, X):
+            assert_almost_equal(p, x)
+        assert all(not p.fixed for p in blend.parameters)
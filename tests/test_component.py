@@ -140,3 +140,145 @@ class TestComponentTree:
             mask[test_loc] = True
         assert_array_equal(model[~mask], 0)
         assert_array_equal(model[mask], 1)
+
+    def test_model_cache(self):
+        frame_shape = (3, 20, 30)
+        frame = scarlet.Frame(frame_shape)
+
+        shape = (3, 4, 6)
+        sed = scarlet.Parameter(np.arange(1, 4, dtype="float"))
+        morph = scarlet.Parameter(np.ones(shape[1:]))
+        shift = scarlet.Parameter(np.array([0.1, -0.2]))
+        bbox = scarlet.Box(shape, origin=(0, 3, 4))
+        component = scarlet.FactorizedComponent(frame, sed, morph, shift=shift, bbox=bbox)
+        tree = scarlet.ComponentTree([component])
+
+        model = tree.get_model()
+        cached = tree._model_cache[1]
+        assert_array_equal(model[0, :3], 0)
+        # callers get writable copies of the memoized model
+        model[:] = 0
+        assert tree.get_model().any()
+        assert tree._model_cache[1] is cached
+        model = tree.get_model()
+
+        # in-place updates invalidate the memoized models
+        version = sed.version
+        sed[:] *= 2
+        assert sed.version != version
+        model_ = tree.get_model()
+        assert model_ is not model
+        assert_almost_equal(model_, 2 * model)
+        assert_almost_equal(component.get_model(), model_)
+
+        morph -= 1
+        assert_array_equal(tree.get_model(), 0)
+
+        # so do writes through ufuncs and views, and new boxes
+        np.add(morph, 1, out=morph)
+        assert_almost_equal(tree.get_model(), model_)
+        morph[1:][0][:] = 0
+        model = tree.get_model()
+        assert not np.allclose(model, model_)
+        component.bbox = scarlet.Box(shape, origin=(0, 5, 4))
+        component.set_frame(frame)
+        assert_almost_equal(tree.get_model()[:, 5:], model[:, 3:-2])
+
+    def test_spatial_index(self):
+        frame = scarlet.Frame((2, 40, 40))
+        origins = [(0, 0, 0), (0, 5, 5), (0, 20, 20), (0, 30, 2)]
+        components = [
+            scarlet.CubeComponent(
+                frame,
+                scarlet.Parameter(np.ones((2, 8, 8))),
+                bbox=scarlet.Box((2, 8, 8), origin=origin),
+            )
+            for origin in origins
+        ]
+        tree = scarlet.ComponentTree(components[:3])
+
+        region = scarlet.Box((2, 10, 10), origin=(0, 4, 4))
+        assert tree.components_in(region) == tuple(components[:2])
+        graph = tree.get_overlap_graph()
+        assert graph.shape == (3, 3)
+        assert_array_equal(graph.toarray(), [[0, 1, 0], [1, 0, 0], [0, 0, 0]])
+
+        # added components and replaced boxes update the index
+        tree += components[3]
+        assert tree.components_in(scarlet.Box((2, 1, 1), origin=(0, 31, 3))) == (
+            components[3],
+        )
+        components[2].bbox = scarlet.Box((2, 8, 8), origin=(0, 10, 10))
+        assert tree.components_in(region) == tuple(components[:3])
+        assert tree.get_overlap_graph().sum() == 4
+
+    def test_set_frame(self):
+        frame = scarlet.Frame((2, 20, 20))
+        origins = [(0, -3, 4), (0, 15, 15), (0, 5, 5)]
+        components = [
+            scarlet.CubeComponent(
+                frame,
+                scarlet.Parameter(np.ones((2, 8, 8))),
+                bbox=scarlet.Box((2, 8, 8), origin=origin),
+            )
+            for origin in origins
+        ]
+        expected = [(c.pad_width, c.slices) for c in components]
+        tree = scarlet.ComponentTree(components)
+
+        # all components are padded at once
+        frame_ = scarlet.Frame((2, 30, 30))
+        tree.set_frame(frame_)
+        for c in components:
+            assert c.frame is frame_
+            assert c.get_model().shape == frame_.shape
+        tree.set_frame(frame)
+        assert [(c.pad_width, c.slices) for c in components] == expected
+        assert_array_equal(components[0].get_model()[:, :5, 4:12], 1)
+
+    def test_mutation(self):
+        frame = scarlet.Frame((2, 20, 20))
+        components = [
+            scarlet.CubeComponent(
+                frame,
+                scarlet.Parameter(np.ones((2, 4, 4)), name=str(k)),
+                bbox=scarlet.Box((2, 4, 4), origin=(0, 2 * k, 2 * k)),
+            )
+            for k in range(5)
+        ]
+        tree = scarlet.ComponentTree(components[:1])
+        for c in components[1:3]:
+            tree += c
+        subtree = scarlet.ComponentTree(components[3:])
+        tree += scarlet.ComponentTree([subtree])
+        assert tree.components == tuple(components)
+        assert [p.name for p in tree.parameters] == ["0", "1", "2", "3", "4"]
+        region = scarlet.Box((2, 1, 1), origin=(0, 5, 5))
+        assert tree.components_in(region) == tuple(components[1:3])
+
+        # the cached free parameters follow `fixed`
+        components[2]._parameters[0].fixed = True
+        assert [p.name for p in tree.parameters] == ["0", "1", "3", "4"]
+        components[2]._parameters[0].fixed = False
+
+        # removal renumbers the remaining sources
+        tree -= components[1]
+        assert tree.components == (components[0],) + tuple(components[2:])
+        assert [c._index for c in tree.sources] == [0, 1, 2]
+        assert components[1]._parent is None
+        assert tree.components_in(region) == (components[2],)
+        assert [p.name for p in tree.parameters] == ["0", "2", "3", "4"]
+        with pytest.raises(ValueError):
+            tree -= components[1]
+
+        # changes of nested trees reach the trees that hold them
+        subtree -= components[4]
+        assert tree.components == (components[0], components[2], components[3])
+
+        # components held by multiple sources stay until the last one is removed
+        tree += components[0]
+        tree -= components[0]
+        assert tree.components == (components[0], components[2], components[3])
+        assert components[0]._index == 0 and components[0]._parent is tree
+        tree -= components[0]
+        assert tree.components == (components[2], components[3])
@@ -390,3 +390,55 @@ class TestConvolutions:
         truth[1:1+Ny, 2:2+Nx] += _img*(1-Dx)*Dy
         truth[1:1+Ny, 3:3+Nx] += _img*Dx*Dy
         assert_almost_equal(result, truth)
+
+    def test_sinc_interp(self):
+        # smooth images sampled on a coarse grid
+        y_lr = np.arange(15) * 2.
+        x_lr = np.arange(15) * 2.
+        Y, X = np.meshgrid(y_lr, x_lr, indexing="ij")
+        sigmas = np.array([3., 4.])
+        images = np.exp(-((Y - 14) ** 2 + (X - 14) ** 2)[None] / (2 * sigmas[:, None, None] ** 2))
+
+        y_hr = np.arange(4, 25) + .3
+        x_hr = np.arange(3, 26) - .2
+        dense = scarlet.interpolation.sinc_interp(images, (y_hr, x_hr), (y_lr, x_lr))
+        banded = scarlet.interpolation.sinc_interp(images, (y_hr, x_hr), (y_lr, x_lr), window=5)
+        assert banded.shape == dense.shape
+        assert_almost_equal(banded, dense, decimal=2)
+
+    def test_fourier_shift(self):
+        from autograd import grad
+        import autograd.numpy as anp
+
+        bbox = scarlet.Box((1, 24, 24), origin=(0, 10, 20))
+
+        def psf(y, x):
+            return scarlet.psf.gaussian(y, x, sigma=1.5, integrate=False, bbox=bbox)[0]
+
+        shifter = scarlet.interpolation.FourierShift(psf(22, 32), (22, 32), margin=4)
+        result = shifter(22.3, 31.6)
+        assert result.shape == (16, 16)
+        assert_almost_equal(result, psf(22.3, 31.6)[4:-4, 4:-4], decimal=5)
+
+        # analytic gradient agrees with finite differences
+        weights = np.arange(16 * 16).reshape(16, 16)
+
+        def loss(y, x):
+            return anp.sum(weights * shifter(y, x))
+
+        dy, dx = grad(loss, (0, 1))(22.3, 31.6)
+        eps = 1e-6
+        dy_ = (loss(22.3 + eps, 31.6) - loss(22.3 - eps, 31.6)) / (2 * eps)
+        dx_ = (loss(22.3, 31.6 + eps) - loss(22.3, 31.6 - eps)) / (2 * eps)
+        assert_almost_equal(dy, dy_, decimal=4)
+        assert_almost_equal(dx, dx_, decimal=4)
+
+    def test_upsampling_matrix(self):
+        matrix = scarlet.interpolation.get_upsampling_matrix(5, 3)
+        assert matrix.shape == (15, 5)
+        assert_almost_equal(matrix.sum(axis=1), 1)
+        # pixel centers of the binned pixels are reproduced exactly
+        assert_almost_equal(matrix[1::3], np.eye(5))
+        # linear functions are interpolated exactly away from the edges
+        ramp = matrix @ np.arange(5.0)
+        assert_almost_equal(ramp[1:-1], (np.arange(15) / 3 - 1 / 3)[1:-1])
@@ -0,0 +1,138 @@
+import json
+
+import numpy as np
+from numpy.testing import assert_array_equal
+import pytest
+
+import scarlet
+import scarlet.io
+
+
+class TestIO:
+    def get_blend(self):
+        shape = (2, 41, 41)
+        model_psf = scarlet.GaussianPSF([0.9] * 2, (11, 11))
+        frame = scarlet.Frame(shape, psfs=model_psf)
+
+        y, x = np.indices(shape[1:])
+        truth = np.zeros(shape)
+        positions = [(12, 13), (27, 26), (20, 30)]
+        for k, (cy, cx) in enumerate(positions):
+            morph = np.exp(-((y - cy) ** 2 + (x - cx) ** 2) / (2 * (k + 1.5) ** 2))
+            truth += 100 * np.array([1, k + 1])[:, None, None] * morph
+
+        psf = scarlet.GaussianPSF([1.5, 2.0], (21, 21))
+        kernel = scarlet.fft.Fourier(psf.get_diff_kernel(model_psf))
+        images = scarlet.fft.convolve(
+            scarlet.fft.Fourier(truth), kernel, axes=(1, 2)
+        ).image
+        observation = scarlet.Observation(
+            images, psfs=psf, weights=np.ones(shape)
+        ).match(frame)
+
+        cube = scarlet.Parameter(
+            np.full((2, 5, 5), 0.1), name="cube", step=1e-3, fixed=True
+        )
+        sources = [
+            scarlet.ExtendedSource(
+                frame, positions[0], observation, symmetric=True, shifting=True
+            ),
+            scarlet.MultiComponentSource(frame, positions[1], observation),
+            scarlet.PointSource(frame, positions[2], observation),
+            scarlet.CubeComponent(frame, cube, bbox=scarlet.Box((2, 5, 5))),
+        ]
+        return scarlet.Blend(sources, observation)
+
+    def test_round_trip(self, tmp_path):
+        blend = self.get_blend().fit(3, e_rel=0)
+        filename = str(tmp_path / "blend.npz")
+        scarlet.io.save_blend(filename, blend)
+
+        loaded = scarlet.io.load_blend(filename, blend.frame, blend.observations)
+        assert [type(s) for s in loaded.sources] == [type(s) for s in blend.sources]
+        assert_array_equal(loaded.loss, blend.loss)
+        assert_array_equal(loaded.get_model(), blend.get_model())
+        assert loaded.sources[0].symmetric and not blend.sources[1].symmetric
+        assert loaded.sources[0].pixel_center == blend.sources[0].pixel_center
+
+        for c, c_ in zip(loaded.components, blend.components):
+            assert c.bbox == c_.bbox
+            for p, p_ in zip(c.parameters, c_.parameters):
+                assert p.name == p_.name and p.fixed == p_.fixed
+                assert type(p.constraint) is type(p_.constraint)
+                assert_array_equal(p, p_)
+            assert c.get_model().shape == c_.get_model().shape
+
+        # steps and constraints act the same
+        sed, morph = loaded.components[0].parameters[:2]
+        sed_, morph_ = blend.components[0].parameters[:2]
+        assert sed.step(sed, 0) == sed_.step(sed_, 0)
+        assert [type(c) for c in morph.constraint.constraints] == [
+            type(c) for c in morph_.constraint.constraints
+        ]
+        # components of a tree share the shift and the bbox of the source
+        tree = loaded.sources[1]
+        assert tree.bbox == blend.sources[1].bbox
+        assert all(c._parent is tree for c in tree)
+
+        # fits continue from the stored state
+        loaded.fit(3, e_rel=0)
+        assert len(loaded.loss) == 6 and np.isfinite(loaded.loss[-1])
+
+    def test_version(self, tmp_path):
+        blend = self.get_blend()
+        filename = str(tmp_path / "blend.npz")
+        scarlet.io.save_blend(filename, blend)
+
+        with np.load(filename) as data:
+            columns = dict(data)
+        header = json.loads(str(columns["header"]))
+        header["version"] = scarlet.io.FORMAT_VERSION + 1
+        columns["header"] = np.array(json.dumps(header))
+        np.savez(filename, **columns)
+        with pytest.raises(ValueError):
+            scarlet.io.load_sources(filename, blend.frame)
+
+    def test_unsupported(self, tmp_path):
+        blend = self.get_blend()
+        blend.components[0]._parameters[0].step = lambda x, it: 0.1
+        with pytest.raises(TypeError):
+            scarlet.io.save_blend(str(tmp_path / "blend.npz"), blend)
+
+        # components with more parameters than the scarlet ones
+        class Component(scarlet.FactorizedComponent):
+            pass
+
+        c = self.get_blend().components[0]
+        component = Component(c.frame, *c.parameters, bbox=c.bbox)
+        component._parameters += (scarlet.Parameter(np.zeros(2), name="extra"),)
+        blend = scarlet.Blend([component], blend.observations)
+        with pytest.raises(TypeError):
+            scarlet.io.save_blend(str(tmp_path / "blend.npz"), blend)
+
+    def test_allowed(self, tmp_path):
+        blend = self.get_blend()
+        filename = str(tmp_path / "blend.npz")
+        scarlet.io.save_blend(filename, blend)
+        with np.load(filename) as data:
+            columns = dict(data)
+        header = json.loads(str(columns["header"]))
+
+        # only scarlet components, constraints and functions are loaded
+        tampered = [
+            ("types", 0, "os:system"),
+            ("types", 0, "scarlet.constraint:PositivityConstraint"),
+            ("specs", 0, ["function", "scarlet.io:save_blend"]),
+            ("specs", 0, ["object", "scarlet.component:CubeComponent", ["dict"]]),
+        ]
+        for key, index, entry in tampered:
+            changed = json.loads(json.dumps(header))
+            changed[key][index] = entry
+            columns["header"] = np.array(json.dumps(changed))
+            np.savez(filename, **columns)
+            with pytest.raises(ValueError):
+                scarlet.io.load_sources(filename, blend.frame)
+
+        blend.components[0]._parameters[0].step = np.sqrt
+        with pytest.raises(TypeError):
+            scarlet.io.save_blend(filename, blend)
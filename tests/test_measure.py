@@ -0,0 +1,88 @@
+import numpy as np
+from numpy.testing import assert_array_equal, assert_almost_equal
+import pytest
+
+import scarlet
+
+
+class TestMeasurements:
+    def get_components(self):
+        frame = scarlet.Frame((3, 20, 30))
+        components = []
+        for origin in [(0, 3, 4), (0, 10, 15)]:
+            shape = (3, 5, 7)
+            sed = scarlet.Parameter(np.arange(1, 4, dtype="float"))
+            morph = np.zeros(shape[1:])
+            morph[1, 2] = 3
+            morph[2, 4] = 1
+            morph = scarlet.Parameter(morph)
+            bbox = scarlet.Box(shape, origin=origin)
+            components.append(scarlet.FactorizedComponent(frame, sed, morph, bbox=bbox))
+        return components
+
+    def test_measurements(self):
+        component = self.get_components()[0]
+        assert_almost_equal(scarlet.measure.flux(component), [4, 8, 12])
+        assert scarlet.measure.max_pixel(component) == (2, 4, 6)
+        # centroid of the channel distribution and of the two pixels
+        truth = (np.array([8 / 6, 1.25, 2.5]) + np.array([0, 3, 4]))
+        assert_almost_equal(scarlet.measure.centroid(component), truth)
+
+    def test_get_model(self):
+        component = self.get_components()[0]
+        frame, bbox = component.frame, component.bbox
+        assert scarlet.measure.get_model(component).shape == bbox.shape
+
+        # components without models in their bbox are rendered in it
+        class Component(scarlet.Component):
+            def get_model(self, *parameters):
+                return np.ones(self.frame.shape)
+
+        other = Component(frame, *component.parameters, bbox=bbox)
+        assert_array_equal(scarlet.measure.get_model(other), 1)
+
+        # errors of the implementation are not taken for missing support
+        class Broken(scarlet.FactorizedComponent):
+            def _bbox_model(self):
+                raise NotImplementedError("broken")
+
+        broken = Broken(frame, *component.parameters, bbox=bbox)
+        with pytest.raises(NotImplementedError):
+            scarlet.measure.get_model(broken)
+
+    def test_catalog(self):
+        components = self.get_components()
+        table = scarlet.measure.catalog(components, measurements=("flux", "centroid", "max_pixel"))
+        assert table["flux"].shape == (2, 3)
+        assert table["centroid"].shape == (2, 3)
+        for k, component in enumerate(components):
+            assert_almost_equal(table["flux"][k], scarlet.measure.flux(component))
+            assert_almost_equal(table["centroid"][k], scarlet.measure.centroid(component))
+            assert_array_equal(table["max_pixel"][k], scarlet.measure.max_pixel(component))
+
+    def test_catalog_vectorized(self):
+        frame = scarlet.Frame((3, 40, 40))
+        rng = np.random.RandomState(1)
+        components = []
+        for shape, origin in [((3, 5, 7), (0, 3, 4)), ((3, 9, 4), (0, 20, 15))]:
+            cube = scarlet.Parameter(rng.rand(*shape))
+            bbox = scarlet.Box(shape, origin=origin)
+            components.append(scarlet.CubeComponent(frame, cube, bbox=bbox))
+        # ties are resolved like np.argmax
+        components[1]._parameters[0][:] = 1
+
+        table = scarlet.measure.catalog(components)
+        for k, component in enumerate(components):
+            model = np.array(component._parameters[0])
+            origin = np.array(component.bbox.origin)
+            assert_almost_equal(table["flux"][k], model.sum(axis=(1, 2)))
+            peak = np.unravel_index(np.argmax(model), model.shape)
+            assert_array_equal(table["max_pixel"][k], peak + origin)
+            grid = np.indices(model.shape)
+            truth = (grid * model).sum(axis=(1, 2, 3)) / model.sum() + origin
+            assert_almost_equal(table["centroid"][k], truth)
+
+        # models are copies, not views of the parameters
+        model = scarlet.measure.get_model(components[0])
+        model[:] = 0
+        assert np.all(components[0]._parameters[0] > 0)
@@ -0,0 +1,125 @@
+import numpy as np
+from numpy.testing import assert_almost_equal
+
+import scarlet
+from scarlet.multiresolution import (
+    downsample_psf,
+    downsample_observation,
+    downsample_frame,
+    downsample_blend,
+    upsample_blend,
+)
+
+
+class TestMultiresolution:
+    def get_blend(self):
+        shape = (2, 40, 40)
+        model_psf = scarlet.GaussianPSF([0.9] * 2, (10, 10))
+        frame = scarlet.Frame(shape, psfs=model_psf)
+        psf = scarlet.GaussianPSF([1.5, 2.0], (21, 21))
+
+        # a smooth galaxy
+        y, x = np.mgrid[:33, :33] - 16
+        morph = np.exp(-(y ** 2 + x ** 2) / 2 / 4 ** 2)
+        sed = np.array([3.0, 5.0])
+        truth = np.zeros(shape)
+        truth[:, 3:36, 5:38] = sed[:, None, None] * morph[None]
+        kernel = scarlet.fft.Fourier(psf.get_diff_kernel(model_psf))
+        images = scarlet.fft.convolve(
+            scarlet.fft.Fourier(truth), kernel, axes=(1, 2)
+        ).image
+        weights = np.ones(shape)
+        weights[:, :4, :4] = 0
+        observation = scarlet.Observation(images, psfs=psf, weights=weights)
+        observation.match(frame)
+
+        # start from a wider and fainter source
+        morph = np.exp(-(y ** 2 + x ** 2) / 2 / 6 ** 2)
+        sed = scarlet.Parameter(
+            sed * 0.5, name="sed", step=1e-2, constraint=scarlet.PositivityConstraint()
+        )
+        morph = scarlet.Parameter(
+            morph,
+            name="morph",
+            step=1e-2,
+            constraint=scarlet.ConstraintChain(
+                scarlet.MonotonicityConstraint(),
+                scarlet.PositivityConstraint(),
+                scarlet.NormalizationConstraint("max"),
+            ),
+        )
+        bbox = scarlet.Box((2, 33, 33), origin=(0, 3, 5))
+        component = scarlet.FactorizedComponent(frame, sed, morph, bbox=bbox)
+        return scarlet.Blend([component], observation)
+
+    def test_psf(self):
+        for shape in [(10, 10), (11, 11)]:
+            for factor in [2, 3]:
+                psf = downsample_psf(scarlet.GaussianPSF([1.5], shape), factor)
+                image = psf.image[0]
+                assert image.shape[0] % 2 == 1 and image.shape[1] % 2 == 1
+                assert np.unravel_index(np.argmax(image), image.shape) == tuple(
+                    n // 2 for n in image.shape
+                )
+                assert_almost_equal(image.sum(), 1)
+
+    def test_observation(self):
+        blend = self.get_blend()
+        observation = blend.observations[0]
+        frame = downsample_frame(blend.frame, 3)
+        assert frame.shape == (2, 14, 14)
+        binned = downsample_observation(observation, frame, 3)
+        assert binned.images.shape == frame.shape
+        # weights are summed, images are weighted means
+        assert_almost_equal(binned.weights[:, 0, 0], 0)
+        assert_almost_equal(binned.weights[:, 0, 1], 6)
+        assert_almost_equal(binned.weights[:, 1, 1], 8)
+        assert_almost_equal(binned.weights[:, 2, 2], 9)
+        images = observation.images
+        mean = images[:, 3:6, 3:6].sum(axis=(1, 2)) - images[:, 3, 3]
+        assert_almost_equal(binned.images[:, 1, 1], mean / 8, decimal=5)
+        assert_almost_equal(
+            binned.images[:, 2, 2], images[:, 6:9, 6:9].mean(axis=(1, 2)), decimal=5
+        )
+
+    def test_round_trip(self):
+        blend = self.get_blend()
+        component = blend.components[0]
+        model = component.get_model()
+
+        binned, pairs = downsample_blend(blend, 2)
+        binned_component = binned.components[0]
+        # bbox keeps the center of the morphology
+        assert binned_component.bbox.shape == (2, 17, 17)
+        assert binned_component.bbox.origin == (0, 1, 2)
+        assert_almost_equal(binned_component.sed, component.sed)
+        # binned model is the mean of the original one
+        binned_model = binned_component.get_model()
+        assert_almost_equal(
+            binned_model.sum() * 4, model.sum(), decimal=4
+        )
+
+        upsample_blend(pairs, 2)
+        assert_almost_equal(component.morph.max(), binned_component.morph.max())
+        assert np.abs(component.get_model() - model).max() < 0.05 * model.max()
+
+    def test_fit(self):
+        blend = self.get_blend()
+        blend.fit(20, e_rel=0, multiresolution=(2,))
+        # the final fit is done at full resolution
+        assert len(blend.loss) == 20
+        reference = self.get_blend().fit(20, e_rel=0)
+        assert blend.loss[0] < reference.loss[0]
+        assert blend.loss[-1] < reference.loss[-1]
+
+    def test_budget(self):
+        blend = self.get_blend().fit(5, e_rel=0)
+        pixels = blend.diagnostics["pixel_iterations"] // 5
+        budget = 10 * pixels
+        blend = self.get_blend().fit(
+            20, e_rel=0, pixel_budget=budget, multiresolution=(2,)
+        )
+        assert blend.stop_reason == "pixel_budget"
+        assert blend.diagnostics["pixel_iterations"] <= budget
+        # the coarse level used some of the budget
+        assert 0 < blend.diagnostics["iterations"] < 10
@@ -44,3 +44,208 @@ class TestObservation(object):
         log_norm = np.prod(images.shape) / 2 * np.log(2*np.pi) + np.sum(np.log(1 / weights)) / 2
         true_loss = log_norm + np.sum(weights * (model_ - images)** 2) / 2
         assert_almost_equal(observation.get_loss(model), true_loss)
+
+    def test_background(self):
+        shape0 = (3, 13, 13)
+        model_psf = scarlet.PSF(partial(scarlet.psf.gaussian, sigma=0.9), shape=shape0)
+        shape = (3, 43, 43)
+        model_frame = scarlet.Frame(shape, psfs=model_psf)
+        psf = scarlet.PSF(self.get_psfs(shape[1:], [2.1, 1.1, 3.5]))
+        images = np.ones(shape)
+        observation = scarlet.Observation(images, psfs=psf).match(model_frame)
+
+        model = np.zeros(shape)
+        model[:, 20, 21] = 1
+        background = np.zeros(shape)
+        background[:, 10:15, 30] = 2
+        loss = observation.get_loss(model + background)
+        assert_almost_equal(observation.get_loss(model, background=background), loss)
+        # cached rendering of the same background
+        assert_almost_equal(observation.get_loss(model, background=background), loss)
+
+    def test_grid_psf(self):
+        shape0 = (3, 13, 13)
+        model_psf = scarlet.PSF(partial(scarlet.psf.gaussian, sigma=0.9), shape=shape0)
+        shape = (3, 43, 43)
+        model_frame = scarlet.Frame(shape, psfs=model_psf)
+        images = np.ones(shape)
+
+        # PSF varies between the corners of the frame
+        y = x = [6, 36]
+        sigmas = [[[2.1, 1.1, 3.5], [1.5, 1.5, 1.5]], [[2.0, 2.0, 2.0], [3.0, 1.2, 2.5]]]
+        grid = np.array([[self.get_psfs(shape[1:], s) for s in row] for row in sigmas])
+        psf = scarlet.GridPSF(grid, y, x)
+        assert_almost_equal(psf.at(0, 42), grid[0, 1])
+        assert_almost_equal(psf.at(21, 21), grid.mean(axis=(0, 1)))
+
+        observation = scarlet.Observation(images, psfs=psf).match(model_frame)
+        # point source at a grid node gets the PSF of that node
+        model = np.zeros(shape)
+        box = np.stack([model_psf.image[0] for c in range(shape[0])], axis=0)
+        bbox = scarlet.Box(shape0, origin=(0, 0, 30))
+        bbox.insert_into(model, box)
+        model_ = observation.render(model)
+        assert_almost_equal(model_[:, :13, 30:], grid[0, 1][:, 15:28, 15:28], decimal=3)
+
+        # difference kernels are shared by cutouts of the same PSF
+        cutout = psf.cutout((10, 10))
+        kernels = psf.get_diff_kernels(model_psf)
+        assert cutout.get_diff_kernels(model_psf) is kernels
+        assert_almost_equal(cutout.at(0, 0), psf.at(10, 10))
+
+        # footprints use the kernel at their center, close to the full frame
+        shape = (3, 80, 80)
+        model_frame = scarlet.Frame(shape, psfs=model_psf)
+        grid = np.array([[self.get_psfs((21, 21), s) for s in row] for row in sigmas])
+        psf = scarlet.GridPSF(grid, [10, 70], [10, 70])
+        observation = scarlet.Observation(np.ones(shape), psfs=psf).match(model_frame)
+        boxes = [
+            scarlet.Box(shape0, origin=(0, 4, 4)),
+            scarlet.Box(shape0, origin=(0, 35, 50)),
+        ]
+        assert observation._use_footprints(boxes)
+        footprints = [(box, bbox) for bbox in boxes]
+        model = np.zeros(shape)
+        for bbox in boxes:
+            bbox.insert_into(model, box)
+        model_ = observation.render(footprints)
+        assert_almost_equal(model_, observation.render(model), decimal=3)
+        assert_almost_equal(model_[:, :21, :21], grid[0, 0], decimal=3)
+
+    def test_gaussian_psf(self):
+        shape = (3, 43, 43)
+        model_psf = scarlet.GaussianPSF([0.9] * 3, (13, 13))
+        model_frame = scarlet.Frame(shape, psfs=model_psf)
+        psf = scarlet.GaussianPSF([2.1, 1.5, 3.5], shape)
+        assert_almost_equal(psf.image.sum(axis=(1, 2)), 1)
+
+        # closed-form kernel is compact
+        kernel = psf.get_diff_kernel(model_psf)
+        assert kernel.shape == (3, 35, 35)
+        assert_almost_equal(kernel.sum(axis=(1, 2)), 1)
+        # but only for narrower, single Gaussian model PSFs
+        assert psf.get_diff_kernel(scarlet.GaussianPSF([0.9, 1.6, 0.9], (13, 13))) is None
+        assert psf.get_diff_kernel(scarlet.PSF(model_psf.image)) is None
+
+        observation = scarlet.Observation(np.ones(shape), psfs=psf).match(model_frame)
+        assert observation._diff_kernels.shape == kernel.shape
+        model = np.zeros(shape)
+        scarlet.Box((3, 13, 13), origin=(0, 15, 15)).insert_into(model, model_psf.image)
+        assert_almost_equal(observation.render(model), psf.image, decimal=3)
+
+    def test_render_footprints(self):
+        import autograd.numpy as anp
+        from autograd import grad
+
+        shape = (2, 80, 80)
+        model_psf = scarlet.GaussianPSF([0.9] * 2, (11, 11))
+        model_frame = scarlet.Frame(shape, psfs=model_psf)
+        psf = scarlet.GaussianPSF([1.5, 2.0], (21, 21))
+        images = np.random.rand(*shape)
+        observation = scarlet.Observation(images, psfs=psf).match(model_frame)
+
+        # small boxes, one of them overlapping the edge of the frame
+        boxes = [
+            scarlet.Box((2, 7, 7), origin=(0, 10, 20)),
+            scarlet.Box((2, 5, 9), origin=(0, 12, 22)),
+            scarlet.Box((2, 6, 6), origin=(0, 76, 3)),
+        ]
+        assert observation._use_footprints(boxes)
+        assert not observation._use_footprints([model_frame])
+        cubes = [np.random.rand(*box.shape) for box in boxes]
+
+        def full_model(*cubes):
+            model = anp.zeros(shape)
+            for cube, box in zip(cubes, boxes):
+                pad_width = [
+                    (max(0, start), max(0, n - stop))
+                    for start, stop, n in zip(box.start, box.stop, shape)
+                ]
+                padded = anp.pad(cube, pad_width, mode="constant")
+                model = model + padded[:, : shape[1], : shape[2]]
+            return model
+
+        model = full_model(*cubes)
+        footprints = list(zip(cubes, boxes))
+        assert_almost_equal(observation.render(footprints), observation.render(model))
+
+        # gradients agree too
+        argnum = tuple(range(len(cubes)))
+
+        def loss(*cubes):
+            return observation.get_loss(list(zip(cubes, boxes)))
+
+        def loss_full(*cubes):
+            return observation.get_loss(full_model(*cubes))
+
+        for g, g_full in zip(grad(loss, argnum)(*cubes), grad(loss_full, argnum)(*cubes)):
+            assert_almost_equal(g, g_full)
+
+    def test_tiled_observation(self, tmp_path):
+        shape = (2, 60, 50)
+        filename = str(tmp_path / "images.npy")
+        images = np.random.rand(*shape).astype("float32")
+        np.save(filename, images)
+        images = np.load(filename, mmap_mode="r")
+        psf = scarlet.PSF(self.get_psfs((41, 41), [2.1, 1.1]))
+        observation = scarlet.TiledObservation(images, psfs=psf)
+
+        bboxes = [
+            scarlet.Box((20, 30), origin=(5, 10)),
+            scarlet.Box((2, 30, 30), origin=(0, 40, 30)),
+        ]
+        cutouts = list(observation.cutouts(bboxes))
+        assert len(cutouts) == 2
+        assert_array_equal(cutouts[0].images, images[:, 5:25, 10:40])
+        # limited to the frame
+        assert_array_equal(cutouts[1].images, images[:, 40:60, 30:50])
+        assert_array_equal(cutouts[1].weights, 1)
+
+        # PSF is trimmed to the cutout and stays centered
+        cutout_psf = cutouts[0].frame.psf.image
+        assert cutout_psf.shape == (2, 19, 29)
+        assert_array_equal(np.argmax(cutout_psf[1]), 9 * 29 + 14)
+        assert_almost_equal(cutout_psf.sum(axis=(1, 2)), 1)
+        assert observation.cutout(scarlet.Box((50, 50))).frame.psf is psf
+
+        # cutouts are located at their origin in the full frame
+        cutout = cutouts[0]
+        assert cutout.frame.origin == (0, 5, 10)
+        assert cutout.frame.get_sky_coord((0, 0)) == (5, 10)
+        assert cutout.frame.get_pixel((7, 13)) == (2, 3)
+        psf = cutout.frame.psf
+        for model_frame in [
+            scarlet.Frame(shape, psfs=psf),
+            scarlet.Frame(scarlet.Box((2, 30, 30), origin=(0, 0, 10)), psfs=psf),
+        ]:
+            # in the pixels of the model frame
+            cutout.match(model_frame)
+            y0, x0 = (5, 10 - model_frame.origin[2])
+            assert cutout.bbox.origin == (0, y0, x0)
+            model = np.zeros(model_frame.shape)
+            model[:, y0 : y0 + 20, x0 : x0 + 30] = cutout.images
+            assert_array_equal(cutout.render(model), cutout.images)
+            assert_array_equal(cutout._get_likelihood_data()[0], cutout.images)
+
+    def test_masked_loss(self):
+        from autograd import grad
+
+        shape = (3, 30, 30)
+        model_frame = scarlet.Frame(shape, psfs=scarlet.GaussianPSF([0.9] * 3, (11, 11)))
+        psf = scarlet.GaussianPSF([2.1, 1.5, 3.5], (21, 21))
+        images = np.random.rand(*shape)
+        weights = np.random.rand(*shape)
+        weights[:, :, :20] = 0
+        model = np.random.rand(*shape)
+
+        losses, grads = [], []
+        for min_masked in (0, 1.1):
+            observation = scarlet.Observation(images, psfs=psf, weights=weights)
+            observation.min_masked = min_masked
+            observation.match(model_frame)
+            losses.append(observation.get_loss(model))
+            grads.append(grad(observation.get_loss)(model))
+            valid = observation._get_likelihood_data()[2]
+            assert (valid is not None) == (min_masked == 0)
+        assert_almost_equal(losses[0], losses[1])
+        assert_almost_equal(grads[0], grads[1])
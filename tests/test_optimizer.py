@@ -0,0 +1,113 @@
+import numpy as np
+from numpy.testing import assert_almost_equal
+from functools import partial
+import proxmin
+
+import scarlet
+from scarlet.parameter import ParameterBuffer, relative_step
+from scarlet.optimizer import adaprox, fista
+
+
+class TestOptimizer:
+    def get_parameters(self):
+        rng = np.random.RandomState(0)
+        X = []
+        for k in range(3):
+            sed = rng.rand(4).astype("float32")
+            X.append(
+                scarlet.Parameter(
+                    sed,
+                    name="sed",
+                    step=partial(relative_step, factor=1e-2),
+                    constraint=scarlet.PositivityConstraint(),
+                )
+            )
+            constraint = scarlet.ConstraintChain(
+                scarlet.PositivityConstraint(), scarlet.L0Constraint(1e-2)
+            )
+            if k == 2:
+                # not elementwise
+                constraint = scarlet.ConstraintChain(
+                    scarlet.MonotonicityConstraint(), scarlet.PositivityConstraint()
+                )
+            morph = rng.rand(7, 7).astype("float32")
+            X.append(
+                scarlet.Parameter(morph, name="morph", step=1e-2, constraint=constraint)
+            )
+            X.append(scarlet.Parameter(rng.rand(2), name="center", step=1e-1))
+        targets = [rng.rand(*x.shape).astype(x.dtype) for x in X]
+
+        def grad(*X):
+            return tuple(x - t for x, t in zip(X, targets))
+
+        return X, grad
+
+    def test_adaprox(self):
+        for scheme in ["adam", "amsgrad", "padam"]:
+            X, grad = self.get_parameters()
+
+            def step(*X, it):
+                return tuple(
+                    x.step(x, it=it) if hasattr(x.step, "__call__") else x.step
+                    for x in X
+                )
+
+            proxmin.adaprox(
+                X,
+                grad,
+                step,
+                prox=tuple(x.constraint for x in X),
+                scheme=scheme,
+                max_iter=20,
+                e_rel=1e-3,
+                prox_max_iter=10,
+                check_convergence=False,
+                M=tuple(np.zeros(x.shape) for x in X),
+                V=tuple(np.zeros(x.shape) for x in X),
+                Vhat=tuple(np.zeros(x.shape) for x in X),
+            )
+
+            X_, grad = self.get_parameters()
+            buffer = ParameterBuffer(X_)
+            it = adaprox(
+                buffer, grad, scheme=scheme, max_iter=20, e_rel=1e-3, prox_max_iter=10
+            )
+            assert it == 20
+            for x, x_ in zip(X, buffer.parameters):
+                assert x_.dtype == x.dtype
+                assert_almost_equal(x_, x, decimal=5)
+
+    def test_callback(self):
+        X, grad = self.get_parameters()
+        buffer = ParameterBuffer(X)
+        versions = [p.version for p in buffer.parameters]
+
+        def callback(*X, it=None):
+            if it == 3:
+                raise StopIteration
+
+        it = adaprox(buffer, grad, max_iter=20, callback=callback)
+        assert it == 3
+        assert all(p.version != v for p, v in zip(buffer.parameters, versions))
+
+    def test_fista(self):
+        X, grad = self.get_parameters()
+        targets = [x - g for x, g in zip(X, grad(*X))]
+        buffer = ParameterBuffer(X)
+        calls = []
+
+        def lipschitz_grad(*X):
+            calls.append(1)
+            return grad(*X)
+
+        it = fista(buffer, grad, max_iter=25, lipschitz_grad=lipschitz_grad)
+        assert it == 25
+        # initial estimate with 5 power iterations in both stages, and one update
+        assert len(calls) == (1 + 2 * 5) + (1 + 2 * 1)
+        for k, (x, t) in enumerate(zip(buffer.parameters, targets)):
+            assert x.dtype == t.dtype
+            # the Hessian is the identity: the solution is the prox of the target
+            if k % 3 == 2:
+                assert_almost_equal(x, t, decimal=5)
+            elif k != 7:
+                assert_almost_equal(x, x.constraint(t.copy(), 1), decimal=5)
@@ -0,0 +1,104 @@
+import numpy as np
+from numpy.testing import assert_array_equal
+
+import scarlet
+from scarlet.parameter import ParameterBuffer
+
+
+class TestParameter:
+    def test_buffer(self):
+        sed = scarlet.Parameter(np.arange(3, dtype="float32"), name="sed", step=0.1)
+        morph = scarlet.Parameter(np.ones((2, 2), dtype="float32"), name="morph")
+        shift = scarlet.Parameter(np.zeros(2), name="shift")
+        shift.m = np.ones(2)
+
+        # shared parameters are stored once
+        buffer = ParameterBuffer([sed, morph, shift, shift])
+        assert buffer.data[np.dtype("float32")].size == 7
+        assert buffer.data[np.dtype("float64")].size == 2
+        sed_, morph_, shift_, shift__ = buffer.parameters
+        assert shift_ is shift__
+        assert buffer.get_view(sed) is sed_
+        assert sed_.name == "sed" and sed_.step == 0.1
+        assert_array_equal(sed_, sed)
+        assert_array_equal(shift_.m, 1)
+        assert_array_equal(morph_.v, 0)
+
+        # views into the buffers
+        morph_[0, 0] = 5
+        assert buffer.data[np.dtype("float32")][3] == 5
+        assert buffer.is_finite()
+        morph_[1, 1] = np.inf
+        assert not buffer.is_finite()
+
+        # checkpoints
+        state = buffer.get_state()
+        version = morph_.version
+        buffer.data[np.dtype("float32")][:] = 0
+        buffer.set_state(state)
+        assert morph_[0, 0] == 5
+        assert morph_.version != version
+
+    def test_version(self):
+        p = scarlet.Parameter(np.zeros((2, 3)), name="p", step=0.1)
+        view = p[1]
+        for update in [
+            lambda: np.add(p, 1, out=p),
+            lambda: np.multiply.at(p, (0, 1), 2),
+            lambda: p.fill(4),
+            lambda: view.__setitem__(0, 5),
+            lambda: p.__setitem__((1, 1), 6),
+        ]:
+            versions = p.version, view.version
+            update()
+            assert p.version != versions[0] and view.version != versions[1]
+        assert_array_equal(p, [[4, 4, 4], [5, 6, 4]])
+
+        # arithmetic gives plain arrays and leaves the version alone
+        version = p.version
+        result = np.sqrt(p) + p
+        assert type(result) is np.ndarray and p.version == version
+
+    def test_moments(self):
+        sed = scarlet.Parameter(np.arange(3, dtype="float32"), name="sed")
+        sed.v = np.array([0, 4, 1e6])
+        buffer = ParameterBuffer([sed])
+        sed_ = buffer.parameters[0]
+
+        # std is computed from v when accessed
+        std = sed_.std
+        assert std.mask[0] and not std.mask[1:].any()
+        assert_array_equal(std[1], 0.5)
+        buffer.v[np.dtype("float32")][1] = 16
+        assert_array_equal(sed_.std[1], 0.25)
+        sed_.std = np.ones(3)
+        assert_array_equal(sed_.std, 1)
+        sed_.std = None
+
+        # compact storage, with clipping to the range of the type
+        buffer.set_moment_dtype(np.float16)
+        assert sed_.v.dtype == np.float16
+        assert sed_.v.base is buffer.v[np.dtype("float32")]
+        assert_array_equal(sed_.v, [0, 16, np.finfo(np.float16).max])
+        assert np.isfinite(sed_.std[1:]).all()
+
+        # small moments don't underflow to zero
+        small = scarlet.Parameter(np.zeros(3), name="small")
+        small.m = np.array([-1e-9, 0, 1e-6])
+        small.v = np.array([1e-12, 0, 1e-7])
+        small_buffer = ParameterBuffer([small])
+        small_buffer.set_moment_dtype(np.float16)
+        small_ = small_buffer.parameters[0]
+        tiny = np.finfo(np.float16).tiny
+        assert_array_equal(small_.m, [-tiny, 0, tiny])
+        assert_array_equal(small_.v, [tiny, 0, tiny])
+        assert_array_equal(small_.std.mask, [False, True, False])
+        assert np.isfinite(small_.std[[0, 2]]).all()
+
+        # dropped moments are restored as zeros
+        buffer.set_moment_dtype(None)
+        assert sed_.m is None and sed_.v is None and sed_.std is None
+        assert "v" not in buffer.get_state()
+        buffer.set_moment_dtype(np.float64)
+        assert_array_equal(sed_.v, 0)
+        assert sed_.v.dtype == np.float64